@@ -6,6 +6,8 @@ from app.core import security
 from app.core.config import settings
 from app.schemas.token import TokenData
 from app.db.models.user import User, UserRole
+from app.services import pools
+from app.services.principals import GENERATION_CLAIM, Principal, principal_cache
 
 def get_token_header(authorization: str = Header(...)):
     if not authorization.startswith("Bearer "):
@@ -16,7 +18,16 @@ def get_token_header(authorization: str = Header(...)):
         )
     return authorization.split(" ")[1]
 
-def get_current_user(token: str = Depends(get_token_header), db: Session = Depends(get_db)):
+def user_from_token(db: Session, token: str) -> Principal:
+    """
+    The principal a bearer token belongs to; 401 if it is invalid, revoked or
+    the user is gone. Served from the principal cache when possible.
+    """
+    if settings.AUTH_CACHE:
+        principal = principal_cache.get(token)
+        if principal is not None:
+            return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -31,19 +42,49 @@ def get_current_user(token: str = Depends(get_token_header), db: Session = Depen
     except JWTError:
         raise credentials_exception
     user = db.query(User).filter(User.email == token_data.email).first()
-    if user is None:
+    # Tokens from before the user's last password change or deactivation are revoked
+    if user is None or payload.get(GENERATION_CLAIM, 0) != (user.token_generation or 0):
         raise credentials_exception
-    return user
+    principal = Principal.of(user)
+    if settings.AUTH_CACHE:
+        principal_cache.put(token, principal, token_expires=payload.get("exp"))
+    return principal
+
+def hash_password(fn, *args):
+    """
+    Run a password hash or verification (`security.get_password_hash`, ...)
+    on the bounded hashing pool; 503 when it is saturated.
+    """
+    try:
+        return pools.passwords.call(fn, *args)
+    except pools.PoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins in progress, try again shortly",
+            headers={"Retry-After": "5"},
+        )
+
+def get_current_user(token: str = Depends(get_token_header), db: Session = Depends(get_db)) -> Principal:
+    return user_from_token(db, token)
 
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+def get_current_active_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def get_current_researcher(current_user: User = Depends(get_current_active_user)):
+def get_current_researcher(current_user: Principal = Depends(get_current_active_user)):
     if current_user.role != UserRole.researcher:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="The user doesn't have enough privileges"
         )
     return current_user
+
+def get_current_admin(current_user: Principal = Depends(get_current_active_user)):
+    """Global settings (regulatory limits, exposure profiles) that affect every sample."""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="The user doesn't have enough privileges"
+        )
+    return current_user
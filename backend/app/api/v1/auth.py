@@ -8,28 +8,45 @@ from app.schemas.user import UserLogin, UserCreate
 from app.schemas.token import Token, TokenPayload
 from app.schemas.msg import Msg
 from app.db.models.user import User
+from app.services.principals import GENERATION_CLAIM, Principal, principal_cache, revoke_tokens, token_claims
 from pydantic import EmailStr
 
 router = APIRouter()
 
 @router.post("/login", response_model=Token)
 def login(login_data: UserLogin, db: Session = Depends(deps.get_db)):
-    user = db.query(User).filter(User.email == login_data.email).first()
-    if not user or not security.verify_password(login_data.password, user.hashed_password):
+    user = (
+        db.query(User.id, User.email, User.hashed_password, User.token_generation)
+        .filter(User.email == login_data.email)
+        .first()
+    )
+    # Hashing is slow on purpose: the connection goes back to the pool meanwhile
+    db.rollback()
+    verified, rehashed = False, None
+    if user:
+        verified, rehashed = deps.hash_password(security.verify_and_update_password, login_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if rehashed:
+        # Stored with fewer rounds or an older scheme than configured: upgraded now that the
+        # password is known, unless it was changed in the meantime
+        db.query(User).filter(User.id == user.id, User.hashed_password == user.hashed_password).update(
+            {User.hashed_password: rehashed}, synchronize_session=False
+        )
+        db.commit()
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/refresh-token", response_model=Token)
 def refresh_token(
-    current_user: User = Depends(deps.get_current_active_user),
+    current_user: Principal = Depends(deps.get_current_active_user),
 ):
     """
     Refresh access token.
@@ -39,7 +56,7 @@ def refresh_token(
     """
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        data={"sub": current_user.email}, expires_delta=access_token_expires
+        data=token_claims(current_user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -54,8 +71,9 @@ def recover_password(email: str, db: Session = Depends(deps.get_db)):
         # We don't want to reveal if the user exists or not
         return {"msg": "If this email exists, a password reset email has been sent."}
 
+    # Carries the token generation, so it stops working once used
     password_reset_token = security.create_access_token(
-        data={"sub": email}, expires_delta=timedelta(hours=1)
+        data=token_claims(user), expires_delta=timedelta(hours=1)
     )
     
     # In a real app, send email here.
@@ -73,18 +91,25 @@ def reset_password(
     """
     Reset password
     """
-    email = security.verify_password_reset_token(token)
-    if not email:
+    claims = security.decode_token(token)
+    if not claims or not claims.get("sub"):
         raise HTTPException(status_code=400, detail="Invalid token")
     
-    user = db.query(User).filter(User.email == email).first()
+    # Hashed before the user is loaded, so no connection is held while it runs
+    hashed_password = deps.hash_password(security.get_password_hash, new_password)
+
+    user = db.query(User).filter(User.email == claims["sub"]).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-        
-    hashed_password = security.get_password_hash(new_password)
+    if claims.get(GENERATION_CLAIM, 0) != (user.token_generation or 0):
+        raise HTTPException(status_code=400, detail="Invalid token")
+
     user.hashed_password = hashed_password
+    # Ends every session, and makes this reset token single-use
+    revoke_tokens(user)
     db.add(user)
     db.commit()
+    principal_cache.forget(user.id)
     
     return {"msg": "Password updated successfully"}
 
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from app.api import deps
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services import events
+from app.services.export import dumps
+
+router = APIRouter()
+
+# Reconnect delay suggested to EventSource clients
+RETRY_MS = 3000
+
+
+def encode(event: dict) -> bytes:
+    """One Server-Sent Events message; `id` lets a reconnecting client resume with Last-Event-ID."""
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event["id"], event["kind"].encode(), dumps(event["payload"]))
+
+
+async def event_stream(request: Request, subscription: events.Subscription, after: int):
+    """Replay what was missed since `after`, then forward the broker's events with keep-alives until the client leaves."""
+    try:
+        # An id-only message moves the client's Last-Event-ID without dispatching anything,
+        # so a reconnect resumes from here even before the first event
+        yield b"retry: %d\nid: %d\n\n" % (RETRY_MS, after)
+        seen = set()
+        mark = after
+
+        def replay():
+            db = SessionLocal()
+            try:
+                return events.since(db, after, subscription.user_id, subscription.kinds)
+            finally:
+                db.close()
+
+        for event in await run_in_threadpool(replay):
+            seen.add(event["id"])
+            mark = max(mark, event["id"])
+            yield encode(event)
+
+        # Streams end after EVENT_STREAM_MAX_SECONDS, since the server waits for open
+        # responses when shutting down; the client reconnects and resumes
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.EVENT_STREAM_MAX_SECONDS
+        # A client that falls EVENT_QUEUE_SIZE events behind is dropped too, and replays
+        while not subscription.overflowed:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                yield b"id: %d\n\n" % mark
+                break
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(settings.EVENT_HEARTBEAT_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": keep-alive\n\n"
+                continue
+            # Published between subscribing and the replay query: already sent
+            if event["id"] not in seen:
+                mark = max(mark, event["id"])
+                yield encode(event)
+    finally:
+        events.broker.unsubscribe(subscription)
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    token: str = None,
+    kinds: str = None,
+    last_event_id: int = None,
+    authorization: Optional[str] = Header(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events: `dataset.progress`, `risk.assessed` and `risk.completed`
+    for the caller's own uploads, and `samples.hazardous` for everyone.
+    EventSource can't set headers, so the bearer token may be passed as
+    `token`; without one only public events are sent. `kinds` is a
+    comma-separated subset. Reconnects resume after Last-Event-ID (header or
+    `last_event_id`) from the events retained for EVENT_RETENTION_SECONDS.
+    """
+    wanted = {kind.strip() for kind in kinds.split(",") if kind.strip()} if kinds else None
+    unknown = (wanted or set()) - set(events.KINDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event kinds: {', '.join(sorted(unknown))}. Allowed: {', '.join(events.KINDS)}")
+    if last_event_id is None and last_event_id_header:
+        try:
+            last_event_id = int(last_event_id_header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id")
+    if token is None and authorization:
+        token = deps.get_token_header(authorization)
+
+    def connect():
+        db = SessionLocal()
+        try:
+            user = deps.user_from_token(db, token) if token else None
+            if user is not None and not user.is_active:
+                raise HTTPException(status_code=400, detail="Inactive user")
+            after = last_event_id if last_event_id is not None else events.latest_id(db)
+            return (user.id if user else None), after
+        finally:
+            db.close()
+
+    user_id, after = await run_in_threadpool(connect)
+    subscription = events.broker.subscribe(user_id, wanted)
+    return StreamingResponse(
+        event_stream(request, subscription, after),
+        media_type="text/event-stream",
+        # Proxies must pass each event through as it is written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
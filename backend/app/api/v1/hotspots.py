@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.database import get_db
+from app.services import cache, hotspots
+
+router = APIRouter()
+
+@router.get("/")
+def get_hotspot_regions(request: Request, standards_version: int = None, db: Session = Depends(get_db)):
+    """
+    Summary of the Gi* hotspot run of every state: samples, HPI mean and
+    spread, hot and cold spots (95%) and clusters. Each state reports its
+    newest run at or below `standards_version` (default: current).
+    """
+    return cache.cached_json(request, db, [cache.HOTSPOTS], lambda: {"regions": hotspots.regions(db, standards_version)})
+
+@router.get("/{state}")
+def get_hotspots(
+    request: Request,
+    state: str,
+    standards_version: int = None,
+    min_confidence: int = 95,
+    kind: str = "all",
+    limit: int = 1000,
+    db: Session = Depends(get_db)
+):
+    """
+    One state's hotspot run: the summary, clusters of neighbouring hot spots
+    (centroid, bbox, mean HPI, peak z-score) and the samples whose Gi* z-score
+    is significant at `min_confidence` (90, 95 or 99), strongest first.
+    `kind` is hot, cold or all.
+    """
+    if min_confidence not in hotspots.CONFIDENCE_Z:
+        raise HTTPException(status_code=400, detail="min_confidence must be 90, 95 or 99")
+    if kind not in hotspots.KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(hotspots.KINDS)}")
+    if not 1 <= limit <= settings.SAMPLES_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {settings.SAMPLES_PAGE_MAX}")
+
+    def analysis():
+        found = hotspots.detail(db, state, standards_version, min_confidence, kind, limit)
+        if found is None:
+            raise HTTPException(status_code=404, detail="No hotspot analysis for this state yet")
+        return found
+    return cache.cached_json(request, db, [cache.HOTSPOTS], analysis)
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from app.api import deps
+from app.services import pools
+
+router = APIRouter()
+
+@router.get("/")
+def get_metrics(current_user = Depends(deps.get_current_admin)):
+    """
+    Load of this API process's worker pools: threads, calls running and
+    waiting, calls refused with 503, and wait / run time percentiles
+    (`password-hash` run_ms is the hash latency). Admins only.
+    """
+    return {"pools": {pool.name: pool.stats() for pool in (pools.uploads, pools.passwords)}}
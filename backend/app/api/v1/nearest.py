@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException
+
+from app.core.config import settings
+from app.services import nearest
+
+router = APIRouter()
+
+@router.get("/")
+def get_nearest(lat: float, lng: float, k: int = 5, radius_km: float = 25.0):
+    """
+    "Risk near me": the k assessed samples nearest to lat,lng within radius_km
+    (great-circle distance), nearest first, with their risk. Answered from the
+    in-memory index, which trails new assessments by up to NEAREST_REFRESH_SECONDS.
+    A plain `def`, so a lookup (or the index build, if it runs before the
+    refresher's first pass) happens on a worker thread, not the event loop.
+    """
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="lat must be within [-90, 90] and lng within [-180, 180]")
+    if not 1 <= k <= settings.NEAREST_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {settings.NEAREST_MAX_K}")
+    if not 0 < radius_km <= settings.NEAREST_MAX_RADIUS_KM:
+        raise HTTPException(status_code=400, detail=f"radius_km must be positive and at most {settings.NEAREST_MAX_RADIUS_KM:g}")
+    results = nearest.index.nearest(lat, lng, k, radius_km)
+    return {"lat": lat, "lng": lng, "radius_km": radius_km, "count": len(results), "results": results}
@@ -1,47 +1,52 @@
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.db.database import get_db
+from sqlalchemy.exc import IntegrityError
+from app.db.database import get_db, SessionLocal
 from app.api import deps
 from app.schemas.water_quality import CreateSample
 from app.db.models.sample import Sample, Measurement
 from app.db.models.dataset import Dataset
 from app.db.models.risk import RiskAssessment
+from app.db.models.job import Job
+from app.db.models.exposure import ExposureProfile, ExposureRisk
 from fastapi import UploadFile, File
+from fastapi.responses import StreamingResponse
 import pandas as pd
-import io
-import re
-from app.services.tasks import calculate_risk_indices_task
+import itertools
+import os
+from app.services.ingestion import (
+    ColumnMap, ingest_frame, is_format_error, iter_upload_chunks, natural_key, spool_upload, supported_extensions, upload_format
+)
+from app.services import cache, columnar, dashboard, events, export, geo, hotspots, jobs, pools, rasters, rollups, sample_query, tiles
+from app.core.config import settings
+from datetime import datetime
 
 router = APIRouter()
 
 @router.post("/samples", status_code=202)
-async def create_sample(
+def create_sample(
     payload: CreateSample, 
-    background_tasks: BackgroundTasks, 
     db: Session = Depends(get_db),
     current_user = Depends(deps.get_current_researcher)
 ):
     try:
-        # Check for duplicates
-        existing = db.query(Sample).filter(
-            Sample.lat == payload.latitude,
-            Sample.lng == payload.longitude,
-            Sample.timestamp == payload.timestamp
-        ).first()
-        
-        if existing:
-             raise HTTPException(status_code=400, detail="A sample at this location and time already exists.")
-
         new_sample = Sample(
             lat=payload.latitude,
             lng=payload.longitude,
             timestamp=payload.timestamp,
             source_type=payload.source_type,
-            standard_preference=payload.standard_preference
+            standard_preference=payload.standard_preference,
+            natural_key=natural_key(payload.latitude, payload.longitude, payload.timestamp, None),
+            geohash=geo.encode(payload.latitude, payload.longitude)
         )
         db.add(new_sample)
-        db.flush()
+        try:
+            db.flush()
+        except IntegrityError:
+            # Unique natural_key index: a sample at this location and time already exists
+            db.rollback()
+            raise HTTPException(status_code=400, detail="A sample at this location and time already exists.")
 
         db_measurements = [
             Measurement(
@@ -53,14 +58,14 @@ async def create_sample(
         ]
 
         db.add_all(db_measurements)
+        cache.bump(db, cache.SAMPLES)
+        job = jobs.enqueue(db, "calculate_risk_indices", {"sample_id": new_sample.id}, owner_id=current_user.id)
         db.commit()
-        db.refresh(new_sample)
-
-        background_tasks.add_task(calculate_risk_indices_task, new_sample.id)
 
         return {
             "status": "Accepted", 
             "sample_id": new_sample.id, 
+            "job_id": job.id,
             "message": "Calculation in progress"
         }
 
@@ -72,121 +77,100 @@ async def create_sample(
 
 @router.post("/upload-csv", status_code=202)
 async def upload_csv(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
     current_user = Depends(deps.get_current_researcher)
 ):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files are allowed")
+    """
+    Import a CSV, Parquet, Arrow IPC / Feather or XLSX file. Every format is
+    read in bounded chunks and goes through the same column detection, unit
+    conversion and bulk writes; columnar files keep their stored types.
+    Parsing and the database writes run on the upload pool, so the event loop
+    keeps serving other requests meanwhile; when the pool is full the upload
+    is refused with 503.
+    """
+    format = upload_format(file.filename)
+    if format is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type. Allowed: {', '.join(supported_extensions())}")
+    busy = HTTPException(status_code=503, detail="Too many uploads in progress, try again shortly", headers={"Retry-After": "30"})
+    if pools.uploads.busy:
+        raise busy
 
-    contents = await file.read()
+    path = await spool_upload(file, suffix=os.path.splitext(file.filename)[1].lower())
     try:
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid CSV format: {str(e)}")
-
-    dataset = Dataset(uploader_id=current_user.id, filename=file.filename, upload_status="processing")
-    db.add(dataset)
-    db.flush()
+        return await pools.uploads.run(import_upload, path, format, file.filename, current_user.id)
+    except pools.PoolBusy:
+        raise busy
+    finally:
+        os.remove(path)
 
+def import_upload(path: str, format: str, filename: str, uploader_id: int) -> dict:
+    """Parse a spooled upload and import it as a new dataset. Blocking; runs on the upload pool."""
+    label = format.upper()
+    chunks = None
     try:
-        sample_ids = []
-        
-        # Identify coordinate and metadata columns
-        lat_col = next((c for c in df.columns if 'lat' in c.lower()), None)
-        lng_col = next((c for c in df.columns if 'long' in c.lower() or 'lng' in c.lower()), None)
-        time_col = next((c for c in df.columns if 'year' in c.lower() or 'date' in c.lower() or 'time' in c.lower()), None)
-        loc_col = next((c for c in df.columns if 'location' in c.lower() or 'site' in c.lower()), None)
-        state_col = next((c for c in df.columns if 'state' in c.lower()), None)
-        dist_col = next((c for c in df.columns if 'district' in c.lower()), None)
-        
-        # Identify metal columns (e.g. As (ppb), Fe (ppm))
-        metal_cols = [c for c in df.columns if '(ppb)' in c.lower() or '(ppm)' in c.lower()]
-
-        for index, row in df.iterrows():
-            try:
-                lat_val = float(row.get(lat_col, 0.0)) if lat_col else 0.0
-                lng_val = float(row.get(lng_col, 0.0)) if lng_col else 0.0
-                loc_val = str(row.get(loc_col, 'Unknown')) if loc_col else 'Unknown'
-                state_val = str(row.get(state_col, 'Unknown')) if state_col else 'Unknown'
-                dist_val = str(row.get(dist_col, 'Unknown')) if dist_col else 'Unknown'
-                
-                # Deduce timestamp (if only Year is provided, use Jan 1st)
-                raw_time = row.get(time_col)
-                if time_col and 'year' in time_col.lower() and str(raw_time).isdigit():
-                    timestamp = pd.Timestamp(year=int(raw_time), month=1, day=1)
-                elif time_col:
-                    timestamp = pd.to_datetime(raw_time, errors='coerce') or pd.Timestamp.now()
-                else:
-                    timestamp = pd.Timestamp.now()
-
-                # Duplicate Check
-                existing = db.query(Sample).filter(
-                    Sample.lat == lat_val,
-                    Sample.lng == lng_val,
-                    Sample.timestamp == timestamp,
-                    Sample.location_name == loc_val
-                ).first()
-                if existing:
-                    print(f"Skipping duplicate at row {index}: {loc_val}")
-                    continue
-
-                sample = Sample(
-                    dataset_id=dataset.id,
-                    lat=lat_val,
-                    lng=lng_val,
-                    location_name=loc_val,
-                    state=state_val,
-                    district=dist_val,
-                    timestamp=timestamp,
-                    source_type="Groundwater" # Default
-                )
-                db.add(sample)
-                db.flush()
-                
-                # Process each metal column
-                for col in metal_cols:
-                    val = row.get(col)
-                    if pd.isna(val) or val == '-':
-                        continue
-                    
-                    try:
-                        conc = float(val)
-                        if '(ppb)' in col.lower():
-                            conc = conc / 1000.0 # ppb to mg/L
-                        
-                        metal_name = re.split(r'\(', col)[0].strip()
-                        
-                        measurement = Measurement(
-                            sample_id=sample.id,
-                            metal=metal_name,
-                            concentration=conc
-                        )
-                        db.add(measurement)
-                    except ValueError:
-                        continue
-
-                sample_ids.append(sample.id)
-            except Exception as row_err:
-                print(f"Skipping row {index} due to error: {row_err}")
-                continue
-            
-        if not sample_ids:
-            db.delete(dataset)
-            db.commit()
-            return {"status": "Complete", "message": "No new data found or all entries were duplicates."}
+        chunks = iter_upload_chunks(path, format)
+        first = next(chunks)
+    except Exception as e:
+        if chunks is not None:
+            chunks.close()
+        if isinstance(e, StopIteration):
+            raise HTTPException(status_code=400, detail=f"Invalid {label} format: no rows found")
+        raise HTTPException(status_code=400, detail=f"Invalid {label} format: {str(e)}")
 
-        dataset.upload_status = "completed"
+    db = SessionLocal()
+    try:
+        # Committed up front so progress is visible while the chunks stream in
+        dataset = Dataset(uploader_id=uploader_id, filename=filename, upload_status="processing", rows_processed=0)
+        db.add(dataset)
         db.commit()
-        
-        for sid in sample_ids:
-            background_tasks.add_task(calculate_risk_indices_task, sid)
 
-        return {"status": "Success", "dataset_id": dataset.id, "message": f"CSV processed. {len(sample_ids)} new samples imported."}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Processing Error: {str(e)}")
+        imported = duplicates = invalid = 0
+        try:
+            columns = ColumnMap.detect(first.columns)
+            for chunk in itertools.chain([first], chunks):
+                result = ingest_frame(db, chunk, columns, dataset_id=dataset.id)
+                imported += len(result.sample_ids)
+                duplicates += result.duplicates
+                invalid += result.invalid
+                dataset.rows_processed += result.rows_read
+                events.dataset_progress(db, dataset)
+                db.commit()
+
+            skipped = {"skipped_duplicates": duplicates, "skipped_invalid": invalid}
+            if not imported:
+                db.delete(dataset)
+                db.commit()
+                return {"status": "Complete", "message": "No new data found or all entries were duplicates.", **skipped}
+
+            dataset.upload_status = "completed"
+            job = jobs.enqueue(db, "calculate_risk_batch", {"dataset_id": dataset.id}, owner_id=uploader_id)
+            events.dataset_progress(db, dataset, samples=imported, job_id=job.id, **skipped)
+            db.commit()
+
+            return {
+                "status": "Success",
+                "dataset_id": dataset.id,
+                "job_id": job.id,
+                "message": f"{label} processed. {imported} new samples imported, {duplicates} duplicates skipped.",
+                **skipped
+            }
+        except Exception as e:
+            db.rollback()
+            # Chunks committed before the failure stay attached to the dataset, and are
+            # assessed like any others: a re-upload skips them as duplicates
+            dataset.upload_status = "failed"
+            extra = {}
+            if imported:
+                job = jobs.enqueue(db, "calculate_risk_batch", {"dataset_id": dataset.id}, owner_id=uploader_id)
+                extra = {"samples": imported, "job_id": job.id}
+            events.dataset_progress(db, dataset, **extra)
+            db.commit()
+            if isinstance(e, (pd.errors.ParserError, UnicodeDecodeError)) or is_format_error(e):
+                raise HTTPException(status_code=400, detail=f"Invalid {label} format: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Processing Error: {str(e)}")
+    finally:
+        chunks.close()
+        db.close()
 
 @router.get("/uploads")
 def get_my_uploads(db: Session = Depends(get_db), current_user = Depends(deps.get_current_researcher)):
@@ -197,75 +181,178 @@ def delete_upload(dataset_id: int, db: Session = Depends(get_db), current_user =
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id, Dataset.uploader_id == current_user.id).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found or unauthorized")
-    
+
+    points = db.query(Sample.lat, Sample.lng, Sample.state).filter(Sample.dataset_id == dataset.id).all()
+    tiles.invalidate_points(db, [p.lat for p in points], [p.lng for p in points])
+    rasters.mark_dirty(db, [p.lat for p in points], [p.lng for p in points])
+    hotspots.mark_stale(db, {p.state for p in points})
+    dashboard.remove_dataset(db, dataset)
+    regions = rollups.drop_regions(db, Sample.dataset_id == dataset.id)
+    if regions:
+        jobs.enqueue(db, "build_rollups", {"regions": [list(r) for r in regions]}, owner_id=current_user.id)
+    cache.bump(db, cache.SAMPLES, cache.REWRITES, cache.researcher_scope(current_user.id))
     db.delete(dataset)
     db.commit()
     return {"message": "Dataset and associated samples deleted successfully"}
 
+@router.get("/jobs")
+def get_my_jobs(
+    status: str = None,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user = Depends(deps.get_current_researcher)
+):
+    return jobs.list_jobs(db, owner_id=current_user.id, status=status, limit=min(limit, 1000))
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db), current_user = Depends(deps.get_current_researcher)):
+    job = db.query(Job).filter(Job.id == job_id, Job.owner_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or unauthorized")
+    return job
+
+def sample_filters(
+    uploader_id: int = None,
+    dataset_id: int = None,
+    state: str = None,
+    district: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    risk_category: str = None,
+    bbox: str = None,
+    near: str = None,
+    radius_km: float = None
+) -> sample_query.SampleFilters:
+    """bbox=min_lng,min_lat,max_lng,max_lat; near=lat,lng with radius_km."""
+    try:
+        box = geo.BBox.parse(bbox) if bbox else None
+        circle = geo.Circle.parse(near, radius_km) if near else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return sample_query.SampleFilters(
+        uploader_id=uploader_id, dataset_id=dataset_id, state=state, district=district, start=start, end=end, risk_category=risk_category,
+        bbox=box, near=circle
+    )
+
+def selected_fields(fields: str = None):
+    try:
+        return sample_query.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/samples")
-def get_samples(db: Session = Depends(get_db), uploader_id: int = None):
-    query = db.query(Sample)
-    if uploader_id:
-        query = query.join(Dataset).filter(Dataset.uploader_id == uploader_id)
-    
-    samples = query.all()
-    result = []
-    for s in samples:
-        measurements = [{"metal": m.metal, "concentration": m.concentration} for m in s.measurements]
-        risk = s.assessment
-        result.append({
-            "id": s.id,
-            "lat": s.lat,
-            "lng": s.lng,
-            "location_name": s.location_name,
-            "state": s.state,
-            "district": s.district,
-            "timestamp": s.timestamp,
-            "source_type": s.source_type,
-            "measurements": measurements,
-            "risk": {
-                "hpi": risk.hpi if risk else None,
-                "mi": risk.mi if risk else None,
-                "risk_category": risk.risk_category if risk else "Safe"
-            }
-        })
-    return result
+def get_samples(
+    request: Request,
+    db: Session = Depends(get_db),
+    cursor: int = None,
+    limit: int = 500,
+    selected = Depends(selected_fields),
+    filters: sample_query.SampleFilters = Depends(sample_filters)
+):
+    """
+    Keyset-paginated samples: pass the returned `next_cursor` as `cursor` to get
+    the next page (null on the last one). `fields` is a comma-separated subset of
+    id, lat, lng, location_name, state, district, timestamp, source_type,
+    measurements and risk. Responses are cached until samples change and carry an ETag.
+    """
+    def page():
+        items, next_cursor = sample_query.fetch_page(
+            db, selected, filters, cursor=cursor, limit=max(1, min(limit, settings.SAMPLES_PAGE_MAX))
+        )
+        return {"items": items, "next_cursor": next_cursor}
+    return cache.cached_json(request, db, [cache.SAMPLES], page)
 
-@router.get("/dashboard-stats")
-def get_dashboard_stats(db: Session = Depends(get_db), current_user = Depends(deps.get_current_researcher)):
-    # Get all samples uploaded by this researcher
-    samples = db.query(Sample).join(Dataset).filter(Dataset.uploader_id == current_user.id).all()
-    sample_ids = [s.id for s in samples]
-    
-    if not sample_ids:
-        return {
-            "total_samples": 0,
-            "avg_hpi": 0,
-            "risk_distribution": {"Safe": 0, "Low Risk": 0, "High Risk": 0},
-            "recent_uploads": [],
-            "metal_averages": []
-        }
+@router.get("/samples/export")
+def export_samples(
+    format: str = "ndjson",
+    gzip: bool = False,
+    selected = Depends(selected_fields),
+    filters: sample_query.SampleFilters = Depends(sample_filters)
+):
+    """
+    Stream every matching sample as NDJSON (one object per line) or a JSON array,
+    optionally gzip-compressed. Rows are read from a server-side cursor and
+    serialized batch by batch, so memory stays flat and the first bytes go out
+    immediately. Accepts the same `fields` and filters as /samples.
+    """
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(export.MEDIA_TYPES)}")
+
+    def body():
+        # Own session: the response outlives the request's dependencies
+        db = SessionLocal()
+        try:
+            batches = sample_query.iter_batches(db, selected, filters, settings.EXPORT_BATCH_ROWS)
+            chunks = export.encode_ndjson(batches) if format == "ndjson" else export.encode_json_array(batches)
+            yield from export.gzip_stream(chunks) if gzip else chunks
+        finally:
+            db.close()
+
+    filename = f"samples.{format}" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body(), media_type=export.MEDIA_TYPES[format], headers=headers)
+
+@router.get("/samples/table")
+def export_sample_table(
+    format: str = "parquet",
+    filters: sample_query.SampleFilters = Depends(sample_filters)
+):
+    """
+    Stream matching samples as one wide table: sample and risk columns plus one
+    column per metal (mg/L), as Parquet, Arrow IPC or CSV. Accepts the same
+    filters as /samples. Read from a server-side cursor, batch by batch.
+    """
+    if format not in columnar.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(columnar.MEDIA_TYPES)}")
+    if not columnar.available(format):
+        raise HTTPException(status_code=501, detail=f"{format} export requires pyarrow on the server; use format=csv")
+
+    metals = columnar.METAL_COLUMNS
 
-    # Fetch risk assessments
-    assessments = db.query(RiskAssessment).filter(RiskAssessment.sample_id.in_(sample_ids)).all()
-    
-    avg_hpi = sum(a.hpi for a in assessments if a.hpi) / len(assessments) if assessments else 0
-    avg_mi = sum(a.mi for a in assessments if a.mi) / len(assessments) if assessments else 0
-    
-    risk_dist = {"Safe": 0, "Moderately Polluted": 0, "Hazardous": 0}
-    for a in assessments:
-        cat = a.risk_category or "Safe"
-        risk_dist[cat] = risk_dist.get(cat, 0) + 1
-
-    # Metal averages
-    measurements = db.query(Measurement.metal, func.avg(Measurement.concentration)).filter(Measurement.sample_id.in_(sample_ids)).group_by(Measurement.metal).all()
-    metal_avgs = [{"name": m[0], "value": m[1]} for m in measurements]
-
-    return {
-        "total_samples": len(samples),
-        "avg_hpi": round(avg_hpi, 2),
-        "avg_mi": round(avg_mi, 2),
-        "risk_distribution": risk_dist,
-        "metal_averages": metal_avgs,
-        "latest_site": samples[0].location_name if samples else "N/A"
-    }
\ No newline at end of file
+    def body():
+        # Own session: the response outlives the request's dependencies
+        db = SessionLocal()
+        try:
+            frames = columnar.iter_frames(db, filters, metals, settings.EXPORT_BATCH_ROWS)
+            yield from columnar.encode(frames, format, metals, settings.PARQUET_ROW_GROUP_ROWS)
+        finally:
+            db.close()
+
+    headers = {"Content-Disposition": f'attachment; filename="samples.{format}"'}
+    return StreamingResponse(body(), media_type=columnar.MEDIA_TYPES[format], headers=headers)
+
+@router.get("/samples/{sample_id}/exposure-risks")
+def get_sample_exposure_risks(sample_id: int, db: Session = Depends(get_db)):
+    """Hazard index and cancer risk of a sample under every exposure profile."""
+    rows = (
+        db.query(ExposureProfile.name, ExposureRisk.hazard_index, ExposureRisk.cancer_risk)
+        .join(ExposureRisk, ExposureRisk.profile_id == ExposureProfile.id)
+        .filter(ExposureRisk.sample_id == sample_id)
+        .order_by(ExposureProfile.id)
+        .all()
+    )
+    if not rows:
+        raise HTTPException(status_code=404, detail="No health risk assessment found for this sample")
+    return [{"profile": name, "hazard_index": hi, "cancer_risk": cr} for name, hi, cr in rows]
+
+@router.get("/regions")
+def get_regions(db: Session = Depends(get_db)):
+    """Distinct (state, district) pairs that have samples, for region filters."""
+    rows = (
+        db.query(Sample.state, Sample.district)
+        .filter(Sample.state.isnot(None))
+        .distinct()
+        .order_by(Sample.state, Sample.district)
+        .all()
+    )
+    return [{"state": state, "district": district} for state, district in rows]
+
+@router.get("/dashboard-stats")
+def get_dashboard_stats(request: Request, db: Session = Depends(get_db), current_user = Depends(deps.get_current_researcher)):
+    """Sample count, average HPI/MI, risk distribution and metal averages of the researcher's datasets."""
+    return cache.cached_json(
+        request, db, [cache.researcher_scope(current_user.id)],
+        lambda: dashboard.get_stats(db, current_user.id), principal=current_user.id
+    )
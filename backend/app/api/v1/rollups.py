@@ -0,0 +1,51 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from app.db.database import get_db
+from app.services import cache, rollups
+
+router = APIRouter()
+
+def parse_period(value: Optional[str], last: bool) -> Optional[int]:
+    """'2023' or '2023-04' as a yyyymm month; a bare year is its first (or `last`) month."""
+    if not value:
+        return None
+    try:
+        parts = [int(p) for p in value.split("-")]
+    except ValueError:
+        parts = []
+    if len(parts) == 1:
+        return parts[0] * 100 + (12 if last else 1)
+    if len(parts) == 2 and 1 <= parts[1] <= 12:
+        return parts[0] * 100 + parts[1]
+    raise HTTPException(status_code=400, detail="Periods must be YYYY or YYYY-MM")
+
+@router.get("/")
+def get_rollups(
+    request: Request,
+    state: str = None,
+    district: str = None,
+    metal: str = None,
+    granularity: str = "year",
+    level: str = "district",
+    start: str = None,
+    end: str = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Time series of assessed samples per region and period: sample count and mean
+    HPI, plus per metal the reading count, mean, min, max and readings above the
+    MAC (maximum allowable concentration). `level` is district, state or
+    country; `start`/`end` are inclusive YYYY or YYYY-MM.
+    """
+    if granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(rollups.GRANULARITIES)}")
+    if level not in rollups.LEVELS:
+        raise HTTPException(status_code=400, detail=f"level must be one of: {', '.join(rollups.LEVELS)}")
+    first, last = parse_period(start, last=False), parse_period(end, last=True)
+
+    def series():
+        items = rollups.query(db, state, district, metal, granularity, level, first, last)
+        return {"granularity": granularity, "level": level, "series": items}
+    return cache.cached_json(request, db, [cache.SAMPLES], series)
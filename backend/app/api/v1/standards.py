@@ -0,0 +1,106 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import List
+from app.db.database import get_db
+from app.api import deps
+from app.core.constants import METAL_INDEX
+from app.db.models.standard import StandardsVersion
+from app.schemas.standards import (
+    CurrentStandards, StandardsVersionRead, MetalStandardRead, UpdateMetalStandard,
+    ExposureProfileRead, ExposureProfileCreate,
+)
+from app.services import jobs, standards
+
+router = APIRouter()
+
+@router.get("/", response_model=CurrentStandards)
+def get_current_standards(db: Session = Depends(get_db)):
+    version = standards.current_version(db)
+    limits = standards.get_records(db, version) if version is not None else []
+    return {"version": version, "limits": limits}
+
+@router.get("/versions", response_model=List[StandardsVersionRead])
+def get_standards_versions(db: Session = Depends(get_db)):
+    return db.query(StandardsVersion).order_by(StandardsVersion.id.desc()).all()
+
+@router.get("/versions/{version_id}", response_model=List[MetalStandardRead])
+def get_standards_version(version_id: int, db: Session = Depends(get_db)):
+    limits = standards.get_records(db, version_id)
+    if not limits:
+        raise HTTPException(status_code=404, detail="Standards version not found")
+    return limits
+
+@router.get("/exposure-profiles", response_model=List[ExposureProfileRead])
+def get_exposure_profiles(db: Session = Depends(get_db)):
+    return standards.load_profiles(db)
+
+@router.post("/exposure-profiles", status_code=202)
+def create_exposure_profile(
+    payload: ExposureProfileCreate,
+    db: Session = Depends(get_db),
+    current_user = Depends(deps.get_current_admin)
+):
+    """Register a custom exposure scenario; health risk for existing samples is backfilled in the background."""
+    params = payload.model_dump(exclude={"name"})
+    try:
+        profile = standards.register_exposure_profile(db, payload.name, params, user_id=current_user.id)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = jobs.enqueue(db, "backfill_exposure_profile", {"profile_id": profile.id}, owner_id=current_user.id)
+    db.commit()
+
+    return {
+        "status": "Accepted",
+        "profile_id": profile.id,
+        "job_id": job.id,
+        "message": f"Exposure profile '{profile.name}' registered; backfilling existing samples"
+    }
+
+@router.put("/{standard}/{metal}", status_code=202)
+def update_metal_standard(
+    standard: str,
+    metal: str,
+    payload: UpdateMetalStandard,
+    db: Session = Depends(get_db),
+    current_user = Depends(deps.get_current_admin)
+):
+    """
+    Publish a new standards version with one metal's limits changed, and queue a
+    recompute of only the samples that contain that metal and use that standard.
+    Send `expected_version` to get 409 instead if the standards changed since.
+    """
+    metal = standards.metal_key(metal)
+    if metal not in METAL_INDEX:
+        raise HTTPException(status_code=404, detail=f"Unknown metal: {metal}")
+
+    standard = standard.upper()
+    try:
+        version = standards.update_metal_standard(
+            db, standard, metal, payload.changes(), user_id=current_user.id, note=payload.note,
+            expected_version=payload.expected_version,
+        )
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(e))
+    except standards.StandardsConflict as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    except IntegrityError:
+        # Another update was published from the same version meanwhile
+        db.rollback()
+        raise HTTPException(status_code=409, detail="The standards changed while this update was applied; retry")
+
+    job = jobs.enqueue(
+        db, "recompute_standards", {"version": version.id, "metal": metal, "standard": standard}, owner_id=current_user.id
+    )
+    db.commit()
+
+    return {
+        "status": "Accepted",
+        "version": version.id,
+        "job_id": job.id,
+        "message": f"Standards v{version.id} published; recomputing {standard} samples that contain {metal}"
+    }
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from app.db.database import get_db
+from app.services import cache, rasters, sample_query, tiles
+
+router = APIRouter()
+
+@router.get("/heatmap/{layer}/{z}/{x}/{y}.png")
+def get_heatmap_tile(request: Request, layer: str, z: int, x: int, y: int, db: Session = Depends(get_db)):
+    """
+    Interpolated risk surface of one Web Mercator tile as a 256x256 PNG.
+    `layer` is `hpi` or a metal (symbol or name). Green to red follows the
+    value relative to HPI 100 or the metal's MAC; cells more than
+    IDW_RADIUS_KM from any sample are transparent.
+    """
+    if not tiles.valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    key = rasters.layer_key(layer)
+    if key is None:
+        raise HTTPException(status_code=404, detail="Unknown layer")
+    return cache.cached_body(request, db, [cache.RASTERS], lambda: rasters.render_tile(db, key, z, x, y), media_type="image/png")
+
+@router.get("/{z}/{x}/{y}")
+def get_tile(
+    z: int,
+    x: int,
+    y: int,
+    state: str = None,
+    district: str = None,
+    risk_category: str = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Clustered samples of one Web Mercator tile: `{"z", "x", "y", "clusters": [...]}`
+    where each cluster has lat, lng (centroid), count, mean_hpi, risk_category (the
+    worst in the cluster) and sample_id (set when count is 1).
+    """
+    if not tiles.valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    filters = sample_query.SampleFilters(state=state, district=district, risk_category=risk_category)
+    return Response(content=tiles.get_tile(db, z, x, y, filters), media_type="application/json")
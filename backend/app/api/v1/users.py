@@ -1,19 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List
 from app.api import deps
 from app.core import security
 from app.schemas.user import UserCreate, UserRead, UserBase, UserUpdatePassword
 from app.db.models.user import User
+from app.services.principals import Principal, principal_cache, revoke_tokens
 
 router = APIRouter()
 
 @router.post("/register", response_model=UserRead)
 def create_user(user: UserCreate, db: Session = Depends(deps.get_db)):
+    # Hashed before any query, so no connection is held while it runs
+    hashed_password = deps.hash_password(security.get_password_hash, user.password)
     db_user = db.query(User).filter(User.email == user.email).first()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = security.get_password_hash(user.password)
     # Default role is already citizen in model, but we respect what is passed?
     # Security: For now, we allow passing role. In real app, only admin might set role or default to citizen.
     # We will assume new users are citizens unless specified (if we want to allow researcher signup, we should be careful).
@@ -31,24 +34,31 @@ def create_user(user: UserCreate, db: Session = Depends(deps.get_db)):
     return new_user
 
 @router.get("/me", response_model=UserRead)
-def read_users_me(current_user: User = Depends(deps.get_current_active_user)):
+def read_users_me(current_user: Principal = Depends(deps.get_current_active_user)):
     return current_user
 
 @router.post("/change-password", response_model=UserRead)
 def change_password(
     password_data: UserUpdatePassword,
-    current_user: User = Depends(deps.get_current_active_user),
+    current_user: Principal = Depends(deps.get_current_active_user),
     db: Session = Depends(deps.get_db),
 ):
     """
-    Change password for the current user.
+    Change password for the current user. Every token issued before,
+    including the one used here, stops working; log in again.
     """
-    if not security.verify_password(password_data.current_password, current_user.hashed_password):
+    current_hash = db.scalar(select(User.hashed_password).where(User.id == current_user.id))
+    # Hashing is slow on purpose: the connection goes back to the pool meanwhile
+    db.rollback()
+    if not deps.hash_password(security.verify_password, password_data.current_password, current_hash):
         raise HTTPException(status_code=400, detail="Incorrect password")
     
-    hashed_password = security.get_password_hash(password_data.new_password)
-    current_user.hashed_password = hashed_password
-    db.add(current_user)
+    hashed_password = deps.hash_password(security.get_password_hash, password_data.new_password)
+    user = db.get(User, current_user.id)
+    user.hashed_password = hashed_password
+    revoke_tokens(user)
+    db.add(user)
     db.commit()
-    db.refresh(current_user)
-    return current_user
+    principal_cache.forget(user.id)
+    db.refresh(user)
+    return user
@@ -11,6 +11,81 @@ class Settings(BaseSettings):
     SECRET_KEY: Optional[str] = "your-secret-key"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Uploads are spooled to disk and parsed this many rows at a time
+    UPLOAD_CHUNK_ROWS: int = 50000
+    UPLOAD_READ_BYTES: int = 1024 * 1024
+    # Uploads parsed and imported at once per API process, off the event loop, and how many more may
+    # wait for a thread before further uploads get 503 (app/services/pools.py)
+    UPLOAD_WORKERS: int = 2
+    UPLOAD_QUEUE: int = 4
+
+    # Password hashing: PBKDF2 rounds for new hashes (weaker ones are re-hashed at the next successful login),
+    # hashes computed at once per API process, and how many more may wait before logins get 503
+    # (app/services/pools.py). Waiting requests hold one of Starlette's 40 threads for sync endpoints,
+    # so workers + queue stays well below that
+    PASSWORD_HASH_ROUNDS: int = 29000
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE: int = 16
+
+    # Background job queue (see app/worker.py)
+    WORKER_CONCURRENCY: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 10.0
+    JOB_POLL_SECONDS: float = 1.0
+    # A running job's lock is refreshed every JOB_HEARTBEAT_SECONDS by its worker process; one not refreshed
+    # for JOB_LOCK_TIMEOUT_SECONDS belongs to a dead worker and is re-queued (or failed on its last attempt)
+    JOB_HEARTBEAT_SECONDS: float = 30.0
+    JOB_LOCK_TIMEOUT_SECONDS: int = 600
+    # Samples loaded, assessed and written per transaction by the batch risk task
+    RISK_BATCH_SIZE: int = 5000
+    # Upper bound for the `limit` of GET /researcher/samples
+    SAMPLES_PAGE_MAX: int = 5000
+    # Rows per server-side cursor fetch (and per streamed chunk) in /researcher/samples/export
+    EXPORT_BATCH_ROWS: int = 2000
+    # Rows per Parquet row group in /researcher/samples/table (batches are buffered up to this)
+    PARQUET_ROW_GROUP_ROWS: int = 64000
+    # Map tiles (/api/v1/tiles): deepest zoom served, and deepest zoom kept in the map_tiles cache
+    TILE_MAX_ZOOM: int = 18
+    TILE_CACHE_MAX_ZOOM: int = 12
+    # In-process cache of authenticated principals by token hash (app/services/principals.py), per API process.
+    # A revoked token is still accepted by other processes for up to the TTL
+    AUTH_CACHE: bool = True
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # Serve /researcher/dashboard-stats from the incrementally maintained researcher_stats table
+    DASHBOARD_SUMMARY: bool = True
+    # In-process LRU of read responses (app/services/cache.py), per API process
+    RESPONSE_CACHE: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # In-memory nearest-sample index (/api/v1/nearest): grid cell size, refresh period, how long skipped
+    # assessment ids are re-checked, and request bounds
+    NEAREST_CELL_DEGREES: float = 0.25
+    NEAREST_REFRESH_SECONDS: float = 5.0
+    NEAREST_GAP_SECONDS: float = 60.0
+    NEAREST_MAX_K: int = 100
+    NEAREST_MAX_RADIUS_KM: float = 500.0
+    # IDW risk rasters (/api/v1/tiles/heatmap): grid cell, cells per block side, search radius,
+    # distance power, and where the float32 raster files live (shared by API processes and workers)
+    RASTER_CELL_DEGREES: float = 0.05
+    RASTER_BLOCK_CELLS: int = 32
+    IDW_RADIUS_KM: float = 25.0
+    IDW_POWER: float = 2.0
+    RASTER_DIR: str = "data/rasters"
+    # Gi* hotspot analysis (/api/v1/hotspots): neighbours are the samples within this distance
+    HOTSPOT_DISTANCE_KM: float = 10.0
+    # Push events (/api/v1/events/stream): table tail period, how long skipped ids are re-checked,
+    # retention, per-connection queue, replay cap on reconnect, keep-alive period, longest stream before the
+    # client is asked to reconnect (bounds graceful shutdown) and Hazardous samples per event
+    EVENT_POLL_SECONDS: float = 0.5
+    EVENT_GAP_SECONDS: float = 60.0
+    EVENT_RETENTION_SECONDS: int = 3600
+    EVENT_QUEUE_SIZE: int = 1000
+    EVENT_REPLAY_MAX: int = 1000
+    EVENT_HEARTBEAT_SECONDS: float = 15.0
+    EVENT_STREAM_MAX_SECONDS: float = 300.0
+    EVENT_SAMPLES_MAX: int = 100
     
     model_config = SettingsConfigDict(
         env_file=".env", 
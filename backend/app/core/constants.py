@@ -28,9 +28,53 @@ METAL_STANDARDS: Dict[str, MetalStandard] = {
     "zinc":      {"Si": 5.0,   "Ii": 0.0, "MAC": 15.0,  "Bn": 65.40},
 }
 
+# WHO Guidelines for Drinking-water Quality (4th ed.). WHO gives a single
+# guideline value, so Si = MAC; Fe and Zn have no health-based value and use
+# the acceptability thresholds. Bn is geochemical and shared with BIS.
+WHO_STANDARDS: Dict[str, MetalStandard] = {
+    "arsenic":   {"Si": 0.01,  "Ii": 0.0, "MAC": 0.01,  "Bn": 12.70},
+    "cadmium":   {"Si": 0.003, "Ii": 0.0, "MAC": 0.003, "Bn": 0.10},
+    "chromium":  {"Si": 0.05,  "Ii": 0.0, "MAC": 0.05,  "Bn": 67.30},
+    "copper":    {"Si": 2.0,   "Ii": 0.0, "MAC": 2.0,   "Bn": 22.50},
+    "iron":      {"Si": 0.3,   "Ii": 0.0, "MAC": 0.3,   "Bn": 15000.0},
+    "lead":      {"Si": 0.01,  "Ii": 0.0, "MAC": 0.01,  "Bn": 21.00},
+    "manganese": {"Si": 0.08,  "Ii": 0.0, "MAC": 0.08,  "Bn": 500.0},
+    "mercury":   {"Si": 0.006, "Ii": 0.0, "MAC": 0.006, "Bn": 0.02},
+    "nickel":    {"Si": 0.07,  "Ii": 0.0, "MAC": 0.07,  "Bn": 31.00},
+    "zinc":      {"Si": 3.0,   "Ii": 0.0, "MAC": 3.0,   "Bn": 65.40},
+}
+
+# Sample.standard_preference -> limits; METAL_STANDARDS above are the BIS 10500 values
+STANDARD_LIMITS: Dict[str, Dict[str, MetalStandard]] = {
+    "BIS": METAL_STANDARDS,
+    "WHO": WHO_STANDARDS,
+}
+DEFAULT_STANDARD = "BIS"
+
+# Column order of the (samples x metals) matrices used by the batch calculator
+METAL_ORDER = tuple(METAL_STANDARDS)
+METAL_INDEX: Dict[str, int] = {metal: i for i, metal in enumerate(METAL_ORDER)}
+
+# Measurement.metal stores the element symbol; the tables above are keyed by name
+METAL_SYMBOLS: Dict[str, str] = {
+    "As": "arsenic", "Pb": "lead", "Cd": "cadmium",
+    "Hg": "mercury", "Cr": "chromium", "Ni": "nickel",
+    "Zn": "zinc", "Cu": "copper", "Fe": "iron", "Mn": "manganese"
+}
+
 # Pre-calculate Weights (Wi = 1 / Si)
 METAL_WEIGHTS = {metal: 1.0 / std["Si"] for metal, std in METAL_STANDARDS.items()}
 
+# Metal Index water quality classes (Lyulko et al., 2001): (upper bound, class)
+MI_CLASSES = (
+    (0.3, "Very Pure"),
+    (1.0, "Pure"),
+    (2.0, "Slightly Affected"),
+    (4.0, "Moderately Affected"),
+    (6.0, "Strongly Affected"),
+    (float("inf"), "Seriously Affected"),
+)
+
 
 # ==========================================
 # 2. HEALTH RISK PARAMETERS (USEPA/IRIS)
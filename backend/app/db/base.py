@@ -8,3 +8,12 @@ from app.db.models.dataset import Dataset
 from app.db.models.metal import HeavyMetal
 from app.db.models.education import EducationMaterial
 from app.db.models.log import UserLog
+from app.db.models.job import Job
+from app.db.models.standard import StandardsVersion, MetalStandardRecord
+from app.db.models.exposure import ExposureProfile, ExposureRisk
+from app.db.models.tile import MapTile
+from app.db.models.summary import ResearcherStats, ResearcherMetalStats, RollupRegion, RegionStats, RegionMetalStats
+from app.db.models.generation import DataGeneration
+from app.db.models.raster import RasterRegion, RasterDirtyBlock
+from app.db.models.hotspot import HotspotRegion, HotspotSample
+from app.db.models.event import Event
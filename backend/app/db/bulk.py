@@ -0,0 +1,17 @@
+from sqlalchemy import Table
+from sqlalchemy.orm import Session
+
+
+def dialect_insert(db: Session, table: Table):
+    """
+    INSERT construct for the session's backend, so callers can use
+    `on_conflict_do_nothing` / `on_conflict_do_update` on both PostgreSQL and SQLite.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return insert(table)
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from app.db.base import Base
 from typing import Generator
@@ -17,11 +17,60 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+# create_all never alters a table that exists, so columns added to the original
+# tables are added here on databases created before them: (table, column, DDL)
+ADDED_COLUMNS = [
+    ("users", "token_generation", "INTEGER NOT NULL DEFAULT 0"),
+    ("samples", "natural_key", "VARCHAR(32)"),
+    ("samples", "geohash", "VARCHAR(12)"),
+    ("users", "is_admin", "BOOLEAN NOT NULL DEFAULT FALSE"),
+    ("risk_assessments", "standards_version", "INTEGER REFERENCES standards_versions (id)"),
+    ("datasets", "rows_processed", "INTEGER DEFAULT 0"),
+]
+# Indexes of those tables, created after the columns: (name, table, columns, unique)
+ADDED_INDEXES = [
+    ("ix_samples_natural_key", "samples", ["natural_key"], True),
+    ("ix_samples_geohash", "samples", ["geohash"], False),
+    ("ix_risk_assessments_standards_version", "risk_assessments", ["standards_version"], False),
+    ("ix_measurements_metal_sample_id", "measurements", ["metal", "sample_id"], False),
+    ("ix_risk_assessments_sample_id", "risk_assessments", ["sample_id"], True),
+    ("ix_measurements_sample_id", "measurements", ["sample_id"], False),
+    ("ix_samples_state_district_id", "samples", ["state", "district", "id"], False),
+    ("ix_samples_timestamp", "samples", ["timestamp"], False),
+    ("ix_samples_dataset_id_id", "samples", ["dataset_id", "id"], False),
+]
+# Run before creating an index the old data may violate
+INDEX_CLEANUPS = {
+    # One assessment per sample: keep the latest of any repeats
+    "ix_risk_assessments_sample_id": "DELETE FROM risk_assessments WHERE id NOT IN (SELECT MAX(id) FROM risk_assessments GROUP BY sample_id)",
+}
+
+
+def upgrade_schema(bind=engine):
+    """Add the ADDED_COLUMNS and ADDED_INDEXES an existing database lacks. Idempotent; run after create_all."""
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    # Several processes may start at once; PostgreSQL can skip a column another one just added
+    if_not_exists = "IF NOT EXISTS " if bind.dialect.name == "postgresql" else ""
+    with bind.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if table in tables and column not in {c["name"] for c in inspector.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {ddl}"))
+                print(f"✅ Added {table}.{column}")
+        for name, table, columns, unique in ADDED_INDEXES:
+            if name in INDEX_CLEANUPS and table in tables and name not in {i["name"] for i in inspector.get_indexes(table)}:
+                conn.execute(text(INDEX_CLEANUPS[name]))
+            # IF NOT EXISTS is understood by both PostgreSQL and SQLite
+            conn.execute(text(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+            ))
+
 
 def init_db():
     print("Connecting to database...")
     try:
         Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine)
         print("Success! Tables created.")
     except Exception as e:
         print(f"Error: {e}")
@@ -10,6 +10,7 @@ class Dataset(Base):
     uploader_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     filename = Column(String, nullable=False)
     upload_status = Column(String, default="completed")
+    rows_processed = Column(Integer, default=0) # Updated as each upload chunk commits
     created_at = Column(DateTime, default=datetime.utcnow)
 
     uploader = relationship("User", backref="datasets")
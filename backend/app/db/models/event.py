@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from datetime import datetime
+from app.db.base_class import Base
+
+class Event(Base):
+    """
+    A change pushed to clients over /api/v1/events/stream. Written in the same
+    transaction as the data it describes, so it is published only if that
+    commits; API processes tail the table by id. Pruned after EVENT_RETENTION_SECONDS.
+    """
+    __tablename__ = "events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # dataset.progress, risk.assessed, samples.hazardous
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True) # Recipient; NULL for everyone
+    payload = Column(JSON, nullable=False, default=dict)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # Ids only ever grow, even once pruning empties the table (SQLite would reuse them)
+    __table_args__ = {"sqlite_autoincrement": True}
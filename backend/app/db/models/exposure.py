@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from app.db.base_class import Base
+
+class ExposureProfile(Base):
+    """USEPA exposure scenario; "adult" and "child" are seeded from app.core.constants."""
+    __tablename__ = "exposure_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    bw = Column(Float, nullable=False) # Body Weight (kg)
+    ir = Column(Float, nullable=False) # Ingestion Rate (L/day)
+    ef = Column(Float, nullable=False) # Exposure Frequency (days/year)
+    ed = Column(Float, nullable=False) # Exposure Duration (years)
+    at = Column(Float, nullable=False) # Averaging Time (days)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def params(self) -> dict:
+        """In the shape of app.core.constants.EXPOSURE_DEFAULTS entries."""
+        return {"BW": self.bw, "IR": self.ir, "EF": self.ef, "ED": self.ed, "AT": self.at}
+
+class ExposureRisk(Base):
+    """Health risk of one sample under one exposure profile."""
+    __tablename__ = "exposure_risks"
+
+    sample_id = Column(Integer, ForeignKey("samples.id"), primary_key=True)
+    profile_id = Column(Integer, ForeignKey("exposure_profiles.id"), primary_key=True)
+    hazard_index = Column(Float)
+    cancer_risk = Column(Float)
+
+    sample = relationship("Sample", back_populates="exposure_risks")
+    profile = relationship("ExposureProfile")
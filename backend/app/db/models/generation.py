@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String
+from app.db.base_class import Base
+
+class DataGeneration(Base):
+    """
+    Counter per data scope (e.g. "samples", "researcher:7"), bumped in the same
+    transaction as every write to that scope. Cached responses are keyed on it.
+    """
+    __tablename__ = "data_generations"
+
+    scope = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
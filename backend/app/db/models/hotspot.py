@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, Float, String, Boolean, DateTime
+from app.db.base_class import Base
+
+class HotspotRegion(Base):
+    """
+    Getis-Ord Gi* analysis of HPI over one state's assessed samples, cached per
+    standards version (0 when assessed against the built-in constants). `stale`
+    is set when the state's samples change and cleared by update_hotspots.
+    """
+    __tablename__ = "hotspot_regions"
+
+    state = Column(String, primary_key=True)
+    standards_version = Column(Integer, primary_key=True)
+    samples = Column(Integer, nullable=False, default=0)
+    mean_hpi = Column(Float, nullable=True)
+    std_hpi = Column(Float, nullable=True)
+    distance_km = Column(Float, nullable=True)
+    hot_spots = Column(Integer, nullable=False, default=0) # Significant at 95%
+    cold_spots = Column(Integer, nullable=False, default=0)
+    clusters = Column(Integer, nullable=False, default=0)
+    stale = Column(Boolean, nullable=False, default=True)
+    generation = Column(Integer, nullable=False, default=0) # Bumped each time the state is marked stale
+    computed_at = Column(DateTime, nullable=True)
+
+class HotspotSample(Base):
+    """A sample whose Gi* z-score is significant at 90% or more in its state's run for `standards_version`."""
+    __tablename__ = "hotspot_samples"
+
+    state = Column(String, primary_key=True)
+    standards_version = Column(Integer, primary_key=True)
+    sample_id = Column(Integer, primary_key=True) # No FK: rows are replaced wholesale by the next run
+    z_score = Column(Float, nullable=False)
+    p_value = Column(Float, nullable=False)
+    neighbours = Column(Integer, nullable=False) # Within the distance band, excluding the sample itself
+    cluster = Column(Integer, nullable=True) # Connected hot spots (95%), numbered by size within the run
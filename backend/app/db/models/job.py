@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Index
+from datetime import datetime
+from app.db.base_class import Base
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # Key into app.services.tasks.TASKS
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default="queued") # queued, running, completed, failed
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow) # Retries are pushed back with a backoff
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Workers poll for the oldest runnable job
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, Float, String, DateTime
+from datetime import datetime
+from app.db.base_class import Base
+
+class RasterRegion(Base):
+    """
+    Extent of one state's interpolated risk raster, in blocks of the global
+    grid. The values live in a float32 file under RASTER_DIR named after the
+    state and `version`, which is bumped every time the file is rewritten.
+    """
+    __tablename__ = "raster_regions"
+
+    state = Column(String, primary_key=True)
+    cell_degrees = Column(Float, nullable=False)
+    block_cells = Column(Integer, nullable=False)
+    block_row = Column(Integer, nullable=False) # South-west block of the extent
+    block_col = Column(Integer, nullable=False)
+    block_rows = Column(Integer, nullable=False)
+    block_cols = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    built_at = Column(DateTime, default=datetime.utcnow)
+
+class RasterDirtyBlock(Base):
+    """A block of the global grid whose samples changed since it was last interpolated."""
+    __tablename__ = "raster_dirty_blocks"
+
+    block_row = Column(Integer, primary_key=True)
+    block_col = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0) # Bumped each time the block is dirtied again
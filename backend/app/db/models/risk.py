@@ -8,7 +8,7 @@ class RiskAssessment(Base):
     __tablename__ = "risk_assessments"
 
     id = Column(Integer, primary_key=True, index=True)
-    sample_id = Column(Integer, ForeignKey("samples.id"), nullable=False)
+    sample_id = Column(Integer, ForeignKey("samples.id"), nullable=False, unique=True, index=True) # One assessment per sample; batch writes upsert on it
     
     # Calculated Indices
     hpi = Column(Float)  # Heavy Metal Pollution Index [cite: 231]
@@ -24,4 +24,7 @@ class RiskAssessment(Base):
     risk_category = Column(String)  # e.g., "Extensively Polluted" [cite: 175]
     is_safe = Column(Boolean, default=True) # Binary flag for the "Traffic Light" map
 
+    # StandardsVersion.id the indices were computed against
+    standards_version = Column(Integer, ForeignKey("standards_versions.id"), nullable=True, index=True)
+
     sample = relationship("Sample", back_populates="assessment")
\ No newline at end of file
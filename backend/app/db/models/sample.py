@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from traitlets import Bool
 # Removed geoalchemy2 due to SQLite compatibility
@@ -27,15 +27,30 @@ class Sample(Base):
     standard_preference = Column(String, default="BIS") # [cite: 244]
     background_reference = Column(String, default="Average_Shale") # [cite: 89, 90]
 
+    # Hash of (lat, lng, timestamp, location_name); the unique index rejects duplicate uploads
+    natural_key = Column(String(32), unique=True, index=True, nullable=True)
+
+    # Geohash of (lat, lng) at app.services.geo.GEOHASH_PRECISION; bbox/near queries scan its index by prefix range
+    geohash = Column(String(12), index=True, nullable=True)
+
+    __table_args__ = (
+        # Keyset pages filtered by region walk these in id order
+        Index("ix_samples_state_district_id", "state", "district", "id"),
+        Index("ix_samples_timestamp", "timestamp"),
+        # A dataset's samples in id order: the risk job's chunks and clients catching up after risk.completed
+        Index("ix_samples_dataset_id_id", "dataset_id", "id"),
+    )
+
     dataset = relationship("Dataset", back_populates="samples")
     measurements = relationship("Measurement", back_populates="sample", cascade="all, delete")
     assessment = relationship("RiskAssessment", back_populates="sample", uselist=False, cascade="all, delete-orphan")
+    exposure_risks = relationship("ExposureRisk", back_populates="sample", cascade="all, delete-orphan")
 
 class Measurement(Base):
     __tablename__ = "measurements"
 
     id = Column(Integer, primary_key=True, index=True)
-    sample_id = Column(Integer, ForeignKey("samples.id"), nullable=False)
+    sample_id = Column(Integer, ForeignKey("samples.id"), nullable=False, index=True)
     
     # Metal type (As, Pb, etc.) and its standardized concentration (mg/L)
     metal = Column(String, nullable=False) # [cite: 80, 186]
@@ -44,4 +59,9 @@ class Measurement(Base):
     # TODO: Define the back-reference to Sample
     sample = relationship("Sample", back_populates="measurements")
 
+    __table_args__ = (
+        # Finding every sample that contains a metal (targeted recompute after a standards change)
+        Index("ix_measurements_metal_sample_id", "metal", "sample_id"),
+    )
+
 
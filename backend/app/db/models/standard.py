@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from app.db.base_class import Base
+
+class StandardsVersion(Base):
+    """One immutable snapshot of every standard's limits; the highest id is current."""
+    __tablename__ = "standards_versions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    note = Column(String, nullable=True) # e.g. "BIS 10500:2012 amendment 3"
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # The version this one copied; unique, so two updates built on the same base can't both be published
+    based_on = Column(Integer, ForeignKey("standards_versions.id"), nullable=True, unique=True)
+
+    limits = relationship("MetalStandardRecord", back_populates="version", cascade="all, delete-orphan")
+
+class MetalStandardRecord(Base):
+    __tablename__ = "metal_standards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    version_id = Column(Integer, ForeignKey("standards_versions.id"), nullable=False, index=True)
+    standard = Column(String, nullable=False, default="BIS") # Matches Sample.standard_preference
+    metal = Column(String, nullable=False) # Lower-case name, as in app.core.constants
+
+    si = Column(Float, nullable=False)  # Standard Permissible Limit (mg/L)
+    ii = Column(Float, nullable=False, default=0.0) # Ideal Value (mg/L)
+    mac = Column(Float, nullable=False) # Maximum Allowable Concentration (mg/L)
+    bn = Column(Float, nullable=False)  # Geochemical Background Value
+    rfd = Column(Float, nullable=False) # Oral Reference Dose (mg/kg/day)
+    csf = Column(Float, nullable=True)  # Cancer Slope Factor; NULL for non-carcinogens
+
+    version = relationship("StandardsVersion", back_populates="limits")
+
+    __table_args__ = (
+        UniqueConstraint("version_id", "standard", "metal", name="uq_metal_standards_version_standard_metal"),
+    )
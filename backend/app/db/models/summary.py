@@ -0,0 +1,69 @@
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Index
+from datetime import datetime
+from app.db.base_class import Base
+
+class ResearcherStats(Base):
+    """
+    Running totals behind /researcher/dashboard-stats, one row per uploader.
+    Covers assessed samples of the researcher's datasets; kept up to date by
+    app.services.dashboard as assessments are written and datasets deleted.
+    """
+    __tablename__ = "researcher_stats"
+
+    uploader_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    samples = Column(Integer, nullable=False, default=0)
+    assessed = Column(Integer, nullable=False, default=0) # Denominator of the HPI/MI averages
+    hpi_sum = Column(Float, nullable=False, default=0.0)
+    mi_sum = Column(Float, nullable=False, default=0.0)
+    safe = Column(Integer, nullable=False, default=0)
+    moderately_polluted = Column(Integer, nullable=False, default=0)
+    hazardous = Column(Integer, nullable=False, default=0)
+    first_sample_id = Column(Integer, nullable=True) # Source of `latest_site`
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ResearcherMetalStats(Base):
+    __tablename__ = "researcher_metal_stats"
+
+    uploader_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    metal = Column(String, primary_key=True) # As stored in Measurement.metal
+    readings = Column(Integer, nullable=False, default=0)
+    concentration_sum = Column(Float, nullable=False, default=0.0)
+
+class RollupRegion(Base):
+    """A (state, district) whose rollups are built; only these are maintained incrementally. built_at is NULL while a build is pending."""
+    __tablename__ = "rollup_regions"
+
+    state = Column(String, primary_key=True)
+    district = Column(String, primary_key=True)
+    built_at = Column(DateTime, nullable=True, default=datetime.utcnow)
+
+class RegionStats(Base):
+    """
+    Assessed samples per (state, district, month), maintained by
+    app.services.rollups. `month` is year * 100 + month, e.g. 202304.
+    """
+    __tablename__ = "region_stats"
+
+    state = Column(String, primary_key=True)
+    district = Column(String, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    samples = Column(Integer, nullable=False, default=0)
+    hpi_sum = Column(Float, nullable=False, default=0.0)
+
+class RegionMetalStats(Base):
+    __tablename__ = "region_metal_stats"
+
+    state = Column(String, primary_key=True)
+    district = Column(String, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    metal = Column(String, primary_key=True) # As stored in Measurement.metal
+    readings = Column(Integer, nullable=False, default=0)
+    concentration_sum = Column(Float, nullable=False, default=0.0)
+    concentration_min = Column(Float, nullable=True)
+    concentration_max = Column(Float, nullable=True)
+    exceedances = Column(Integer, nullable=False, default=0) # Readings above the MAC of the sample's standard
+
+    __table_args__ = (
+        # One metal's trend across regions
+        Index("ix_region_metal_stats_metal_month", "metal", "month"),
+    )
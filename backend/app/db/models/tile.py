@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, Text, DateTime
+from datetime import datetime
+from app.db.base_class import Base
+
+class MapTile(Base):
+    """
+    Cached cluster payload of one slippy-map tile. When samples inside the tile
+    change the payload is cleared and the generation bumped, so a payload
+    computed before the change is never stored.
+    """
+    __tablename__ = "map_tiles"
+
+    z = Column(Integer, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    payload = Column(Text, nullable=True) # JSON, served as-is; NULL once invalidated
+    generation = Column(Integer, nullable=False, default=0)
+    computed_at = Column(DateTime, default=datetime.utcnow)
@@ -15,3 +15,7 @@ class User(Base):
     full_name = Column(String, nullable=True)
     role = Column(Enum(UserRole), default=UserRole.citizen, nullable=False)
     is_active = Column(Boolean, default=True)
+    # May change global settings such as the regulatory limits; granted out of band, never at signup
+    is_admin = Column(Boolean, nullable=False, default=False)
+    # Carried by issued tokens; bumped on password change, reset and deactivation to reject older ones
+    token_generation = Column(Integer, nullable=False, default=0)
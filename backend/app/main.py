@@ -1,14 +1,44 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.db.database import init_db
-from app.api.v1 import researchers, auth, users, education
+from app.db.database import init_db, SessionLocal
+from app.api.v1 import researchers, auth, users, education, standards, tiles, rollups, nearest, hotspots, events, metrics
+from app.core.config import settings
+from app.services import nearest as nearest_index
+from app.services.events import broker
+from app.services.standards import seed_standards, seed_exposure_profiles
+from app.services.tasks import queue_geohash_backfill, queue_natural_key_backfill, queue_rollup_backfill, queue_raster_backfill, queue_hotspot_backfill
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 1. Initialize Database Tables on Startup
     init_db()
+    # Standards limits live in the DB from here on; version 1 comes from app.core.constants
+    db = SessionLocal()
+    try:
+        seed_standards(db)
+        seed_exposure_profiles(db)
+        # Samples stored before the geohash column existed are indexed in the background
+        queue_geohash_backfill(db)
+        # And given the natural key that deduplicates uploads
+        queue_natural_key_backfill(db)
+        # As are the time-series rollups of assessments made before they existed
+        queue_rollup_backfill(db)
+        # And the interpolated risk rasters
+        queue_raster_backfill(db)
+        # And the hotspot analysis
+        queue_hotspot_backfill(db)
+        db.commit()
+    except Exception as e:
+        print(f"Error seeding standards: {e}")
+    finally:
+        db.close()
+    # "Risk near me" lookups are served from memory; built and kept fresh off the event loop
+    nearest_index.index.start(settings.NEAREST_REFRESH_SECONDS)
     yield
+    nearest_index.index.stop()
+    # Started by the first event stream connection
+    broker.stop()
 
 app = FastAPI(title="MetalSense API", version="0.1.0", lifespan=lifespan)
 
@@ -26,6 +56,13 @@ app.include_router(researchers.router, prefix="/api/v1/researcher", tags=["Resea
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Auth"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["Users"])
 app.include_router(education.router, prefix="/api/v1/education", tags=["Education"])
+app.include_router(standards.router, prefix="/api/v1/standards", tags=["Standards"])
+app.include_router(tiles.router, prefix="/api/v1/tiles", tags=["Tiles"])
+app.include_router(rollups.router, prefix="/api/v1/rollups", tags=["Rollups"])
+app.include_router(nearest.router, prefix="/api/v1/nearest", tags=["Nearest"])
+app.include_router(hotspots.router, prefix="/api/v1/hotspots", tags=["Hotspots"])
+app.include_router(events.router, prefix="/api/v1/events", tags=["Events"])
+app.include_router(metrics.router, prefix="/api/v1/metrics", tags=["Metrics"])
 
 @app.get("/")
 def read_root():
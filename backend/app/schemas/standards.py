@@ -0,0 +1,75 @@
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Optional, List
+from datetime import datetime
+
+
+class MetalStandardRead(BaseModel):
+    standard: str
+    metal: str
+    si: float
+    ii: float
+    mac: float
+    bn: float
+    rfd: float
+    csf: Optional[float] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class StandardsVersionRead(BaseModel):
+    id: int
+    note: Optional[str] = None
+    created_by: Optional[int] = None
+    created_at: Optional[datetime] = None
+    based_on: Optional[int] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CurrentStandards(BaseModel):
+    version: Optional[int]
+    limits: List[MetalStandardRead]
+
+
+class UpdateMetalStandard(BaseModel):
+    """Only the fields that are sent are changed; send csf: null to mark a metal non-carcinogenic."""
+    si: Optional[float] = Field(None, gt=0.0)
+    ii: Optional[float] = Field(None, ge=0.0)
+    mac: Optional[float] = Field(None, gt=0.0)
+    bn: Optional[float] = Field(None, gt=0.0)
+    rfd: Optional[float] = Field(None, gt=0.0)
+    csf: Optional[float] = Field(None, ge=0.0)
+    note: Optional[str] = None
+    # The version the change was decided against; 409 if another has been published since
+    expected_version: Optional[int] = None
+
+    @model_validator(mode='after')
+    def check_changes(self) -> 'UpdateMetalStandard':
+        changes = self.changes()
+        if not changes:
+            raise ValueError("At least one limit must be provided.")
+        if any(value is None for field, value in changes.items() if field != "csf"):
+            raise ValueError("Only csf may be cleared.")
+        return self
+
+    def changes(self) -> dict:
+        return {field: getattr(self, field) for field in self.model_fields_set if field not in ("note", "expected_version")}
+
+
+class ExposureProfileRead(BaseModel):
+    id: int
+    name: str
+    bw: float
+    ir: float
+    ef: float
+    ed: float
+    at: float
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ExposureProfileCreate(BaseModel):
+    """Parameters use the EXPOSURE_DEFAULTS names: BW (kg), IR (L/day), EF (days/year), ED (years), AT (days)."""
+    name: str = Field(..., min_length=1, max_length=50)
+    BW: float = Field(..., gt=0.0)
+    IR: float = Field(..., gt=0.0)
+    EF: float = Field(..., gt=0.0, le=366)
+    ED: float = Field(..., gt=0.0)
+    AT: float = Field(..., gt=0.0)
@@ -0,0 +1,195 @@
+"""
+In-process response cache for read endpoints.
+
+Entries are keyed on the endpoint, its query parameters and the generation of
+every data scope the response depends on. Writes bump those generations in
+the DB, in the transaction that changes the data, so every API process and
+worker agrees on them. A bumped generation simply stops matching old keys,
+which then age out of the LRU.
+Responses carry an ETag; a matching If-None-Match gets 304. Concurrent misses
+on one key are coalesced: one request computes, the others wait for it.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Iterable, Optional, Sequence
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.bulk import dialect_insert
+from app.db.models.generation import DataGeneration
+from app.services.export import dumps
+
+# Data scopes
+SAMPLES = "samples"          # Any sample, measurement or assessment
+EDUCATION = "education"      # heavy_metals and education_materials
+REWRITES = "rewrites"        # Assessments replaced or samples deleted, not just added
+RASTERS = "rasters"          # Interpolated risk rasters (heatmap tiles)
+HOTSPOTS = "hotspots"        # Gi* hotspot runs
+
+
+def researcher_scope(uploader_id: int) -> str:
+    """The samples of one researcher's datasets (their dashboard)."""
+    return f"researcher:{uploader_id}"
+
+
+def bump(db: Session, *scopes: str):
+    """Invalidate everything cached for `scopes`. Does not commit."""
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+    table = DataGeneration.__table__
+    db.execute(
+        dialect_insert(db, table).on_conflict_do_nothing(index_elements=["scope"]),
+        [{"scope": scope, "generation": 0} for scope in scopes],
+    )
+    db.execute(table.update().where(table.c.scope.in_(scopes)).values(generation=table.c.generation + 1))
+
+
+def generations(db: Session, scopes: Iterable[str]) -> Dict[str, int]:
+    scopes = list(scopes)
+    found = dict(db.execute(select(DataGeneration.scope, DataGeneration.generation).where(DataGeneration.scope.in_(scopes))).all())
+    return {scope: found.get(scope, 0) for scope in scopes}
+
+
+@dataclass
+class Entry:
+    body: bytes
+    etag: str
+    media_type: str = "application/json"
+
+
+@dataclass
+class _Flight:
+    done: threading.Event = field(default_factory=threading.Event)
+    entry: Optional[Entry] = None
+    error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """Size-bounded LRU of encoded responses with single-flight misses. Thread-safe."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Entry]" = OrderedDict()
+        self._bytes = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Entry]) -> Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+
+        try:
+            flight.entry = compute()
+            self._store(key, flight.entry)
+            return flight.entry
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _store(self, key: Hashable, entry: Entry):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_MAX_BYTES)
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def cached_body(
+    request: Request,
+    db: Session,
+    scopes: Sequence[str],
+    compute: Callable[[], bytes],
+    media_type: str = "application/json",
+    principal: Optional[int] = None,
+) -> Response:
+    """
+    Serve the bytes from `compute()` through the response cache. The key covers
+    the path, the query string, `principal` (for per-user responses) and the
+    current generation of each scope, read before computing so that a write
+    committed meanwhile can only make the entry fresher than its key.
+    """
+    current = generations(db, scopes)
+    key = (
+        request.url.path,
+        tuple(sorted(request.query_params.multi_items())),
+        principal,
+        tuple(sorted(current.items())),
+    )
+
+    def encode() -> Entry:
+        body = compute()
+        return Entry(body=body, etag=etag_for(body), media_type=media_type)
+
+    entry = response_cache.get_or_compute(key, encode) if settings.RESPONSE_CACHE else encode()
+    # no-cache: clients may store the response but must revalidate it (cheaply, via the ETag)
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache" if principal is not None else "no-cache"}
+    if _matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+
+def cached_json(
+    request: Request,
+    db: Session,
+    scopes: Sequence[str],
+    compute: Callable[[], object],
+    principal: Optional[int] = None,
+) -> Response:
+    """Serve `compute()` as JSON through the response cache (see cached_body)."""
+    return cached_body(request, db, scopes, lambda: dumps(compute()), principal=principal)
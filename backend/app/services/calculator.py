@@ -1,6 +1,92 @@
 import math
-from typing import List, Dict
-from app.core.constants import METAL_STANDARDS, METAL_WEIGHTS, RISK_PARAMS, EXPOSURE_DEFAULTS
+from dataclasses import dataclass
+from typing import List, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from app.core.constants import (
+    METAL_STANDARDS, METAL_WEIGHTS, RISK_PARAMS, EXPOSURE_DEFAULTS, METAL_ORDER, STANDARD_LIMITS, DEFAULT_STANDARD,
+    MI_CLASSES, ExposureDefaults,
+)
+
+
+# StandardArrays field -> key in the app.core.constants tables
+_LIMIT_KEYS = {"si": "Si", "mac": "MAC", "bn": "Bn"}
+_RISK_KEYS = {"rfd": "RfD", "csf": "CSF"}
+
+
+@dataclass(frozen=True)
+class StandardArrays:
+    """
+    Registry of per-metal parameters for every regulatory standard, stored as
+    contiguous (standards x metals) arrays: row k holds `standards[k]` and
+    column j holds METAL_ORDER[j], so a (samples x metals) concentration matrix
+    can be evaluated column-wise. The first standard is the default.
+    CSF is 0.0 for non-carcinogens.
+    """
+    standards: Tuple[str, ...]
+    metals: Tuple[str, ...]
+    si: np.ndarray
+    mac: np.ndarray
+    bn: np.ndarray
+    rfd: np.ndarray
+    csf: np.ndarray
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping]) -> "StandardArrays":
+        """
+        Build from rows with standard, metal, si, mac, bn, rfd and csf keys.
+        Pairs missing from `records` fall back to the values in app.core.constants.
+        """
+        by_key = {(r["standard"], r["metal"]): r for r in records}
+        extra = sorted({standard for standard, _ in by_key} - set(STANDARD_LIMITS))
+        standards = (DEFAULT_STANDARD,) + tuple(s for s in STANDARD_LIMITS if s != DEFAULT_STANDARD) + tuple(extra)
+
+        def value(standard, metal, field):
+            if (standard, metal) in by_key:
+                return by_key[(standard, metal)][field] or 0.0
+            if field in _RISK_KEYS:
+                return RISK_PARAMS[metal][_RISK_KEYS[field]] or 0.0
+            return STANDARD_LIMITS.get(standard, METAL_STANDARDS)[metal][_LIMIT_KEYS[field]]
+
+        def table(field):
+            return np.array([[value(standard, metal, field) for metal in METAL_ORDER] for standard in standards])
+
+        return cls(
+            standards=standards,
+            metals=METAL_ORDER,
+            si=table("si"),
+            mac=table("mac"),
+            bn=table("bn"),
+            rfd=table("rfd"),
+            csf=table("csf"),
+        )
+
+    @classmethod
+    def from_constants(cls) -> "StandardArrays":
+        return cls.from_records([])
+
+    def take(self, rows: Sequence[int]) -> "StandardArrays":
+        """Registry restricted to the given standard rows."""
+        rows = list(rows)
+        return StandardArrays(
+            standards=tuple(self.standards[k] for k in rows),
+            metals=self.metals,
+            si=self.si[rows],
+            mac=self.mac[rows],
+            bn=self.bn[rows],
+            rfd=self.rfd[rows],
+            csf=self.csf[rows],
+        )
+
+    def standard_indices(self, preferences: Sequence[Optional[str]]) -> np.ndarray:
+        """
+        Row index per sample for a sequence of standard names; unknown or missing
+        names use the default standard. Only the distinct names are looked up.
+        """
+        names, inverse = np.unique(np.array([p or "" for p in preferences], dtype=str), return_inverse=True)
+        lookup = {standard: k for k, standard in enumerate(self.standards)}
+        codes = np.array([lookup.get(name.upper(), 0) for name in names], dtype=np.intp)
+        return codes[inverse] if len(names) else np.zeros(0, dtype=np.intp)
+
 
 class EnvironmentalCalculator:
     
@@ -38,6 +124,19 @@ class EnvironmentalCalculator:
             if metal in METAL_STANDARDS
         )
 
+    @staticmethod
+    def calculate_mi(measurements: Dict[str, float]) -> float:
+        """
+        Computes Metal Index (MI).
+        MI = Σ(Ci / MACi), the same sum as HEI; it is read on its own scale (classify_mi).
+        """
+        return EnvironmentalCalculator.calculate_hei(measurements)
+
+    @staticmethod
+    def classify_mi(mi: float) -> str:
+        """Water quality class of an MI value, from "Very Pure" (< 0.3) to "Seriously Affected" (>= 6)."""
+        return next(label for bound, label in MI_CLASSES if mi < bound)
+
     @staticmethod
     def calculate_i_geo(metal: str, concentration: float) -> float:
         """
@@ -76,4 +175,170 @@ class EnvironmentalCalculator:
                 if csf:
                     total_cr += (cdi * csf)
                     
-        return {"hazard_index": total_hq, "cancer_risk": total_cr}
\ No newline at end of file
+        return {"hazard_index": total_hq, "cancer_risk": total_cr}
+
+    @staticmethod
+    def calculate_batch(
+        concentrations: np.ndarray,
+        standards: Optional[StandardArrays] = None,
+        group: str = "child",
+        standard_index: Optional[np.ndarray] = None,
+        profiles: Optional[Mapping[str, ExposureDefaults]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Vectorized equivalent of the scalar methods above for many samples at once.
+        `concentrations` is a (samples x metals) matrix in mg/L with columns in
+        METAL_ORDER and NaN where a metal was not measured. `standard_index`
+        picks the registry row for each sample (see StandardArrays.standard_indices);
+        all samples use the default standard when omitted. A mixed batch shares
+        one pass over the matrix (see calculate_batch_all).
+        Returns arrays for hpi, hei, mi, i_geo_max, hazard_index and cancer_risk
+        (for `group`). With `profiles` (name -> exposure parameters), also
+        profile_hazard_index and profile_cancer_risk as (samples x profiles)
+        arrays with columns in the order of `profiles`.
+        """
+        std = standards or _DEFAULT_STANDARDS
+        conc = np.asarray(concentrations, dtype=float)
+        if standard_index is None:
+            results = {key: arr[0] for key, arr in _run_blocks(conc, std.take([0])).items()}
+            return _apply_exposure(results, group, profiles)
+
+        # Only the standards present in the batch are evaluated (bincount avoids sorting)
+        used = np.flatnonzero(np.bincount(standard_index, minlength=len(std.standards)))
+        if len(used) == 1:
+            results = {key: arr[0] for key, arr in _run_blocks(conc, std.take(used)).items()}
+            return _apply_exposure(results, group, profiles)
+        position = np.zeros(len(std.standards), dtype=np.intp)
+        position[used] = np.arange(len(used))
+        return _apply_exposure(_run_blocks(conc, std.take(used), select=position[standard_index]), group, profiles)
+
+    @staticmethod
+    def calculate_batch_all(
+        concentrations: np.ndarray,
+        standards: Optional[StandardArrays] = None,
+        group: str = "child",
+        profiles: Optional[Mapping[str, ExposureDefaults]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Every sample against every standard in the registry, for side-by-side
+        reporting. Returns (standards x samples) arrays with the same keys as
+        calculate_batch, and (standards x samples x profiles) for the profile
+        arrays. The NaN clean-up and any parameters shared between standards
+        (typically Bn, RfD and CSF) are evaluated once, so a second standard
+        costs far less than a second pass.
+        """
+        std = standards or _DEFAULT_STANDARDS
+        return _apply_exposure(_run_blocks(np.asarray(concentrations, dtype=float), std), group, profiles)
+
+    @staticmethod
+    def exposure_intake(params: ExposureDefaults) -> float:
+        """CDI per mg/L: CDI = C * IR * EF * ED / (BW * AT) [cite: 292]"""
+        return (params["IR"] * params["EF"] * params["ED"]) / (params["BW"] * params["AT"])
+
+
+BATCH_RESULTS = ("hpi", "hei", "mi", "i_geo_max", "hazard_index", "cancer_risk")
+# Per-block outputs; the health sums exclude exposure so every profile is a single multiply
+_BLOCK_RESULTS = ("hpi", "hei", "i_geo_max", "hazard_sum", "cancer_sum")
+BATCH_BLOCK_ROWS = 4096
+
+
+def _run_blocks(conc: np.ndarray, std: "StandardArrays", select: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Evaluate `conc` in row blocks small enough to stay in CPU cache across the
+    passes of _calculate_block. Returns (standards x samples) arrays, or with
+    `select` (registry row per sample) 1-D arrays holding each sample's own
+    standard, picked while the block is still in cache.
+    """
+    n = len(conc)
+    shape = (len(std.standards), n) if select is None else (n,)
+    out = {key: np.zeros(shape) for key in _BLOCK_RESULTS}
+    if select is not None:
+        block = {key: np.zeros((len(std.standards), BATCH_BLOCK_ROWS)) for key in _BLOCK_RESULTS}
+
+    for start in range(0, n, BATCH_BLOCK_ROWS):
+        rows = slice(start, start + BATCH_BLOCK_ROWS)
+        if select is None:
+            _calculate_block(conc[rows], std, {key: arr[:, rows] for key, arr in out.items()})
+            continue
+        size = len(conc[rows])
+        _calculate_block(conc[rows], std, {key: arr[:, :size] for key, arr in block.items()})
+        # Flat offsets into the contiguous (standards x BATCH_BLOCK_ROWS) buffers, shared by every key
+        flat = select[rows] * BATCH_BLOCK_ROWS + np.arange(size)
+        for key, arr in block.items():
+            np.take(arr, flat, out=out[key][rows])
+    return out
+
+
+def _apply_exposure(out: Dict[str, np.ndarray], group: str, profiles: Optional[Mapping[str, ExposureDefaults]]) -> Dict[str, np.ndarray]:
+    """
+    Turn the exposure-free health sums into hazard_index / cancer_risk for `group`
+    and, when given, every profile at once: CDI is linear in concentration, so
+    HI[sample, profile] = Σ(C/RfD)[sample] * intake[profile] is a broadcast over
+    the sums rather than another pass over the (samples x metals) matrix.
+    """
+    profiles = profiles or {}
+    hazard_sum = out.pop("hazard_sum")
+    cancer_sum = out.pop("cancer_sum")
+
+    intake = EnvironmentalCalculator.exposure_intake(profiles.get(group) or EXPOSURE_DEFAULTS[group])
+    # MI is the HEI sum (see calculate_mi), so it shares the array rather than a copy
+    out["mi"] = out["hei"]
+    out["hazard_index"] = hazard_sum * intake
+    out["cancer_risk"] = cancer_sum * intake
+
+    if profiles:
+        intakes = np.array([EnvironmentalCalculator.exposure_intake(p) for p in profiles.values()])
+        out["profile_hazard_index"] = hazard_sum[..., None] * intakes
+        out["profile_cancer_risk"] = cancer_sum[..., None] * intakes
+    return out
+
+
+def _distinct_rows(params: np.ndarray):
+    """Yield (standard rows, parameter row) for each distinct row of a (standards x metals) array."""
+    unique, inverse = np.unique(params, axis=0, return_inverse=True)
+    for u, row in enumerate(unique):
+        yield np.flatnonzero(inverse.ravel() == u), row
+
+
+def _calculate_block(conc: np.ndarray, std: "StandardArrays", out: Dict[str, np.ndarray]):
+    """
+    Fill the (standards x samples) `out` views for one row block of
+    EnvironmentalCalculator.calculate_batch_all.
+    Works on the (metals x samples) transpose so every reduction over metals is
+    an element-wise op across contiguous sample vectors, and avoids masked writes
+    by relying on NaN-aware ufuncs instead.
+    """
+    ct = np.ascontiguousarray(conc.T)
+    missing = np.isnan(ct)
+    # NaN -> 0.0, every other value unchanged (fmax/fmin ignore NaN)
+    c = np.fmax(ct, 0.0) + np.fmin(ct, 0.0)
+
+    # HPI = Σ(Qi * Wi) / ΣWi, Qi = (Mi/Si) * 100, Wi = 1/Si; only measured metals carry weight
+    # Same operation order as calculate_hpi, so samples exactly at a limit land on the same side of it
+    wi = 1.0 / std.si
+    sum_weights = wi @ ~missing
+    for k in range(len(std.standards)):
+        weighted_qi = np.add.reduce(((c / std.si[k, :, None]) * 100) * wi[k, :, None], axis=0)
+        np.divide(weighted_qi, sum_weights[k], out=out["hpi"][k], where=sum_weights[k] > 0)
+
+    # HEI = Σ(Mi / MACi), all standards in one matmul
+    np.matmul(1.0 / std.mac, c, out=out["hei"])
+
+    # I-geo = log2(Cn / (1.5 * Bn)), 0 for non-positive readings; max over measured metals.
+    # log2 is monotonic, so take the max ratio per sample first and log only that.
+    # A measured non-positive reading contributes I-geo 0, which beats any negative value
+    has_zero = (ct <= 0).any(axis=0)
+    for rows, bn in _distinct_rows(std.bn):
+        i_geo = np.zeros(ct.shape[1])
+        max_ratio = np.fmax.reduce(ct / (1.5 * bn)[:, None], axis=0)
+        np.log2(max_ratio, out=i_geo, where=max_ratio > 0)
+        np.maximum(i_geo, 0.0, out=i_geo, where=has_zero)
+        out["i_geo_max"][rows] = i_geo
+
+    # CDI is linear in concentration, so HI = intake * Σ(C/RfD) and CR = intake * Σ(C*CSF);
+    # only the sums are formed here (see _apply_exposure)
+    np.matmul(1.0 / std.rfd, c, out=out["hazard_sum"])
+    np.matmul(std.csf, c, out=out["cancer_sum"])
+
+
+_DEFAULT_STANDARDS = StandardArrays.from_constants()
@@ -0,0 +1,193 @@
+"""
+Wide, columnar export of samples: one row per sample with its risk indices
+and one column per metal, as Parquet, Arrow IPC (stream format) or CSV.
+
+Rows come from a server-side cursor; each batch is pivoted with numpy into
+fixed-schema columns, so any batch can be encoded on its own and the body
+streams with bounded memory. Parquet and Arrow need the optional `pyarrow`
+package; CSV is written with pandas.
+"""
+import io
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.constants import METAL_ORDER, METAL_SYMBOLS
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample, Measurement
+from app.services import sample_query
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "csv": "text/csv",
+}
+ARROW_FORMATS = ("parquet", "arrow")
+
+# Fixed leading columns: (name, SQL expression, arrow type name)
+BASE_COLUMNS = [
+    ("id", Sample.id, "int64"),
+    ("dataset_id", Sample.dataset_id, "int64"),
+    ("lat", Sample.lat, "float64"),
+    ("lng", Sample.lng, "float64"),
+    ("location_name", Sample.location_name, "string"),
+    ("state", Sample.state, "string"),
+    ("district", Sample.district, "string"),
+    ("timestamp", Sample.timestamp, "timestamp"),
+    ("source_type", Sample.source_type, "string"),
+    ("hpi", RiskAssessment.hpi, "float64"),
+    ("hei", RiskAssessment.hei, "float64"),
+    ("mi", RiskAssessment.mi, "float64"),
+    ("i_geo_max", RiskAssessment.i_geo_max, "float64"),
+    ("hazard_index", RiskAssessment.hazard_index, "float64"),
+    ("cancer_risk", RiskAssessment.cancer_risk, "float64"),
+    ("risk_category", RiskAssessment.risk_category, "string"),
+    ("is_safe", RiskAssessment.is_safe, "bool"),
+    ("standards_version", RiskAssessment.standards_version, "int64"),
+]
+
+
+def available(format: str) -> bool:
+    return format in MEDIA_TYPES and (format not in ARROW_FORMATS or pa is not None)
+
+
+# One float64 column (mg/L) per metal with standards, named as in METAL_ORDER
+METAL_COLUMNS: List[str] = list(METAL_ORDER)
+
+
+def metal_positions(labels, metals: List[str]) -> np.ndarray:
+    """Column of each Measurement.metal label ("As" and "arsenic" alike), or -1 for a metal without standards."""
+    codes, uniques = pd.factorize(np.asarray(labels, dtype=object))
+    # Normalized as tasks.assess_samples reads them for the calculator
+    names = [METAL_SYMBOLS.get(label, label.lower()) for label in uniques]
+    return pd.Index(metals).get_indexer(names)[codes]
+
+
+def wide_select(filters: sample_query.SampleFilters):
+    """Sample and risk columns (unassessed samples have nulls), filtered like /samples, in id order."""
+    query = (
+        select(*[column.label(name) for name, column, _ in BASE_COLUMNS])
+        .select_from(Sample)
+        .outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+    )
+    return sample_query.apply_filters(query, filters, risk_joined=True).order_by(Sample.id)
+
+
+def _frame(db: Session, rows, metals: List[str]) -> pd.DataFrame:
+    """One batch as a DataFrame: the base columns plus the pivoted metal readings."""
+    names = [name for name, _, _ in BASE_COLUMNS]
+    columns = dict(zip(names, zip(*rows))) if rows else {name: [] for name in names}
+    # Enum members before pandas sees them: str() of a str-Enum is its name, not its value
+    columns["source_type"] = [s.value if s is not None else None for s in columns["source_type"]]
+    frame = pd.DataFrame(columns, columns=names)
+
+    readings = np.full((len(frame), len(metals)), np.nan)
+    if len(frame) and metals:
+        ids = frame["id"].to_numpy()
+        measured = db.connection().execute(
+            select(Measurement.sample_id, Measurement.metal, Measurement.concentration)
+            .where(Measurement.sample_id.in_(ids.tolist()))
+            .order_by(Measurement.id)
+        ).all()
+        if measured:
+            sample_ids, labels, values = zip(*measured)
+            row = pd.Index(ids).get_indexer(sample_ids)
+            col = metal_positions(labels, metals)
+            keep = col >= 0
+            # Assigned in measurement order, so a repeated metal keeps its latest reading
+            readings[row[keep], col[keep]] = np.asarray(values, dtype=float)[keep]
+    return pd.concat([frame, pd.DataFrame(readings, columns=metals)], axis=1)
+
+
+def iter_frames(db: Session, filters: sample_query.SampleFilters, metals: List[str], batch_rows: int) -> Iterator[pd.DataFrame]:
+    result = db.connection().execute(wide_select(filters).execution_options(yield_per=batch_rows))
+    for rows in result.partitions():
+        yield _frame(db, rows, metals)
+
+
+def arrow_schema(metals: List[str]):
+    types = {
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "string": pa.string(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us"),
+    }
+    fields = [pa.field(name, types[kind]) for name, _, kind in BASE_COLUMNS]
+    return pa.schema(fields + [pa.field(metal, pa.float64()) for metal in metals])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator, while reporting absolute positions to the writer."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def encode(frames: Iterator[pd.DataFrame], format: str, metals: List[str], row_group_rows: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Encode DataFrame batches as a streamed body. Arrow IPC writes one record
+    batch per frame; Parquet buffers frames up to `row_group_rows` per row
+    group, since tiny row groups compress and scan poorly.
+    """
+    if format == "csv":
+        header = True
+        for frame in frames:
+            yield frame.to_csv(index=False, header=header).encode("utf-8")
+            header = False
+        if header:
+            yield ",".join([name for name, _, _ in BASE_COLUMNS] + metals).encode("utf-8") + b"\n"
+        return
+
+    schema = arrow_schema(metals)
+    sink = _ChunkSink()
+    if format == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+        for frame in frames:
+            writer.write_batch(pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+        return
+
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    pending: List[pd.DataFrame] = []
+    buffered = 0
+    for frame in frames:
+        pending.append(frame)
+        buffered += len(frame)
+        if row_group_rows is None or buffered >= row_group_rows:
+            writer.write_table(pa.Table.from_pandas(pd.concat(pending, ignore_index=True), schema=schema, preserve_index=False))
+            pending, buffered = [], 0
+            yield sink.drain()
+    if pending:
+        writer.write_table(pa.Table.from_pandas(pd.concat(pending, ignore_index=True), schema=schema, preserve_index=False))
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,263 @@
+"""
+Researcher dashboard statistics.
+
+`aggregate` computes them from scratch with one aggregate query over the
+researcher's samples (plus one GROUP BY for metal averages). With
+DASHBOARD_SUMMARY on, they are read from researcher_stats instead. That table is
+kept current by applying deltas as samples are ingested, assessments are
+written and datasets are deleted, so a dashboard load is a primary-key lookup.
+Rows are built lazily from `aggregate` on first use; deleting a row forces a
+rebuild. Writers hold a key-share lock on the uploader's users row while they
+apply deltas, and a build holds an exclusive one, so a build never misses a
+write that committed after its aggregate ran.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, case, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.bulk import dialect_insert
+from app.db.models.dataset import Dataset
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample, Measurement
+from app.db.models.summary import ResearcherStats, ResearcherMetalStats
+from app.db.models.user import User
+
+# Counter columns of researcher_stats, per risk category
+CATEGORY_COLUMNS = {"Safe": "safe", "Moderately Polluted": "moderately_polluted", "Hazardous": "hazardous"}
+COUNTER_COLUMNS = ("samples", "assessed", "hpi_sum", "mi_sum") + tuple(CATEGORY_COLUMNS.values())
+
+# Assessments without a category count as Safe
+_category = func.coalesce(RiskAssessment.risk_category, "Safe")
+
+
+def aggregate(db: Session, uploader_id: Optional[int] = None, dataset_id: Optional[int] = None) -> dict:
+    """Counters of researcher_stats for one uploader's (or one dataset's) samples, in one query."""
+    query = (
+        select(
+            func.count(Sample.id).label("samples"),
+            func.count(RiskAssessment.sample_id).label("assessed"),
+            func.coalesce(func.sum(RiskAssessment.hpi), 0.0).label("hpi_sum"),
+            func.coalesce(func.sum(RiskAssessment.mi), 0.0).label("mi_sum"),
+            *[
+                func.count(case((_category == name, RiskAssessment.sample_id))).label(column)
+                for name, column in CATEGORY_COLUMNS.items()
+            ],
+            func.min(Sample.id).label("first_sample_id"),
+        )
+        .select_from(Sample)
+        .join(Dataset, Dataset.id == Sample.dataset_id)
+        .outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+    )
+    query = query.where(Dataset.uploader_id == uploader_id) if dataset_id is None else query.where(Sample.dataset_id == dataset_id)
+    return dict(db.execute(query).one()._mapping)
+
+
+def metal_aggregate(db: Session, uploader_id: Optional[int] = None, dataset_id: Optional[int] = None) -> List[tuple]:
+    """(metal, readings, concentration_sum) per metal label."""
+    query = (
+        select(Measurement.metal, func.count(), func.sum(Measurement.concentration))
+        .join(Sample, Sample.id == Measurement.sample_id)
+        .join(Dataset, Dataset.id == Sample.dataset_id)
+        .group_by(Measurement.metal)
+        .order_by(Measurement.metal)
+    )
+    query = query.where(Dataset.uploader_id == uploader_id) if dataset_id is None else query.where(Sample.dataset_id == dataset_id)
+    return db.execute(query).all()
+
+
+def get_stats(db: Session, uploader_id: int) -> dict:
+    """The dashboard-stats response. Commits if it has to build the summary row."""
+    if not settings.DASHBOARD_SUMMARY:
+        return _response(db, aggregate(db, uploader_id), metal_aggregate(db, uploader_id))
+
+    row = db.get(ResearcherStats, uploader_id)
+    if row is None:
+        row = _build(db, uploader_id)
+        db.commit()
+    metals = db.execute(
+        select(ResearcherMetalStats.metal, ResearcherMetalStats.readings, ResearcherMetalStats.concentration_sum)
+        .where(ResearcherMetalStats.uploader_id == uploader_id, ResearcherMetalStats.readings > 0)
+        .order_by(ResearcherMetalStats.metal)
+    ).all()
+    stats = {column: getattr(row, column) for column in COUNTER_COLUMNS + ("first_sample_id",)}
+    return _response(db, stats, metals)
+
+
+def _response(db: Session, stats: dict, metals: List[tuple]) -> dict:
+    if not stats["samples"]:
+        return {
+            "total_samples": 0,
+            "avg_hpi": 0,
+            "risk_distribution": {"Safe": 0, "Low Risk": 0, "High Risk": 0},
+            "recent_uploads": [],
+            "metal_averages": []
+        }
+
+    assessed = stats["assessed"]
+    latest_site = db.scalar(select(Sample.location_name).where(Sample.id == stats["first_sample_id"]))
+    return {
+        "total_samples": stats["samples"],
+        "avg_hpi": round(stats["hpi_sum"] / assessed, 2) if assessed else 0,
+        "avg_mi": round(stats["mi_sum"] / assessed, 2) if assessed else 0,
+        "risk_distribution": {name: stats[column] for name, column in CATEGORY_COLUMNS.items()},
+        "metal_averages": [{"name": metal, "value": total / readings} for metal, readings, total in metals],
+        "latest_site": latest_site,
+    }
+
+
+def _lock_uploaders(db: Session, uploader_ids: Iterable[int], exclusive: bool = False):
+    """Lock the uploaders' users rows until commit: shared by writers applying deltas, exclusive for a build."""
+    ids = sorted(set(uploader_ids))
+    if ids:
+        query = select(User.id).where(User.id.in_(ids)).order_by(User.id)
+        db.execute(query.with_for_update() if exclusive else query.with_for_update(read=True, key_share=True))
+
+
+def _build(db: Session, uploader_id: int) -> ResearcherStats:
+    # Waits for writers that started before the row existed, and holds back new ones until commit
+    _lock_uploaders(db, [uploader_id], exclusive=True)
+    row = db.get(ResearcherStats, uploader_id, populate_existing=True)
+    if row is not None:
+        # Built by another request while this one waited
+        return row
+    stats = aggregate(db, uploader_id)
+    db.execute(
+        dialect_insert(db, ResearcherStats.__table__)
+        .values(uploader_id=uploader_id, **stats)
+        .on_conflict_do_nothing(index_elements=["uploader_id"])
+    )
+    rows = [
+        {"uploader_id": uploader_id, "metal": metal, "readings": readings, "concentration_sum": total}
+        for metal, readings, total in metal_aggregate(db, uploader_id)
+    ]
+    if rows:
+        db.execute(
+            dialect_insert(db, ResearcherMetalStats.__table__).on_conflict_do_nothing(index_elements=["uploader_id", "metal"]),
+            rows,
+        )
+    db.flush()
+    return db.get(ResearcherStats, uploader_id)
+
+
+def _apply(db: Session, deltas: pd.DataFrame):
+    """Add per-uploader deltas (columns: uploader_id + any COUNTER_COLUMNS) to existing summary rows."""
+    columns = [c for c in deltas.columns if c != "uploader_id"]
+    table = ResearcherStats.__table__
+    stmt = (
+        table.update()
+        .where(table.c.uploader_id == bindparam("b_uploader_id"))
+        .values({c: table.c[c] + bindparam(f"b_{c}") for c in columns})
+    )
+    db.execute(stmt, [{f"b_{k}": v for k, v in row.items()} for row in deltas.to_dict("records")])
+
+
+def _apply_metals(db: Session, uploader_id: int, metals: pd.DataFrame, sign: int = 1):
+    """Add (metal, readings, concentration_sum) rows to one uploader's metal summary, creating missing metals."""
+    if metals.empty or db.get(ResearcherStats, uploader_id) is None:
+        return
+    table = ResearcherMetalStats.__table__
+    db.execute(
+        dialect_insert(db, table).on_conflict_do_nothing(index_elements=["uploader_id", "metal"]),
+        [{"uploader_id": uploader_id, "metal": m, "readings": 0, "concentration_sum": 0.0} for m in metals["metal"]],
+    )
+    db.execute(
+        table.update()
+        .where(table.c.uploader_id == uploader_id, table.c.metal == bindparam("b_metal"))
+        .values(
+            readings=table.c.readings + bindparam("b_readings"),
+            concentration_sum=table.c.concentration_sum + bindparam("b_concentration_sum"),
+        ),
+        [
+            {"b_metal": m, "b_readings": sign * int(n), "b_concentration_sum": sign * float(s)}
+            for m, n, s in metals[["metal", "readings", "concentration_sum"]].itertuples(index=False)
+        ],
+    )
+
+
+def record_samples(db: Session, dataset_id: Optional[int], sample_ids: List[int], measurements: pd.DataFrame) -> Optional[int]:
+    """
+    Count newly ingested samples and their (metal, concentration) readings.
+    Returns the dataset's uploader. Does not commit.
+    """
+    if dataset_id is None or not sample_ids:
+        return None
+    uploader_id = db.scalar(select(Dataset.uploader_id).where(Dataset.id == dataset_id))
+    _lock_uploaders(db, [uploader_id])
+    table = ResearcherStats.__table__
+    db.execute(
+        table.update()
+        .where(table.c.uploader_id == uploader_id)
+        .values(
+            samples=table.c.samples + len(sample_ids),
+            # Ids only grow, so an existing first sample stays first
+            first_sample_id=func.coalesce(table.c.first_sample_id, min(sample_ids)),
+        )
+    )
+    metals = measurements.groupby("metal", sort=True)["concentration"].agg(["count", "sum"]).reset_index()
+    _apply_metals(db, uploader_id, metals.rename(columns={"count": "readings", "sum": "concentration_sum"}))
+    return uploader_id
+
+
+def record_assessments(db: Session, sample_ids: List[int], results: Dict[str, np.ndarray]) -> Set[int]:
+    """
+    Fold a chunk of (re-)assessments into the summary: the difference between
+    the stored assessment, if any, and the new one. Call before the new rows
+    are written. Returns the uploaders whose samples were touched. Does not commit.
+    """
+    previous = pd.DataFrame(
+        db.execute(
+            select(Sample.id, Dataset.uploader_id, RiskAssessment.sample_id, RiskAssessment.hpi, RiskAssessment.mi, RiskAssessment.risk_category)
+            .join(Dataset, Dataset.id == Sample.dataset_id)
+            .outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+            .where(Sample.id.in_(sample_ids))
+        ).all(),
+        columns=["sample_id", "uploader_id", "assessed", "hpi", "mi", "risk_category"],
+    )
+    if previous.empty:
+        return set()
+    _lock_uploaders(db, previous["uploader_id"].tolist())
+
+    rows = pd.Index(sample_ids).get_indexer(previous["sample_id"])
+    was_assessed = previous["assessed"].notna().to_numpy()
+    old_category = previous["risk_category"].fillna("Safe").to_numpy()
+    new_category = np.asarray(results["risk_category"])[rows]
+
+    deltas = pd.DataFrame({
+        "uploader_id": previous["uploader_id"],
+        "assessed": (~was_assessed).astype(int),
+        "hpi_sum": np.nan_to_num(np.asarray(results["hpi"], dtype=float)[rows]) - previous["hpi"].astype(float).fillna(0.0).to_numpy(),
+        "mi_sum": np.nan_to_num(np.asarray(results["mi"], dtype=float)[rows]) - previous["mi"].astype(float).fillna(0.0).to_numpy(),
+        **{
+            column: (new_category == name).astype(int) - ((old_category == name) & was_assessed).astype(int)
+            for name, column in CATEGORY_COLUMNS.items()
+        },
+    })
+    _apply(db, deltas.groupby("uploader_id", as_index=False).sum())
+    return set(previous["uploader_id"].tolist())
+
+
+def remove_dataset(db: Session, dataset: Dataset):
+    """Subtract a dataset's samples from its uploader's summary. Call before deleting it. Does not commit."""
+    _lock_uploaders(db, [dataset.uploader_id])
+    summary = db.get(ResearcherStats, dataset.uploader_id, populate_existing=True)
+    if summary is None:
+        return
+    stats = aggregate(db, dataset_id=dataset.id)
+    deltas = pd.DataFrame([{"uploader_id": dataset.uploader_id, **{c: -stats[c] for c in COUNTER_COLUMNS}}])
+    _apply(db, deltas)
+
+    metals = pd.DataFrame(metal_aggregate(db, dataset_id=dataset.id), columns=["metal", "readings", "concentration_sum"])
+    _apply_metals(db, dataset.uploader_id, metals, sign=-1)
+
+    if summary.first_sample_id is not None and summary.first_sample_id == stats["first_sample_id"]:
+        first = db.scalar(
+            select(func.min(Sample.id))
+            .join(Dataset, Dataset.id == Sample.dataset_id)
+            .where(Dataset.uploader_id == dataset.uploader_id, Sample.dataset_id != dataset.id)
+        )
+        table = ResearcherStats.__table__
+        db.execute(table.update().where(table.c.uploader_id == dataset.uploader_id).values(first_sample_id=first))
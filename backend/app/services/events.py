@@ -0,0 +1,253 @@
+"""
+Push events (/api/v1/events/stream): upload progress, finished risk
+assessments and newly Hazardous samples.
+
+Writers call `publish` inside the transaction that changes the data, so an
+event exists only if that change commits, whichever process made it (API or
+worker). Each API process runs one broker thread that tails the `events`
+table every EVENT_POLL_SECONDS while anyone is connected, and fans every new
+event out to the matching connections' queues: one small query per process
+instead of one heavy poll per client.
+
+Ids are taken at insert but become visible at commit, so a concurrent
+transaction can commit an id below the broker's mark. The ids skipped over
+are re-checked for EVENT_GAP_SECONDS before they are given up on.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models.dataset import Dataset
+from app.db.models.event import Event
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample
+
+# Event kinds
+DATASET_PROGRESS = "dataset.progress"    # An upload committed a chunk, finished or failed (to the uploader)
+RISK_ASSESSED = "risk.assessed"          # A chunk of a dataset's samples was assessed (to the uploader)
+RISK_COMPLETED = "risk.completed"        # Every sample of a dataset is assessed (to the uploader)
+SAMPLES_HAZARDOUS = "samples.hazardous"  # Samples newly assessed as Hazardous (to everyone)
+KINDS = (DATASET_PROGRESS, RISK_ASSESSED, RISK_COMPLETED, SAMPLES_HAZARDOUS)
+
+
+def publish(db: Session, kind: str, payload: dict, user_id: Optional[int] = None):
+    """Queue an event for `user_id` (everyone when None) in the caller's transaction. Does not commit."""
+    db.add(Event(kind=kind, payload=payload, user_id=user_id, created_at=datetime.utcnow()))
+
+
+def dataset_progress(db: Session, dataset: Dataset, **extra):
+    """Tell the uploader how far an upload got. Does not commit."""
+    publish(db, DATASET_PROGRESS, {
+        "dataset_id": dataset.id, "filename": dataset.filename, "status": dataset.upload_status,
+        "rows_processed": dataset.rows_processed, **extra,
+    }, user_id=dataset.uploader_id)
+
+
+def record_assessments(db: Session, sample_ids: List[int], results: Dict[str, np.ndarray], readings) -> int:
+    """
+    Publish a chunk of (re-)assessments: `risk.assessed` per dataset to its
+    uploader, and `samples.hazardous` for the samples that just became
+    Hazardous (the first EVENT_SAMPLES_MAX in full). Call before the new rows
+    are written. Returns how many turned Hazardous. Does not commit.
+    """
+    hazardous = np.asarray(results["risk_category"]) == "Hazardous"
+    rows = db.execute(
+        select(
+            Sample.id, Sample.dataset_id, Dataset.uploader_id, RiskAssessment.risk_category,
+            Sample.lat, Sample.lng, Sample.location_name, Sample.state, Sample.district,
+        )
+        .outerjoin(Dataset, Dataset.id == Sample.dataset_id)
+        .outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .where(Sample.id.in_(sample_ids))
+    ).all()
+    position = {sample_id: k for k, sample_id in enumerate(sample_ids)}
+
+    datasets = {}
+    turned = []
+    for row in rows:
+        k = position[row.id]
+        if row.dataset_id is not None:
+            counts = datasets.setdefault((row.dataset_id, row.uploader_id), [0, 0])
+            counts[0] += 1
+            counts[1] += int(hazardous[k])
+        if hazardous[k] and row.risk_category != "Hazardous":
+            turned.append((k, row))
+
+    for (dataset_id, uploader_id), (samples, flagged) in sorted(datasets.items()):
+        publish(db, RISK_ASSESSED, {"dataset_id": dataset_id, "samples": samples, "hazardous": flagged}, user_id=uploader_id)
+
+    if turned:
+        listed = turned[:settings.EVENT_SAMPLES_MAX]
+        wanted = {row.id for _, row in listed}
+        measurements = {}
+        for sample_id, metal, concentration in readings:
+            if sample_id in wanted:
+                measurements.setdefault(sample_id, []).append({"metal": metal, "concentration": concentration})
+        publish(db, SAMPLES_HAZARDOUS, {
+            "count": len(turned),
+            "samples": [
+                {
+                    "id": row.id, "lat": row.lat, "lng": row.lng, "location_name": row.location_name,
+                    "state": row.state, "district": row.district, "dataset_id": row.dataset_id,
+                    "risk": {"hpi": float(results["hpi"][k]), "risk_category": "Hazardous"},
+                    "measurements": measurements.get(row.id, []),
+                }
+                for k, row in listed
+            ],
+        })
+    return len(turned)
+
+
+def dataset_assessed(db: Session, dataset_id: int, samples: int):
+    """Tell the uploader every sample of a dataset is assessed. Does not commit."""
+    uploader_id = db.scalar(select(Dataset.uploader_id).where(Dataset.id == dataset_id))
+    if uploader_id is not None:
+        publish(db, RISK_COMPLETED, {"dataset_id": dataset_id, "samples": samples}, user_id=uploader_id)
+
+
+def latest_id(db: Session) -> int:
+    return db.scalar(select(func.max(Event.id))) or 0
+
+
+def _record(event: Event) -> dict:
+    return {"id": event.id, "kind": event.kind, "user_id": event.user_id, "payload": event.payload}
+
+
+def _visible(user_id: Optional[int], kinds: Optional[Set[str]]):
+    """WHERE clause for the events a connection may see."""
+    clause = Event.user_id.is_(None) if user_id is None else or_(Event.user_id.is_(None), Event.user_id == user_id)
+    return clause & Event.kind.in_(kinds) if kinds else clause
+
+
+def since(db: Session, after: int, user_id: Optional[int] = None, kinds: Optional[Set[str]] = None) -> List[dict]:
+    """Retained events after `after` that the connection may see (a reconnect's replay), oldest first."""
+    events = db.scalars(
+        select(Event).where(Event.id > after, _visible(user_id, kinds)).order_by(Event.id).limit(settings.EVENT_REPLAY_MAX)
+    ).all()
+    return [_record(event) for event in events]
+
+
+def prune(db: Session) -> int:
+    """Delete events older than EVENT_RETENTION_SECONDS. Does not commit."""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.EVENT_RETENTION_SECONDS)
+    return db.execute(delete(Event).where(Event.created_at < cutoff)).rowcount
+
+
+@dataclass(eq=False)
+class Subscription:
+    """One connection: its filter and the queue the broker fills on its event loop."""
+    loop: asyncio.AbstractEventLoop
+    user_id: Optional[int]
+    kinds: Optional[Set[str]]
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(settings.EVENT_QUEUE_SIZE))
+    # Set when the client fell too far behind; it is disconnected and replays on reconnect
+    overflowed: bool = False
+
+    def wants(self, event: dict) -> bool:
+        return (event["user_id"] is None or event["user_id"] == self.user_id) and (not self.kinds or event["kind"] in self.kinds)
+
+    def _put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+    """Fans events out to this process's connections. The tailing thread starts with the first subscriber."""
+
+    def __init__(self):
+        self._subscribers: Set[Subscription] = set()
+        self._last: Optional[int] = None
+        self._gaps: Dict[int, float] = {}  # Skipped id -> when it was first missed
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, user_id: Optional[int], kinds: Optional[Iterable[str]] = None) -> Subscription:
+        """Register a connection; call from its event loop."""
+        subscription = Subscription(asyncio.get_running_loop(), user_id, set(kinds) if kinds else None)
+        with self._lock:
+            self._subscribers.add(subscription)
+        self.start(settings.EVENT_POLL_SECONDS)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def poll(self, db: Session) -> int:
+        """Deliver the events committed since the last poll. Returns how many were read."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            # Nobody to tell; connections made later replay from their own starting id
+            self._last, self._gaps = None, {}
+            return 0
+        if self._last is None:
+            self._last = latest_id(db)
+            return 0
+
+        now = time.monotonic()
+        self._gaps = {i: t for i, t in self._gaps.items() if now - t < settings.EVENT_GAP_SECONDS}
+        clause = Event.id > self._last
+        if self._gaps:
+            clause = or_(clause, Event.id.in_(list(self._gaps)))
+        events = [_record(event) for event in db.scalars(select(Event).where(clause).order_by(Event.id)).all()]
+        db.rollback()
+
+        for event in events:
+            self._gaps.pop(event["id"], None)
+            if event["id"] > self._last:
+                self._gaps.update((i, now) for i in range(self._last + 1, event["id"]))
+                self._last = event["id"]
+            for subscription in subscribers:
+                if subscription.wants(event):
+                    subscription.loop.call_soon_threadsafe(subscription._put, event)
+        return len(events)
+
+    def start(self, interval: float):
+        """Tail the table every `interval` seconds on a daemon thread, pruning old events now and then."""
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            def run():
+                db = SessionLocal()
+                pruned_at = 0.0
+                try:
+                    while not self._stop.is_set():
+                        try:
+                            self.poll(db)
+                            if time.monotonic() - pruned_at >= settings.EVENT_RETENTION_SECONDS / 10:
+                                prune(db)
+                                db.commit()
+                                pruned_at = time.monotonic()
+                        except Exception as e:
+                            db.rollback()
+                            print(f"❌ Error publishing events: {e}")
+                        self._stop.wait(interval)
+                finally:
+                    db.close()
+
+            self._thread = threading.Thread(target=run, name="event-broker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop.clear()
+
+
+broker = Broker()
@@ -0,0 +1,238 @@
+"""
+Portable spatial indexing: samples carry a geohash string with a plain B-tree
+index, so a bounding box becomes a handful of index range scans
+(`geohash >= 'tdr1' AND geohash < 'tdr2'`) on Postgres and SQLite alike.
+"""
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_BYTES = np.frombuffer(BASE32.encode("ascii"), dtype=np.uint8)
+
+# Stored precision: 10 characters is a cell of about 1.2m x 0.6m
+GEOHASH_PRECISION = 10
+
+# Upper bound on cells used to cover a query box (before merging adjacent ones)
+MAX_COVER_CELLS = 64
+
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0088
+
+# Boxes up to this many square degrees (~200km x 200km) are answered from the
+# geohash index and sorted; larger ones match so much of a national dataset that
+# walking the primary key in order and stopping at the page limit is cheaper
+INDEX_SCAN_MAX_AREA = 3.0
+
+
+@dataclass(frozen=True)
+class BBox:
+    min_lng: float
+    min_lat: float
+    max_lng: float
+    max_lat: float
+
+    @classmethod
+    def parse(cls, value: str) -> "BBox":
+        """'min_lng,min_lat,max_lng,max_lat' (west, south, east, north). Raises ValueError."""
+        parts = [float(p) for p in value.split(",")]
+        if len(parts) != 4:
+            raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+        box = cls(*parts)
+        if not (-90 <= box.min_lat <= box.max_lat <= 90):
+            raise ValueError("bbox latitudes must satisfy -90 <= min_lat <= max_lat <= 90")
+        if not (-180 <= box.min_lng <= 180 and -180 <= box.max_lng <= 180):
+            raise ValueError("bbox longitudes must be within [-180, 180]")
+        return box
+
+    @property
+    def area(self) -> float:
+        """Square degrees (longitude x latitude)."""
+        return sum((p.max_lng - p.min_lng) * (p.max_lat - p.min_lat) for p in self.split())
+
+    def split(self) -> List["BBox"]:
+        """Boxes crossing the antimeridian (min_lng > max_lng) become two."""
+        if self.min_lng <= self.max_lng:
+            return [self]
+        return [
+            BBox(self.min_lng, self.min_lat, 180.0, self.max_lat),
+            BBox(-180.0, self.min_lat, self.max_lng, self.max_lat),
+        ]
+
+
+@dataclass(frozen=True)
+class Circle:
+    lat: float
+    lng: float
+    radius_km: float
+
+    @classmethod
+    def parse(cls, near: str, radius_km: float) -> "Circle":
+        """'lat,lng' plus a radius. Raises ValueError."""
+        parts = [float(p) for p in near.split(",")]
+        if len(parts) != 2 or not (-90 <= parts[0] <= 90 and -180 <= parts[1] <= 180):
+            raise ValueError("near must be lat,lng")
+        if not radius_km or radius_km <= 0:
+            raise ValueError("radius_km must be positive")
+        return cls(parts[0], parts[1], radius_km)
+
+    @property
+    def lng_scale(self) -> float:
+        """Length of a degree of longitude relative to one of latitude, at the centre."""
+        return max(math.cos(math.radians(self.lat)), 1e-6)
+
+    def bbox(self) -> BBox:
+        dlat = self.radius_km / KM_PER_DEGREE
+        dlng = min(dlat / self.lng_scale, 180.0)
+        min_lng, max_lng = self.lng - dlng, self.lng + dlng
+        if dlng >= 180.0:
+            min_lng, max_lng = -180.0, 180.0
+        elif min_lng < -180.0:
+            min_lng += 360.0
+        elif max_lng > 180.0:
+            max_lng -= 360.0
+        return BBox(min_lng, max(self.lat - dlat, -90.0), max_lng, min(self.lat + dlat, 90.0))
+
+
+def haversine_km(lat, lng, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km, from one point to many or pairwise between equal-length arrays."""
+    lat1, lats = np.radians(lat), np.radians(lats)
+    dlat = lats - lat1
+    dlng = np.radians(np.subtract(lngs, lng))
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lats) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def pairs_within(lat: np.ndarray, lng: np.ndarray, radius_km: float, batch: int = 50000) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Every pair of points within radius_km of each other (once, as i, j), with
+    its distance. Points are binned into cells at least radius_km across, so each
+    point is compared only with its own and the neighbouring cells. Does not
+    wrap at the antimeridian.
+    """
+    lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+    empty = np.empty(0, dtype=np.int64)
+    if len(lat) < 2:
+        return empty, empty, np.empty(0)
+    cell_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # As wide as the radius reaches at the most poleward point
+    cell_lng = cell_lat / max(math.cos(math.radians(min(float(np.abs(lat).max()) + cell_lat, 89.9))), 1e-6)
+    row = ((lat + 90.0) // cell_lat).astype(np.int64)
+    col = ((lng + 180.0) // cell_lng).astype(np.int64)
+    col -= col.min() - 1  # Room for the column to the left, so keys never spill into the previous row
+    stride = int(col.max()) + 2
+    key = row * stride + col
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+
+    firsts, seconds = [], []
+    for start in range(0, len(lat), batch):
+        positions = np.arange(start, min(start + batch, len(lat)))
+        # Half the neighbourhood, so each pair is found once
+        for dy, dx in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+            target = sorted_key[positions] + dy * stride + dx
+            lo = np.searchsorted(sorted_key, target, side="left")
+            hi = np.searchsorted(sorted_key, target, side="right")
+            if dy == 0 and dx == 0:
+                lo = np.maximum(lo, positions + 1)
+            lengths = np.maximum(hi - lo, 0)
+            total = int(lengths.sum())
+            if not total:
+                continue
+            firsts.append(order[np.repeat(positions, lengths)])
+            seconds.append(order[np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(total)])
+    if not firsts:
+        return empty, empty, np.empty(0)
+    i, j = np.concatenate(firsts), np.concatenate(seconds)
+    distance = haversine_km(lat[i], lng[i], lat[j], lng[j])
+    near = distance <= radius_km
+    return i[near], j[near], distance[near]
+
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """(longitude bits, latitude bits) of a geohash; longitude takes the first and every other bit."""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _cell_indices(values: np.ndarray, low: float, span: float, bits: int) -> np.ndarray:
+    cells = np.floor((values - low) / span * (1 << bits)).astype(np.int64)
+    return np.clip(cells, 0, (1 << bits) - 1)
+
+
+def encode_many(lat, lng, precision: int = GEOHASH_PRECISION) -> np.ndarray:
+    """Vectorized geohash of coordinate arrays; returns an object array of str."""
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    lng_bits, lat_bits = _bits(precision)
+    x = _cell_indices(lng, -180.0, 360.0, lng_bits)
+    y = _cell_indices(lat, -90.0, 180.0, lat_bits)
+
+    # Interleave from the most significant bit: lng, lat, lng, lat, ...
+    code = np.zeros(len(lat), dtype=np.int64)
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            bit = (x >> (lng_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    shifts = 5 * np.arange(precision - 1, -1, -1, dtype=np.int64)
+    chars = _BASE32_BYTES[(code[:, None] >> shifts) & 31]
+    return np.ascontiguousarray(chars).view(f"S{precision}").ravel().astype(str).astype(object)
+
+
+def encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    return encode_many([lat], [lng], precision)[0]
+
+
+def _successor(code: str) -> Optional[str]:
+    """The next geohash of the same length in sort order, or None after the last one."""
+    chars = list(code)
+    for i in range(len(chars) - 1, -1, -1):
+        pos = BASE32.index(chars[i])
+        if pos < 31:
+            chars[i] = BASE32[pos + 1]
+            return "".join(chars[:i + 1]) + BASE32[0] * (len(chars) - i - 1)
+        chars[i] = BASE32[0]
+    return None
+
+
+def cover(box: BBox, max_cells: int = MAX_COVER_CELLS) -> List[Tuple[str, Optional[str]]]:
+    """
+    Geohash ranges [lo, hi) that together contain every point in `box`.
+    Uses the finest precision whose covering fits in `max_cells` cells, then
+    merges cells that are adjacent in sort order into single ranges. `hi` is
+    None for a range that runs to the end of the keyspace.
+    """
+    cells = set()
+    for part in box.split():
+        best = None
+        for precision in range(1, GEOHASH_PRECISION + 1):
+            lng_bits, lat_bits = _bits(precision)
+            x0, x1 = _cell_indices(np.array([part.min_lng, part.max_lng]), -180.0, 360.0, lng_bits)
+            y0, y1 = _cell_indices(np.array([part.min_lat, part.max_lat]), -90.0, 180.0, lat_bits)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > max_cells:
+                break
+            best = (precision, x0, x1, y0, y1)
+        if best is None:
+            # Even single characters are too many; scan everything in the box's rows
+            return [(BASE32[0], None)]
+
+        precision, x0, x1, y0, y1 = best
+        lng_bits, lat_bits = _bits(precision)
+        xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+        # Encode the cell centres
+        lng = -180.0 + (xs.ravel() + 0.5) * 360.0 / (1 << lng_bits)
+        lat = -90.0 + (ys.ravel() + 0.5) * 180.0 / (1 << lat_bits)
+        cells.update(encode_many(lat, lng, precision))
+
+    ranges: List[Tuple[str, Optional[str]]] = []
+    for code in sorted(cells):
+        if ranges and ranges[-1][1] is not None and len(ranges[-1][1]) == len(code) and ranges[-1][1] == code:
+            ranges[-1] = (ranges[-1][0], _successor(code))
+        else:
+            ranges.append((code, _successor(code)))
+    return ranges
@@ -0,0 +1,277 @@
+"""
+Hotspot analysis: Getis-Ord Gi* z-scores of HPI over each state's assessed
+samples, and clusters of significant hot spots.
+
+A sample's neighbours are the samples within HOTSPOT_DISTANCE_KM (binary
+weights, the sample itself included, as Gi* requires). Pairs come from
+geo.pairs_within, and the weighted sums are bincounts over them: a sparse
+weight matrix in COO form applied to the HPI vector. Hot spots significant
+at 95% that neighbour each other form a cluster.
+
+Results are stored per state and standards version. Assessments and
+deletions mark the states they touch stale; the update_hotspots job
+recomputes only those. A state with no run under the requested version is
+answered from its latest earlier run: none of its samples was re-assessed
+since, so that run still holds.
+"""
+import math
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.bulk import dialect_insert
+from app.db.models.hotspot import HotspotRegion, HotspotSample
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample
+from app.services import cache, geo, jobs
+from app.services import standards as standards_registry
+from app.services.rollups import UNKNOWN
+
+# Two-sided critical z-scores by confidence level (%)
+CONFIDENCE_Z = {90: 1.645, 95: 1.96, 99: 2.576}
+CLUSTER_CONFIDENCE = 95
+KINDS = ("hot", "cold", "all")
+
+# Samples with fewer neighbours than this get no Gi* result
+MIN_NEIGHBOURS = 3
+
+
+def _version(db: Session) -> int:
+    return standards_registry.current_version(db) or 0
+
+
+def _state_clause(state: str):
+    return or_(Sample.state == state, Sample.state.is_(None)) if state == UNKNOWN else Sample.state == state
+
+
+def mark_stale(db: Session, states: Iterable[Optional[str]]):
+    """Flag these states for re-analysis under the current standards version and queue the job. Does not commit."""
+    states = sorted({state if state is not None else UNKNOWN for state in states})
+    if not states:
+        return
+    version = _version(db)
+    table = HotspotRegion.__table__
+    db.execute(
+        dialect_insert(db, table).on_conflict_do_update(
+            index_elements=["state", "standards_version"], set_={"stale": True, "generation": table.c.generation + 1}
+        ),
+        [{"state": state, "standards_version": version, "stale": True, "generation": 0} for state in states],
+    )
+    jobs.enqueue_once(db, "update_hotspots")
+
+
+def stale_regions(db: Session) -> List[Tuple[str, int, int]]:
+    """(state, version, generation) of every stale state under the current version."""
+    return db.execute(
+        select(HotspotRegion.state, HotspotRegion.standards_version, HotspotRegion.generation)
+        .where(HotspotRegion.stale.is_(True), HotspotRegion.standards_version == _version(db))
+        .order_by(HotspotRegion.state)
+    ).all()
+
+
+def unanalysed_states(db: Session) -> List[str]:
+    """States with assessed samples but no run under the current version, nor a pending one."""
+    state = func.coalesce(Sample.state, UNKNOWN)
+    assessed = select(state).join(RiskAssessment, RiskAssessment.sample_id == Sample.id).distinct()
+    known = select(HotspotRegion.state).where(HotspotRegion.standards_version <= _version(db))
+    return sorted(set(db.scalars(assessed).all()) - set(db.scalars(known).all()))
+
+
+def gi_star(x: np.ndarray, i: np.ndarray, j: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(z-scores, neighbour counts) of Gi* with binary weights over the pairs (i, j), each sample its own neighbour."""
+    n = len(x)
+    if n < 2:
+        return np.zeros(n), np.zeros(n, dtype=np.int64)
+    neighbours = np.bincount(i, minlength=n) + np.bincount(j, minlength=n)
+    weights = neighbours + 1.0
+    local = x + np.bincount(i, weights=x[j], minlength=n) + np.bincount(j, weights=x[i], minlength=n)
+    mean = x.mean()
+    s = math.sqrt(max(float((x * x).mean()) - mean * mean, 0.0))
+    spread = s * np.sqrt(np.maximum(n * weights - weights * weights, 0.0) / (n - 1))
+    z = np.zeros(n)
+    ok = spread > 0
+    z[ok] = (local[ok] - mean * weights[ok]) / spread[ok]
+    return z, neighbours
+
+
+def components(members: np.ndarray, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """Cluster number per point (1 = largest; 0 outside `members`) over the pairs joining two members."""
+    n = len(members)
+    edge = members[i] & members[j]
+    a, b = i[edge], j[edge]
+    labels = np.where(members, np.arange(n), n)
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        merged = labels.copy()
+        np.minimum.at(merged, a, low)
+        np.minimum.at(merged, b, low)
+        # Pointer jumping: a member's label is another member's index
+        merged[members] = merged[merged[members]]
+        if np.array_equal(merged, labels):
+            break
+        labels = merged
+    out = np.zeros(n, dtype=np.int64)
+    if members.any():
+        roots, inverse, counts = np.unique(labels[members], return_inverse=True, return_counts=True)
+        rank = np.empty(len(roots), dtype=np.int64)
+        rank[np.argsort(-counts, kind="stable")] = np.arange(1, len(roots) + 1)
+        out[members] = rank[inverse]
+    return out
+
+
+def compute(db: Session, state: str, version: int, generation: int) -> int:
+    """Re-run the analysis of one state and store it under `version`. Returns the samples analysed. Does not commit."""
+    # First, so the row lock serializes concurrent runs until commit
+    cache.bump(db, cache.HOTSPOTS)
+    rows = db.execute(
+        select(Sample.id, Sample.lat, Sample.lng, RiskAssessment.hpi)
+        .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .where(_state_clause(state), RiskAssessment.hpi.isnot(None), Sample.lat.isnot(None), Sample.lng.isnot(None))
+        .order_by(Sample.id)
+    ).all()
+    ids, lat, lng, hpi = (np.array(column) for column in zip(*rows)) if rows else (np.empty(0),) * 4
+    hpi = hpi.astype(float)
+    i, j, _ = geo.pairs_within(lat.astype(float), lng.astype(float), settings.HOTSPOT_DISTANCE_KM)
+    z, neighbours = gi_star(hpi, i, j)
+    z[neighbours < MIN_NEIGHBOURS] = 0.0
+    cluster = components(z >= CONFIDENCE_Z[CLUSTER_CONFIDENCE], i, j)
+
+    db.execute(HotspotSample.__table__.delete().where(HotspotSample.state == state, HotspotSample.standards_version == version))
+    significant = np.flatnonzero(np.abs(z) >= CONFIDENCE_Z[90])
+    if len(significant):
+        db.execute(HotspotSample.__table__.insert(), [
+            {
+                "state": state, "standards_version": version, "sample_id": int(ids[k]),
+                "z_score": float(z[k]), "p_value": math.erfc(abs(float(z[k])) / math.sqrt(2)),
+                "neighbours": int(neighbours[k]), "cluster": int(cluster[k]) or None,
+            }
+            for k in significant
+        ])
+
+    table = HotspotRegion.__table__
+    key = (table.c.state == state) & (table.c.standards_version == version)
+    db.execute(table.update().where(key).values(
+        samples=len(ids),
+        mean_hpi=float(hpi.mean()) if len(hpi) else None,
+        std_hpi=float(hpi.std()) if len(hpi) else None,
+        distance_km=settings.HOTSPOT_DISTANCE_KM,
+        hot_spots=int((z >= CONFIDENCE_Z[95]).sum()),
+        cold_spots=int((z <= -CONFIDENCE_Z[95]).sum()),
+        clusters=int(cluster.max()) if len(cluster) else 0,
+        computed_at=datetime.utcnow(),
+    ))
+    # States marked again while this ran stay stale for the next run
+    db.execute(table.update().where(key, table.c.generation == generation).values(stale=False))
+    return len(ids)
+
+
+def _latest(db: Session, version: Optional[int], state: Optional[str] = None):
+    """Newest computed run per state at or below `version` (the current one when omitted)."""
+    version = _version(db) if version is None else version
+    newest = (
+        select(HotspotRegion.state, func.max(HotspotRegion.standards_version).label("version"))
+        .where(HotspotRegion.standards_version <= version, HotspotRegion.computed_at.isnot(None))
+        .group_by(HotspotRegion.state)
+        .subquery()
+    )
+    query = select(HotspotRegion).join(
+        newest, (HotspotRegion.state == newest.c.state) & (HotspotRegion.standards_version == newest.c.version)
+    )
+    if state is not None:
+        query = query.where(HotspotRegion.state == state)
+    pending = set(db.scalars(
+        select(HotspotRegion.state).where(HotspotRegion.stale.is_(True), HotspotRegion.standards_version <= version)
+    ).all())
+    return db.scalars(query.order_by(HotspotRegion.state)).all(), pending
+
+
+def _summary(region: HotspotRegion, pending: set) -> dict:
+    return {
+        "state": region.state,
+        "standards_version": region.standards_version or None,
+        "samples": region.samples,
+        "mean_hpi": region.mean_hpi,
+        "std_hpi": region.std_hpi,
+        "distance_km": region.distance_km,
+        "hot_spots": region.hot_spots,
+        "cold_spots": region.cold_spots,
+        "cluster_count": region.clusters,
+        "computed_at": region.computed_at,
+        # Samples changed since; a fresh run is queued
+        "stale": region.state in pending,
+    }
+
+
+def regions(db: Session, version: Optional[int] = None) -> List[dict]:
+    found, pending = _latest(db, version)
+    return [_summary(region, pending) for region in found]
+
+
+def detail(db: Session, state: str, version: Optional[int] = None, min_confidence: int = 95, kind: str = "all", limit: int = 1000) -> Optional[dict]:
+    """One state's run: its summary, hot spot clusters and the significant samples (strongest first)."""
+    found, pending = _latest(db, version, state)
+    if not found:
+        return None
+    region = found[0]
+    rows = db.execute(
+        select(
+            HotspotSample.sample_id, HotspotSample.z_score, HotspotSample.p_value, HotspotSample.neighbours,
+            HotspotSample.cluster, Sample.lat, Sample.lng, Sample.location_name, Sample.district, RiskAssessment.hpi,
+        )
+        .join(Sample, Sample.id == HotspotSample.sample_id)
+        .outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .where(HotspotSample.state == state, HotspotSample.standards_version == region.standards_version)
+    ).all()
+
+    clusters = {}
+    for row in rows:
+        if row.cluster is None:
+            continue
+        entry = clusters.setdefault(row.cluster, {"lat": [], "lng": [], "hpi": [], "z": []})
+        entry["lat"].append(row.lat)
+        entry["lng"].append(row.lng)
+        entry["hpi"].append(row.hpi if row.hpi is not None else np.nan)
+        entry["z"].append(row.z_score)
+
+    threshold = CONFIDENCE_Z[min_confidence]
+    spots = [
+        row for row in rows
+        if abs(row.z_score) >= threshold and (kind == "all" or (row.z_score > 0) == (kind == "hot"))
+    ]
+    spots.sort(key=lambda row: -abs(row.z_score))
+    return {
+        **_summary(region, pending),
+        "clusters": [
+            {
+                "cluster": number,
+                "samples": len(entry["z"]),
+                "lat": float(np.mean(entry["lat"])),
+                "lng": float(np.mean(entry["lng"])),
+                "bbox": [min(entry["lng"]), min(entry["lat"]), max(entry["lng"]), max(entry["lat"])],
+                "mean_hpi": float(np.nanmean(entry["hpi"])) if not np.isnan(entry["hpi"]).all() else None,
+                "max_z_score": max(entry["z"]),
+            }
+            for number, entry in sorted(clusters.items())
+        ],
+        "spots": [
+            {
+                "sample_id": row.sample_id,
+                "lat": row.lat,
+                "lng": row.lng,
+                "location_name": row.location_name,
+                "district": row.district,
+                "hpi": row.hpi,
+                "z_score": row.z_score,
+                "p_value": row.p_value,
+                "neighbours": row.neighbours,
+                "type": "hot" if row.z_score > 0 else "cold",
+                "confidence": max(level for level, z in CONFIDENCE_Z.items() if abs(row.z_score) >= z),
+                "cluster": row.cluster,
+            }
+            for row in spots[:limit]
+        ],
+    }
@@ -0,0 +1,399 @@
+import csv
+import io
+import itertools
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.bulk import dialect_insert
+from app.db.models.sample import Sample, Measurement, SourceType
+from app.services import cache, dashboard, geo, tiles
+
+try:
+    # Optional: Parquet and Arrow IPC / Feather uploads
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    # Optional: Excel uploads
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Accepted upload extensions and the reader for each
+UPLOAD_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".feather": "arrow",
+    ".arrow": "arrow",
+    ".ipc": "arrow",
+    ".xlsx": "xlsx",
+}
+
+@dataclass
+class ColumnMap:
+    """Which DataFrame columns hold coordinates, metadata and metal readings."""
+    lat: Optional[str] = None
+    lng: Optional[str] = None
+    time: Optional[str] = None
+    location: Optional[str] = None
+    state: Optional[str] = None
+    district: Optional[str] = None
+    # Metal columns (e.g. As (ppb), Fe (ppm))
+    metals: List[str] = field(default_factory=list)
+
+    @classmethod
+    def detect(cls, columns) -> "ColumnMap":
+        def find(*keys):
+            return next((c for c in columns if any(k in c.lower() for k in keys)), None)
+
+        return cls(
+            lat=find("lat"),
+            lng=find("long", "lng"),
+            time=find("year", "date", "time"),
+            location=find("location", "site"),
+            state=find("state"),
+            district=find("district"),
+            metals=[c for c in columns if "(ppb)" in c.lower() or "(ppm)" in c.lower()],
+        )
+
+
+@dataclass
+class IngestResult:
+    sample_ids: List[int] = field(default_factory=list)
+    rows_read: int = 0
+    # Rows already stored (or repeated within the upload)
+    duplicates: int = 0
+    # Rows without usable coordinates
+    invalid: int = 0
+
+
+def metal_name(column: str) -> str:
+    """'As (ppb)' -> 'As'"""
+    return re.split(r"\(", column)[0].strip()
+
+
+def _text_column(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    if not col:
+        return pd.Series("Unknown", index=df.index, dtype=object)
+    return df[col].astype(object).where(df[col].notna(), "Unknown").astype(str)
+
+
+def _coordinate_column(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    if not col:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[col], errors="coerce")
+
+
+def _timestamp_column(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    now = pd.Timestamp.now()
+    if not col:
+        return pd.Series(now, index=df.index)
+
+    raw = df[col]
+    timestamps = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    if "year" in col.lower():
+        # If only Year is provided, use Jan 1st
+        years = pd.to_numeric(raw, errors="coerce")
+        is_year = years.notna() & (years % 1 == 0)
+        if is_year.any():
+            parts = pd.DataFrame({"year": years[is_year].astype(int), "month": 1, "day": 1})
+            timestamps[is_year] = pd.to_datetime(parts, errors="coerce")
+
+    missing = timestamps.isna() & raw.notna()
+    if missing.any():
+        parsed = pd.to_datetime(raw[missing], errors="coerce")
+        if getattr(parsed.dt, "tz", None) is not None:
+            parsed = parsed.dt.tz_localize(None)
+        timestamps[missing] = parsed
+
+    return timestamps.fillna(now)
+
+
+def normalize_frame(df: pd.DataFrame, columns: ColumnMap):
+    """
+    Column-wise parse of a raw upload frame.
+    Returns (samples, measurements): one row per valid sample, and the metal
+    readings melted into long form with `row` pointing at the sample's position.
+    Concentrations are converted to mg/L.
+    """
+    samples = pd.DataFrame({
+        "lat": _coordinate_column(df, columns.lat),
+        "lng": _coordinate_column(df, columns.lng),
+        "location_name": _text_column(df, columns.location),
+        "state": _text_column(df, columns.state),
+        "district": _text_column(df, columns.district),
+        "timestamp": _timestamp_column(df, columns.time),
+    })
+    valid = samples["lat"].notna() & samples["lng"].notna()
+
+    if columns.metals:
+        values = df[columns.metals].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        # ppb to mg/L
+        scale = np.array([0.001 if "(ppb)" in c.lower() else 1.0 for c in columns.metals])
+        values = values * scale
+    else:
+        values = np.empty((len(df), 0))
+
+    samples = samples[valid.to_numpy()].reset_index(drop=True)
+    values = values[valid.to_numpy()]
+    names = np.array([metal_name(c) for c in columns.metals], dtype=object)
+
+    rows, cols = np.nonzero(~np.isnan(values))
+    measurements = pd.DataFrame({
+        "row": rows,
+        "metal": names[cols] if len(names) else np.array([], dtype=object),
+        "concentration": values[rows, cols],
+    })
+    return samples, measurements
+
+
+# Keys of the two 64-bit hashes that make up a 128-bit natural key (16 bytes each)
+_NATURAL_KEY_SEEDS = ("metalsense:key:0", "metalsense:key:1")
+_HEX_DIGITS = np.array(list("0123456789abcdef"))
+
+
+def natural_keys(samples: pd.DataFrame) -> pd.Series:
+    """Stable hash of the columns that identify a physical sample (lat, lng, timestamp, location_name), per row."""
+    timestamps = pd.to_datetime(samples["timestamp"])
+    if timestamps.dt.tz is not None:
+        # Stored as a naive DateTime, so the key uses the wall-clock value too
+        timestamps = timestamps.dt.tz_localize(None)
+    columns = pd.DataFrame({
+        # -0.0 and 0.0 are the same coordinate but hash differently
+        "lat": samples["lat"].to_numpy(dtype=float) + 0.0,
+        "lng": samples["lng"].to_numpy(dtype=float) + 0.0,
+        # Same resolution whether the values come from a parsed upload or the database
+        "timestamp": timestamps.astype("datetime64[ns]").to_numpy(),
+        "location_name": samples["location_name"].fillna("").astype(str).to_numpy(dtype=object),
+    })
+    hashes = np.stack(
+        [pd.util.hash_pandas_object(columns, index=False, hash_key=seed).to_numpy() for seed in _NATURAL_KEY_SEEDS],
+        axis=1,
+    )
+    # 32 hex digits per row, most significant nibble first
+    nibbles = (hashes.astype(">u8").view(np.uint8).reshape(len(columns), 16, 1) >> np.array([4, 0], dtype=np.uint8)) & 0xF
+    digits = np.ascontiguousarray(_HEX_DIGITS[nibbles.reshape(len(columns), 32)])
+    return pd.Series(digits.view("<U32").reshape(len(columns)), index=samples.index, dtype=object)
+
+
+def natural_key(lat: float, lng: float, timestamp, location_name: Optional[str]) -> str:
+    """The natural key of a single sample, as `natural_keys` computes it."""
+    row = pd.DataFrame({"lat": [lat], "lng": [lng], "timestamp": [pd.Timestamp(timestamp)], "location_name": [location_name]})
+    return natural_keys(row).iloc[0]
+
+
+def _copy_measurements(db: Session, frame: pd.DataFrame) -> bool:
+    """Stream measurement rows with COPY on Postgres. Returns False if the driver can't."""
+    conn = db.connection()
+    if conn.dialect.name != "postgresql":
+        return False
+
+    buf = io.StringIO()
+    frame.to_csv(buf, index=False, header=False, quoting=csv.QUOTE_MINIMAL)
+    buf.seek(0)
+    sql = "COPY measurements (sample_id, metal, concentration) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        if conn.dialect.driver == "psycopg2":
+            cursor.copy_expert(sql, buf)
+        elif conn.dialect.driver == "psycopg":
+            with cursor.copy(sql) as copy:
+                copy.write(buf.getvalue())
+        else:
+            return False
+    finally:
+        cursor.close()
+    return True
+
+
+def write_samples(
+    db: Session,
+    samples: pd.DataFrame,
+    measurements: pd.DataFrame,
+    dataset_id: Optional[int] = None,
+    source_type: SourceType = SourceType.GROUNDWATER,
+) -> List[int]:
+    """
+    Set-based insert of a normalized chunk: one multi-row
+    INSERT ... ON CONFLICT (natural_key) DO NOTHING RETURNING for samples,
+    then COPY (or executemany) for the measurements of rows that were inserted.
+    Returns the new sample ids; rows already stored are silently skipped.
+    """
+    if samples.empty:
+        return []
+
+    if "natural_key" not in samples:
+        samples = samples.assign(natural_key=natural_keys(samples))
+    if "geohash" not in samples:
+        samples = samples.assign(geohash=geo.encode_many(samples["lat"].to_numpy(), samples["lng"].to_numpy()))
+    records = samples.assign(dataset_id=dataset_id, source_type=source_type).to_dict("records")
+
+    # Core table inserts skip the ORM unit-of-work bookkeeping entirely
+    samples_table = Sample.__table__
+    stmt = (
+        dialect_insert(db, samples_table)
+        .on_conflict_do_nothing(index_elements=["natural_key"])
+        .returning(samples_table.c.id, samples_table.c.natural_key)
+    )
+    inserted = {key: sample_id for sample_id, key in db.execute(stmt, records)}
+    if not inserted:
+        return []
+
+    sample_ids = samples["natural_key"].map(inserted).to_numpy(dtype=float)
+    is_new = ~np.isnan(sample_ids)
+
+    if not measurements.empty:
+        rows = measurements["row"].to_numpy()
+        keep = is_new[rows]
+        frame = pd.DataFrame({
+            "sample_id": sample_ids[rows[keep]].astype(np.int64),
+            "metal": measurements["metal"].to_numpy()[keep],
+            "concentration": measurements["concentration"].to_numpy()[keep],
+        })
+        if not frame.empty and not _copy_measurements(db, frame):
+            db.execute(insert(Measurement.__table__), frame.to_dict("records"))
+    else:
+        frame = pd.DataFrame({"metal": [], "concentration": []})
+
+    new_ids = sample_ids[is_new].astype(np.int64).tolist()
+    uploader_id = dashboard.record_samples(db, dataset_id, new_ids, frame)
+    cache.bump(db, cache.SAMPLES, *([cache.researcher_scope(uploader_id)] if uploader_id is not None else []))
+    # Map tiles count samples before they are assessed, so the ones holding these are stale already
+    tiles.invalidate_points(db, samples["lat"].to_numpy()[is_new], samples["lng"].to_numpy()[is_new])
+    return new_ids
+
+
+def ingest_frame(db: Session, df: pd.DataFrame, columns: ColumnMap, dataset_id: Optional[int] = None) -> IngestResult:
+    """Normalize, de-duplicate and bulk-write one DataFrame. Does not commit."""
+    samples, measurements = normalize_frame(df, columns)
+    result = IngestResult(rows_read=len(df), invalid=len(df) - len(samples))
+
+    samples["natural_key"] = natural_keys(samples)
+    repeated = samples["natural_key"].duplicated().to_numpy()
+    if repeated.any():
+        # Re-number the surviving rows so measurement `row` still indexes into samples
+        keep = ~repeated
+        positions = np.cumsum(keep) - 1
+        measurements = measurements[keep[measurements["row"].to_numpy()]]
+        measurements = measurements.assign(row=positions[measurements["row"].to_numpy()])
+        samples = samples[keep].reset_index(drop=True)
+
+    result.sample_ids = write_samples(db, samples, measurements, dataset_id=dataset_id)
+    result.duplicates = result.rows_read - result.invalid - len(result.sample_ids)
+    return result
+
+
+def _copy_to_temp(source, suffix: str) -> str:
+    fd, path = tempfile.mkstemp(prefix="metalsense-upload-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            source.seek(0)
+            shutil.copyfileobj(source, out, settings.UPLOAD_READ_BYTES)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+async def spool_upload(file, suffix: str = "") -> str:
+    """
+    Copy an UploadFile to a temporary file on disk in one pass of
+    UPLOAD_READ_BYTES blocks, on a worker thread so the event loop isn't
+    blocked on disk writes. Caller removes the path.
+    """
+    return await run_in_threadpool(_copy_to_temp, file.file, suffix)
+
+
+def iter_csv_chunks(path: str, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Incrementally parse a CSV file; memory is bounded by the chunk size, not the file size."""
+    return pd.read_csv(path, encoding="utf-8", chunksize=chunk_rows or settings.UPLOAD_CHUNK_ROWS)
+
+
+def upload_format(filename: str) -> Optional[str]:
+    """The reader for an uploaded file name, or None if the extension isn't accepted or its library is missing."""
+    format = UPLOAD_FORMATS.get(os.path.splitext(filename or "")[1].lower())
+    if format in ("parquet", "arrow") and pa is None:
+        return None
+    if format == "xlsx" and openpyxl is None:
+        return None
+    return format
+
+
+def supported_extensions() -> List[str]:
+    return [ext for ext in UPLOAD_FORMATS if upload_format(ext)]
+
+
+def _record_batch_frames(batches, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for batch in batches:
+        # Writers choose their own batch sizes; re-slice so chunks stay bounded
+        for start in range(0, batch.num_rows, chunk_rows):
+            yield batch.slice(start, chunk_rows).to_pandas()
+
+
+def iter_parquet_chunks(path: str, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Record batches of a Parquet file, read row group by row group with their stored types."""
+    chunk_rows = chunk_rows or settings.UPLOAD_CHUNK_ROWS
+    with pq.ParquetFile(path) as parquet:
+        yield from (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunk_rows))
+
+
+def iter_arrow_chunks(path: str, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Record batches of an Arrow IPC file (Feather v2) or stream, memory-mapped rather than read into memory."""
+    chunk_rows = chunk_rows or settings.UPLOAD_CHUNK_ROWS
+    with pa.memory_map(path) as source:
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = pa.ipc.open_stream(source)
+        yield from _record_batch_frames(batches, chunk_rows)
+
+
+def iter_xlsx_chunks(path: str, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Rows of the first worksheet, streamed in read-only mode; the first row is the header."""
+    chunk_rows = chunk_rows or settings.UPLOAD_CHUNK_ROWS
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        # Headers can be numbers or blank in a spreadsheet
+        columns = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        # Formatting often leaves fully blank rows behind; they aren't samples
+        rows = (row for row in rows if any(v is not None for v in row))
+        while True:
+            block = list(itertools.islice(rows, chunk_rows))
+            if not block:
+                break
+            yield pd.DataFrame.from_records(block, columns=columns)
+    finally:
+        workbook.close()
+
+
+def is_format_error(error: Exception) -> bool:
+    """A malformed columnar file discovered mid-read (rather than a failure writing it)."""
+    return pa is not None and isinstance(error, pa.ArrowException)
+
+
+def iter_upload_chunks(path: str, format: str, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Bounded-size DataFrames of an upload in any accepted format, for ingest_frame."""
+    if format == "csv":
+        return iter_csv_chunks(path, chunk_rows)
+    readers = {"parquet": iter_parquet_chunks, "arrow": iter_arrow_chunks, "xlsx": iter_xlsx_chunks}
+    return readers[format](path, chunk_rows)
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models.job import Job
+
+
+def enqueue(db: Session, kind: str, payload: Optional[Dict[str, Any]] = None, owner_id: Optional[int] = None) -> Job:
+    """
+    Queue a job in the caller's transaction, so it only becomes visible to
+    workers if the data it refers to is committed too.
+    """
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        owner_id=owner_id,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        run_after=datetime.utcnow(),
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def enqueue_once(db: Session, kind: str) -> Optional[Job]:
+    """
+    Queue a payload-less job unless one of `kind` is already waiting to run (a
+    running one may have read its input already). Does not commit.
+    """
+    pending = select(Job.id).where(Job.kind == kind, Job.status == "queued").limit(1)
+    if db.scalar(pending) is not None:
+        return None
+    return enqueue(db, kind)
+
+
+def claim_next(db: Session, worker_id: str) -> Optional[Job]:
+    """
+    Atomically move the oldest runnable job to `running` and return it (committed).
+    Postgres uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never
+    block on each other; SQLite serializes writers, so a conditional UPDATE acts
+    as compare-and-set there.
+    """
+    now = datetime.utcnow()
+    runnable = (
+        select(Job.id)
+        .where(Job.status == "queued", Job.run_after <= now)
+        .order_by(Job.run_after, Job.id)
+        .limit(1)
+    )
+
+    if db.get_bind().dialect.name == "postgresql":
+        job_id = db.scalars(runnable.with_for_update(skip_locked=True)).first()
+        if job_id is None:
+            db.rollback()
+            return None
+        db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status="running", locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        )
+        db.commit()
+        return db.get(Job, job_id)
+
+    while True:
+        job_id = db.scalars(runnable).first()
+        if job_id is None:
+            db.rollback()
+            return None
+        claimed = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(status="running", locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(Job, job_id)
+        # Another worker won the race for this row; look again
+
+
+def mark_completed(db: Session, job: Job):
+    job.status = "completed"
+    job.finished_at = datetime.utcnow()
+    job.last_error = None
+    db.commit()
+
+
+def mark_failed(db: Session, job: Job, error: str):
+    """Re-queue with exponential backoff, or give up once max_attempts is reached."""
+    job.last_error = error
+    job.locked_by = None
+    job.locked_at = None
+    if job.attempts < job.max_attempts:
+        delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+        job.status = "queued"
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+    else:
+        job.status = "failed"
+        job.finished_at = datetime.utcnow()
+    db.commit()
+
+
+def heartbeat(db: Session, worker_ids: List[str]) -> int:
+    """
+    Refresh the locks of the jobs these workers are running, so requeue_stale
+    leaves them alone however long they take. Returns how many were refreshed.
+    """
+    count = db.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_by.in_(worker_ids))
+        .values(locked_at=datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return count
+
+
+def requeue_stale(db: Session) -> Tuple[int, int]:
+    """
+    Return jobs whose worker died mid-run (no heartbeat for JOB_LOCK_TIMEOUT_SECONDS)
+    to the queue, or fail them if that was their last attempt: a job that kills its
+    worker every time must not loop forever. Returns (requeued, failed).
+    """
+    now = datetime.utcnow()
+    stale = (Job.status == "running") & (Job.locked_at < now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS))
+    failed = db.execute(
+        update(Job)
+        .where(stale, Job.attempts >= Job.max_attempts)
+        .values(
+            status="failed", locked_by=None, locked_at=None, finished_at=now,
+            last_error="The worker running this job stopped responding on every attempt",
+        )
+    ).rowcount
+    requeued = db.execute(
+        update(Job)
+        .where(stale)
+        .values(status="queued", locked_by=None, locked_at=None, run_after=now)
+    ).rowcount
+    db.commit()
+    return requeued, failed
+
+
+def list_jobs(db: Session, owner_id: Optional[int] = None, status: Optional[str] = None, limit: int = 100) -> List[Job]:
+    query = db.query(Job)
+    if owner_id is not None:
+        query = query.filter(Job.owner_id == owner_id)
+    if status:
+        query = query.filter(Job.status == status)
+    return query.order_by(Job.id.desc()).limit(limit).all()
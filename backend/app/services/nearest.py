@@ -0,0 +1,285 @@
+"""
+In-memory nearest-sample lookups ("risk near me").
+
+Every assessed sample is held in a flat grid: coordinates are bucketed into
+NEAREST_CELL_DEGREES cells and the arrays are sorted by cell, so the cells a
+search circle touches are one contiguous slice per grid row. A lookup is
+numpy over those slices (haversine, then a partial sort) and never touches
+the database.
+
+The index is an immutable snapshot that the refresher replaces. Every
+NEAREST_REFRESH_SECONDS it checks, with two small queries, for new
+assessments and appends them. Re-assessments and deletions bump the REWRITES
+generation instead, and the index is rebuilt from scratch.
+
+Assessment ids are taken at insert but become visible at commit, so a
+concurrent chunk can commit ids below the index's watermark. The ids skipped
+over are re-checked for NEAREST_GAP_SECONDS before they are given up on, as
+the event broker does.
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample
+from app.services import cache, geo
+
+COLUMNS = ("assessment_id", "sample_id", "lat", "lng", "location_name", "state", "district", "hpi", "risk_category", "is_safe")
+
+
+def _index_select():
+    return (
+        select(
+            RiskAssessment.id, Sample.id, Sample.lat, Sample.lng, Sample.location_name,
+            Sample.state, Sample.district, RiskAssessment.hpi, RiskAssessment.risk_category, RiskAssessment.is_safe,
+        )
+        .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .order_by(RiskAssessment.id)
+    )
+
+
+def _columns(rows) -> Dict[str, np.ndarray]:
+    values = dict(zip(COLUMNS, zip(*rows))) if rows else {name: () for name in COLUMNS}
+    out = {}
+    for name in COLUMNS:
+        if name in ("assessment_id", "sample_id"):
+            out[name] = np.array(values[name], dtype=np.int64)
+        elif name in ("lat", "lng", "hpi"):
+            out[name] = np.array(values[name], dtype=float)  # None becomes NaN
+        else:
+            out[name] = np.array(values[name], dtype=object)
+    return out
+
+
+def id_holes(lo: int, hi: int, ids: np.ndarray) -> List[Tuple[int, int]]:
+    """Inclusive ranges of lo..hi that are missing from the sorted, unique `ids`."""
+    inside = ids[(ids >= lo) & (ids <= hi)]
+    bounds = np.concatenate([[lo - 1], inside, [hi + 1]]).astype(np.int64)
+    starts, ends = bounds[:-1] + 1, bounds[1:] - 1
+    keep = starts <= ends
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
+
+
+def grid_shape(cell_degrees: float):
+    """(rows, columns) of the global grid."""
+    return int(math.ceil(180.0 / cell_degrees)), int(math.ceil(360.0 / cell_degrees))
+
+
+def cell_ids(lat: np.ndarray, lng: np.ndarray, cell_degrees: float) -> np.ndarray:
+    """Row-major grid cell of each point."""
+    n_rows, n_cols = grid_shape(cell_degrees)
+    row = np.clip(((lat + 90.0) // cell_degrees).astype(np.int64), 0, n_rows - 1)
+    col = np.clip(((lng + 180.0) // cell_degrees).astype(np.int64), 0, n_cols - 1)
+    return row * n_cols + col
+
+
+@dataclass(frozen=True)
+class GridIndex:
+    """Sample columns sorted by grid cell; `cells` is the sorted cell id of each row."""
+    cell_degrees: float
+    cells: np.ndarray
+    columns: Dict[str, np.ndarray]
+
+    @property
+    def n_rows(self) -> int:
+        return grid_shape(self.cell_degrees)[0]
+
+    @property
+    def n_cols(self) -> int:
+        return grid_shape(self.cell_degrees)[1]
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def watermark(self) -> int:
+        """Highest assessment id in the index (0 when empty)."""
+        ids = self.columns["assessment_id"]
+        return int(ids.max()) if len(ids) else 0
+
+    @classmethod
+    def build(cls, columns: Dict[str, np.ndarray], cell_degrees: float) -> "GridIndex":
+        located = ~(np.isnan(columns["lat"]) | np.isnan(columns["lng"]))
+        columns = {name: values[located] for name, values in columns.items()}
+        cells = cell_ids(columns["lat"], columns["lng"], cell_degrees)
+        order = np.argsort(cells, kind="stable")
+        return cls(cell_degrees, cells[order], {name: values[order] for name, values in columns.items()})
+
+    def merge(self, columns: Dict[str, np.ndarray]) -> "GridIndex":
+        """A new index with `columns` added; rows for samples already present are replaced."""
+        if not len(columns["sample_id"]):
+            return self
+        keep = ~np.isin(self.columns["sample_id"], columns["sample_id"])
+        merged = {name: np.concatenate([self.columns[name][keep], columns[name]]) for name in COLUMNS}
+        return GridIndex.build(merged, self.cell_degrees)
+
+    def candidates(self, lat: float, lng: float, radius_km: float) -> np.ndarray:
+        """Row positions of every sample in a cell the circle may reach."""
+        d, n_cols = self.cell_degrees, self.n_cols
+        angle = radius_km / geo.EARTH_RADIUS_KM
+        dlat = math.degrees(angle)
+        lo_row = max(int((lat - dlat + 90.0) // d), 0)
+        hi_row = min(int((lat + dlat + 90.0) // d), self.n_rows - 1)
+
+        # Widest longitude reached by the circle; all of it near a pole
+        reach = math.sin(angle) / max(math.cos(math.radians(lat)), 1e-12)
+        if angle >= math.pi / 2 or reach >= 1.0 or abs(lat) + dlat >= 90.0:
+            spans = [(0, n_cols - 1)]
+        else:
+            dlng = math.degrees(math.asin(reach))
+            lo_col, hi_col = int((lng - dlng + 180.0) // d), int((lng + dlng + 180.0) // d)
+            if hi_col - lo_col + 1 >= n_cols:
+                spans = [(0, n_cols - 1)]
+            elif lo_col < 0:
+                spans = [(lo_col + n_cols, n_cols - 1), (0, hi_col)]
+            elif hi_col >= n_cols:
+                spans = [(lo_col, n_cols - 1), (0, hi_col - n_cols)]
+            else:
+                spans = [(lo_col, hi_col)]
+
+        rows = np.arange(lo_row, hi_row + 1, dtype=np.int64) * n_cols
+        lows = np.concatenate([rows + a for a, _ in spans])
+        highs = np.concatenate([rows + b + 1 for _, b in spans])
+        starts = np.searchsorted(self.cells, lows)
+        ends = np.searchsorted(self.cells, highs)
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        # Concatenated aranges of every [start, end) slice
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total)
+
+    def nearest(self, lat: float, lng: float, k: int, radius_km: float):
+        """(row positions, distances in km) of the k nearest samples within radius_km, nearest first."""
+        rows = self.candidates(lat, lng, radius_km)
+        distances = geo.haversine_km(lat, lng, self.columns["lat"][rows], self.columns["lng"][rows])
+        inside = distances <= radius_km
+        rows, distances = rows[inside], distances[inside]
+        if len(rows) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+            rows, distances = rows[top], distances[top]
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+    def records(self, rows: np.ndarray, distances: np.ndarray) -> List[dict]:
+        c = self.columns
+        return [
+            {
+                "sample_id": int(c["sample_id"][r]),
+                "lat": float(c["lat"][r]),
+                "lng": float(c["lng"][r]),
+                "location_name": c["location_name"][r],
+                "state": c["state"][r],
+                "district": c["district"][r],
+                "distance_km": round(float(dist), 3),
+                "hpi": None if np.isnan(c["hpi"][r]) else float(c["hpi"][r]),
+                "risk_category": c["risk_category"][r],
+                "is_safe": c["is_safe"][r],
+            }
+            for r, dist in zip(rows.tolist(), distances)
+        ]
+
+
+class NearestIndex:
+    """The process-wide index: built on first use, refreshed by `refresh()`. Lookups never block on a refresh."""
+
+    def __init__(self, cell_degrees: float):
+        self.cell_degrees = cell_degrees
+        self._grid: Optional[GridIndex] = None
+        self._rewrites: Optional[int] = None
+        self._gaps: List[Tuple[int, int, float]] = []  # Skipped id range (inclusive) -> when it was first missed
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def grid(self) -> GridIndex:
+        grid = self._grid
+        if grid is None:
+            self.refresh()
+            grid = self._grid
+        return grid
+
+    def nearest(self, lat: float, lng: float, k: int, radius_km: float) -> List[dict]:
+        grid = self.grid()
+        return grid.records(*grid.nearest(lat, lng, k, radius_km))
+
+    def _load(self, db: Session, clause=None) -> Dict[str, np.ndarray]:
+        query = _index_select()
+        if clause is not None:
+            query = query.where(clause)
+        return _columns(db.execute(query).all())
+
+    def _track_gaps(self, watermark: Optional[int], ids: np.ndarray, now: float):
+        """Drop the gap ids found in `ids`, and add the ones skipped above `watermark`."""
+        ids = np.unique(ids)
+        gaps = [(a, b, missed) for lo, hi, missed in self._gaps for a, b in id_holes(lo, hi, ids)]
+        if watermark is not None and len(ids) and ids[-1] > watermark:
+            gaps += [(a, b, now) for a, b in id_holes(watermark + 1, int(ids[-1]), ids)]
+        self._gaps = gaps
+
+    def refresh(self, db: Optional[Session] = None) -> str:
+        """Bring the index up to date: 'rebuilt', 'appended' or 'current'."""
+        own = db is None
+        db = db or SessionLocal()
+        try:
+            with self._lock:
+                rewrites = cache.generations(db, [cache.REWRITES])[cache.REWRITES]
+                grid = self._grid
+                now = time.monotonic()
+                self._gaps = [gap for gap in self._gaps if now - gap[2] < settings.NEAREST_GAP_SECONDS]
+                if grid is None or rewrites != self._rewrites:
+                    columns = self._load(db)
+                    self._grid = GridIndex.build(columns, self.cell_degrees)
+                    self._rewrites = rewrites
+                    # A first build has no mark to compare against, like a broker that just started
+                    self._track_gaps(grid.watermark if grid is not None else None, columns["assessment_id"], now)
+                    return "rebuilt"
+                latest = db.scalar(select(func.max(RiskAssessment.id))) or 0
+                if latest <= grid.watermark and not self._gaps:
+                    return "current"
+                clause = or_(RiskAssessment.id > grid.watermark, *[RiskAssessment.id.between(lo, hi) for lo, hi, _ in self._gaps])
+                columns = self._load(db, clause)
+                self._track_gaps(grid.watermark, columns["assessment_id"], now)
+                if not len(columns["assessment_id"]):
+                    return "current"
+                self._grid = grid.merge(columns)
+                return "appended"
+        finally:
+            if own:
+                db.close()
+
+    def start(self, interval: float):
+        """Refresh every `interval` seconds on a daemon thread (the first pass builds the index)."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"❌ Error refreshing nearest-sample index: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=run, name="nearest-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop.clear()
+
+
+index = NearestIndex(settings.NEAREST_CELL_DEGREES)
@@ -0,0 +1,120 @@
+"""
+Bounded thread pools for blocking work started by async endpoints.
+
+An `async def` endpoint runs on the event loop, so a synchronous Session
+call or a pandas parse inside it stalls every other request of the process.
+Such work is handed to a pool here instead: at most `workers` calls run at
+once, `queue` more may wait, and anything beyond that is refused with
+PoolBusy (a 503 for the client) rather than piling up. Sync (`def`)
+endpoints already run on Starlette's threads; they use a pool (`call`) for
+work that is CPU-bound on purpose, like password hashing, so a burst of it
+can't take every core and every thread. Pool load and latencies are served
+at /api/v1/metrics (admins only).
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# Calls whose wait and run times are kept for the latency percentiles in `stats`
+TIMINGS_KEPT = 1000
+
+
+class PoolBusy(Exception):
+    """Every worker is busy and the queue is full."""
+
+
+class BoundedPool:
+    """A ThreadPoolExecutor with a limit on waiting calls. Threads start with the first call."""
+
+    def __init__(self, name: str, workers: int, queue: int):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self.running = self.waiting = 0
+        self.rejected = self.completed = 0
+        self._timings: Deque[Tuple[float, float]] = deque(maxlen=TIMINGS_KEPT)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self.running + self.waiting >= self.workers + self.queue
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call `fn(*args, **kwargs)` on a pool thread and wait for it without blocking the loop. Raises PoolBusy."""
+        return await asyncio.wrap_future(self._submit(fn, args, kwargs))
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Like `run`, for sync code (a `def` endpoint's thread): blocks until the pool has run `fn`. Raises PoolBusy."""
+        return self._submit(fn, args, kwargs).result()
+
+    def _submit(self, fn, args, kwargs) -> Future:
+        with self._lock:
+            if self.running + self.waiting >= self.workers + self.queue:
+                self.rejected += 1
+                raise PoolBusy(self.name)
+            self.waiting += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+            executor = self._executor
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            with self._lock:
+                self.waiting -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self._timings.append((started - submitted, finished - started))
+
+        future = executor.submit(call)
+        # A call cancelled before it started never reaches `call`; one already
+        # running finishes even if the client goes away, and keeps its slot until then
+        future.add_done_callback(lambda f: f.cancelled() and self._unqueue())
+        return future
+
+    def _unqueue(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def stats(self) -> dict:
+        """Current load, and the time calls spent waiting for a thread and running over the last TIMINGS_KEPT calls."""
+        with self._lock:
+            timings = list(self._timings)
+            stats = {
+                "workers": self.workers, "queue": self.queue, "running": self.running, "waiting": self.waiting,
+                "rejected": self.rejected, "completed": self.completed,
+            }
+        for k, name in enumerate(("wait_ms", "run_ms")):
+            durations = sorted(t[k] * 1000 for t in timings)
+            stats[name] = {
+                q: round(durations[min(len(durations) - 1, int(len(durations) * p))], 3) if durations else None
+                for q, p in (("p50", 0.5), ("p99", 0.99))
+            }
+        return stats
+
+    def shutdown(self):
+        """Wait for the calls in flight, then stop the threads (the next call starts new ones)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Parsing and importing uploaded files (POST /researcher/upload-csv)
+uploads = BoundedPool("upload", settings.UPLOAD_WORKERS, settings.UPLOAD_QUEUE)
+# Password hashing and verification (login, register, password change and reset)
+passwords = BoundedPool("password-hash", settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE)
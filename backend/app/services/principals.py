@@ -0,0 +1,124 @@
+"""
+In-process cache of authenticated principals, so protected requests skip the
+JWT decode and the user query.
+
+Entries are keyed on a hash of the bearer token and live for
+AUTH_CACHE_TTL_SECONDS (never past the token's own expiry). Tokens carry the
+user's `token_generation` when issued; password changes, resets and
+deactivation bump it, which rejects every earlier token. The process that
+makes the change forgets the user's entries at once; other API processes
+notice when their entries expire, so a revoked token outlives its
+revocation there by at most the TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+
+from app.core.config import settings
+from app.db.models.user import User, UserRole
+
+# JWT claim holding the user's token generation at issue time
+GENERATION_CLAIM = "gen"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """What endpoints need to know about the caller; a detached snapshot of its User row."""
+    id: int
+    email: str
+    full_name: Optional[str]
+    role: UserRole
+    is_active: bool
+    token_generation: int
+    is_admin: bool = False
+
+    @classmethod
+    def of(cls, user: User) -> "Principal":
+        return cls(
+            user.id, user.email, user.full_name, user.role, bool(user.is_active), user.token_generation or 0, bool(user.is_admin)
+        )
+
+
+def token_claims(user) -> dict:
+    """Claims identifying `user` (a User or Principal) in a new token."""
+    return {"sub": user.email, GENERATION_CLAIM: user.token_generation or 0}
+
+
+def revoke_tokens(user: User):
+    """Invalidate every token issued to `user` so far. Does not commit; call `principal_cache.forget` after committing."""
+    user.token_generation = (user.token_generation or 0) + 1
+
+
+@dataclass
+class _Entry:
+    principal: Principal
+    expires: float  # time.time() after which the entry is not used
+
+
+class PrincipalCache:
+    """Size-bounded LRU of token hash -> Principal with expiry. Thread-safe."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, _Entry]" = OrderedDict()
+        self._by_user: Dict[int, Set[bytes]] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= time.time():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.principal
+
+    def put(self, token: str, principal: Principal, token_expires: Optional[float] = None):
+        """Cache `principal` for `token` until the TTL or the token's `exp`, whichever comes first."""
+        expires = time.time() + self.ttl_seconds
+        if token_expires is not None:
+            expires = min(expires, token_expires)
+        key = self.key(token)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(principal, expires)
+            self._by_user.setdefault(principal.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def forget(self, user_id: int):
+        """Drop every cached token of one user (after changing it)."""
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+
+    def _drop(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_user.get(entry.principal.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry.principal.id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
@@ -0,0 +1,440 @@
+"""
+Interpolated risk surface: HPI and each metal's concentration, spread from
+assessed samples onto a regular lat/lng grid by inverse-distance weighting
+(IDW), and served as coloured heatmap tiles.
+
+The global grid has RASTER_CELL_DEGREES cells, grouped into square blocks of
+RASTER_BLOCK_CELLS. Each state gets a float32 (layers x rows x cols) file
+covering the blocks its samples can reach. A cell holds the IDW mean of the
+samples within IDW_RADIUS_KM of its centre, or NaN when there are none.
+Neighbours are found by binning samples into grid cells, so a block is a few
+bincounts over (sample, cell) pairs. The grid does not wrap at the antimeridian.
+
+Assessments and deletions mark the blocks around their samples dirty. The
+update_rasters job recomputes only those blocks and writes each affected
+state's file under a new version.
+"""
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.constants import METAL_INDEX, METAL_ORDER
+from app.db.bulk import dialect_insert
+from app.db.models.raster import RasterDirtyBlock, RasterRegion
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Measurement, Sample
+from app.services import cache, geo, jobs, sample_query
+from app.services import standards as standards_registry
+
+LAYERS = ("hpi",) + METAL_ORDER
+LAYER_INDEX = {layer: i for i, layer in enumerate(LAYERS)}
+
+UNKNOWN = "Unknown"
+
+# Floor on distances, so a sample at a cell centre dominates it without dividing by zero
+MIN_DISTANCE_KM = 0.05
+
+# Largest raster kept for one state (cells per layer); beyond that its coordinates are suspect
+MAX_REGION_CELLS = 4_000_000
+
+# Samples interpolated per batch of (sample, cell) pairs
+_PAIR_BATCH = 4096
+
+# Blocks per side of the groups whose samples are loaded in one query
+GROUP_BLOCKS = 4
+
+TILE_SIZE = 256
+
+# Colour ramp over value / reference (HPI 100, or the metal's MAC): green, yellow, orange, red
+_RAMP_STOPS = [0.0, 0.5, 1.0, 2.0]
+_RAMP_COLOURS = np.array([(26, 152, 80), (217, 239, 139), (252, 141, 89), (215, 48, 39)], dtype=float)
+_ALPHA = 170
+
+Block = Tuple[int, int]
+
+
+def layer_key(layer: str) -> Optional[str]:
+    """'hpi', or a metal symbol or name -> its layer; None if there is no such layer."""
+    key = layer if layer == "hpi" else standards_registry.metal_key(layer)
+    return key if key in LAYER_INDEX else None
+
+
+def _grid() -> Tuple[float, int, int, int]:
+    """(cell degrees, block cells, block rows, block cols) of the global grid."""
+    d, b = settings.RASTER_CELL_DEGREES, settings.RASTER_BLOCK_CELLS
+    return d, b, int(math.ceil(math.ceil(180.0 / d) / b)), int(math.ceil(math.ceil(360.0 / d) / b))
+
+
+def _lat_margin() -> float:
+    return math.degrees(settings.IDW_RADIUS_KM / geo.EARTH_RADIUS_KM)
+
+
+def _lng_margin(lat) -> np.ndarray:
+    """Longitude span of the search radius at `lat` (its widest point, nearer the pole)."""
+    mlat = _lat_margin()
+    return mlat / np.maximum(np.cos(np.radians(np.minimum(np.abs(lat) + mlat, 90.0))), 1e-6)
+
+
+def touched_blocks(lat: Iterable[float], lng: Iterable[float]) -> Set[Block]:
+    """Blocks with a cell centre that may lie within IDW_RADIUS_KM of any of the points."""
+    lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+    located = ~(np.isnan(lat) | np.isnan(lng))
+    lat, lng = lat[located], lng[located]
+    if not len(lat):
+        return set()
+    d, b, n_rows, n_cols = _grid()
+    span = d * b
+    mlat, mlng = _lat_margin(), _lng_margin(lat)
+    r0 = np.clip(((lat - mlat + 90.0) // span).astype(np.int64), 0, n_rows - 1)
+    r1 = np.clip(((lat + mlat + 90.0) // span).astype(np.int64), 0, n_rows - 1)
+    c0 = np.clip(((lng - mlng + 180.0) // span).astype(np.int64), 0, n_cols - 1)
+    c1 = np.clip(((lng + mlng + 180.0) // span).astype(np.int64), 0, n_cols - 1)
+    keys = []
+    for dr in range(int((r1 - r0).max()) + 1):
+        for dc in range(int((c1 - c0).max()) + 1):
+            pick = (r0 + dr <= r1) & (c0 + dc <= c1)
+            keys.append((r0[pick] + dr) * n_cols + c0[pick] + dc)
+    return {(int(k // n_cols), int(k % n_cols)) for k in np.unique(np.concatenate(keys))}
+
+
+def queue_update(db: Session):
+    """Queue update_rasters unless one is already waiting to run. Does not commit."""
+    jobs.enqueue_once(db, "update_rasters")
+
+
+def mark_dirty(db: Session, lat: Iterable[float], lng: Iterable[float]):
+    """Flag the blocks around these points for re-interpolation and queue the job. Does not commit."""
+    blocks = touched_blocks(lat, lng)
+    if not blocks:
+        return
+    table = RasterDirtyBlock.__table__
+    db.execute(
+        dialect_insert(db, table).on_conflict_do_update(
+            index_elements=["block_row", "block_col"], set_={"generation": table.c.generation + 1}
+        ),
+        # Sorted, so concurrent writers lock rows in the same order
+        [{"block_row": r, "block_col": c, "generation": 0} for r, c in sorted(blocks)],
+    )
+    queue_update(db)
+
+
+def _block_box(block: Block) -> geo.BBox:
+    """The block's cells plus the search radius: every sample that can reach them lies inside."""
+    d, b, _, _ = _grid()
+    south, west = -90.0 + block[0] * b * d, -180.0 + block[1] * b * d
+    north, east = south + b * d, west + b * d
+    mlat, mlng = _lat_margin(), float(_lng_margin(max(abs(south), abs(north))))
+    return geo.BBox(max(west - mlng, -180.0), max(south - mlat, -90.0), min(east + mlng, 180.0), min(north + mlat, 90.0))
+
+
+def _samples_near(db: Session, box: geo.BBox) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(lat, lng, values) of the assessed samples in `box`; values is (samples x LAYERS), NaN where unmeasured."""
+    located = db.execute(
+        select(Sample.id, Sample.lat, Sample.lng, RiskAssessment.hpi)
+        .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .where(sample_query.bbox_clause(box))
+        .order_by(Sample.id)
+    ).all()
+    if not located:
+        return np.empty(0), np.empty(0), np.empty((0, len(LAYERS)))
+    ids, lat, lng, hpi = zip(*located)
+    values = np.full((len(ids), len(LAYERS)), np.nan)
+    values[:, 0] = np.array(hpi, dtype=float)
+
+    index = pd.Index(ids)
+    for start in range(0, len(ids), settings.RISK_BATCH_SIZE):
+        # By id rather than joined to the box: the box's range scans don't help a join
+        readings = db.execute(
+            select(Measurement.sample_id, Measurement.metal, Measurement.concentration)
+            .where(Measurement.sample_id.in_(ids[start:start + settings.RISK_BATCH_SIZE]))
+            .order_by(Measurement.id)
+        ).all()
+        if not readings:
+            continue
+        sample_ids, labels, concentrations = zip(*readings)
+        rows = index.get_indexer(sample_ids)
+        names = pd.Series(labels)
+        cols = names.map({m: METAL_INDEX.get(standards_registry.metal_key(m)) for m in names.unique()}).to_numpy(dtype=float)
+        listed = ~np.isnan(cols)
+        # Assigned in measurement order, so a repeated metal keeps its latest reading
+        values[rows[listed], cols[listed].astype(int) + 1] = np.asarray(concentrations, dtype=float)[listed]
+    return np.array(lat, dtype=float), np.array(lng, dtype=float), values
+
+
+def interpolate(block: Block, lat: np.ndarray, lng: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """IDW of `values` at the centres of the block's cells: (LAYERS x cells x cells) float32, NaN beyond the radius."""
+    d, b, _, _ = _grid()
+    out = np.full((len(LAYERS), b * b), np.nan, dtype=np.float32)
+    if not len(lat):
+        return out.reshape(len(LAYERS), b, b)
+    south, west = -90.0 + block[0] * b * d, -180.0 + block[1] * b * d
+    centre_lat = south + (np.arange(b) + 0.5) * d
+    centre_lng = west + (np.arange(b) + 0.5) * d
+    radius = settings.IDW_RADIUS_KM
+    wr = int(math.ceil(_lat_margin() / d))
+    wc = int(math.ceil(float(_lng_margin(max(abs(south), abs(south + b * d)))) / d))
+
+    numerator = np.zeros((len(LAYERS), b * b))
+    denominator = np.zeros((len(LAYERS), b * b))
+    for start in range(0, len(lat), _PAIR_BATCH):
+        s_lat, s_lng, s_values = lat[start:start + _PAIR_BATCH], lng[start:start + _PAIR_BATCH], values[start:start + _PAIR_BATCH]
+        # Candidate rows and columns of each sample: its own cell +- the radius, or the whole block
+        if 2 * wr + 1 < b:
+            rows = ((s_lat - south) // d).astype(np.int64)[:, None] + np.arange(-wr, wr + 1)
+        else:
+            rows = np.broadcast_to(np.arange(b), (len(s_lat), b))
+        if 2 * wc + 1 < b:
+            cols = ((s_lng - west) // d).astype(np.int64)[:, None] + np.arange(-wc, wc + 1)
+        else:
+            cols = np.broadcast_to(np.arange(b), (len(s_lat), b))
+        sample = np.repeat(np.arange(len(s_lat)), rows.shape[1] * cols.shape[1])
+        row = np.repeat(rows, cols.shape[1], axis=1).ravel()
+        col = np.tile(cols, (1, rows.shape[1])).ravel()
+        inside = (row >= 0) & (row < b) & (col >= 0) & (col < b)
+        sample, row, col = sample[inside], row[inside], col[inside]
+
+        distance = geo.haversine_km(s_lat[sample], s_lng[sample], centre_lat[row], centre_lng[col])
+        near = distance <= radius
+        sample, cell, distance = sample[near], row[near] * b + col[near], distance[near]
+        weight = np.maximum(distance, MIN_DISTANCE_KM) ** -settings.IDW_POWER
+        for layer in range(len(LAYERS)):
+            v = s_values[sample, layer]
+            ok = ~np.isnan(v)
+            numerator[layer] += np.bincount(cell[ok], weights=weight[ok] * v[ok], minlength=b * b)
+            denominator[layer] += np.bincount(cell[ok], weights=weight[ok], minlength=b * b)
+
+    reached = denominator > 0
+    out[reached] = numerator[reached] / denominator[reached]
+    return out.reshape(len(LAYERS), b, b)
+
+
+def compute_blocks(db: Session, blocks: Iterable[Block]) -> Dict[Block, np.ndarray]:
+    """Interpolate blocks, loading the samples of each group of GROUP_BLOCKS x GROUP_BLOCKS blocks at once."""
+    groups: Dict[Block, List[Block]] = {}
+    for block in sorted(set(blocks)):
+        groups.setdefault((block[0] // GROUP_BLOCKS, block[1] // GROUP_BLOCKS), []).append(block)
+    computed = {}
+    for members in groups.values():
+        boxes = [_block_box(block) for block in members]
+        lat, lng, values = _samples_near(db, geo.BBox(
+            min(b.min_lng for b in boxes), min(b.min_lat for b in boxes),
+            max(b.max_lng for b in boxes), max(b.max_lat for b in boxes),
+        ))
+        for block, box in zip(members, boxes):
+            pick = (lat >= box.min_lat) & (lat <= box.max_lat) & (lng >= box.min_lng) & (lng <= box.max_lng)
+            computed[block] = interpolate(block, lat[pick], lng[pick], values[pick])
+    return computed
+
+
+def _extents(db: Session) -> Dict[str, Tuple[int, int, int, int]]:
+    """(block row, block col, block rows, block cols) each state's assessed samples can reach."""
+    state = func.coalesce(Sample.state, UNKNOWN)
+    rows = db.execute(
+        select(state, func.min(Sample.lat), func.max(Sample.lat), func.min(Sample.lng), func.max(Sample.lng))
+        .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .group_by(state)
+    ).all()
+    extents = {}
+    for name, south, north, west, east in rows:
+        if south is None or west is None:
+            continue
+        # The corners' radii bound every interior point's
+        blocks = touched_blocks([south, south, north, north], [west, east, west, east])
+        r = [k[0] for k in blocks]
+        c = [k[1] for k in blocks]
+        extents[name] = (min(r), min(c), max(r) - min(r) + 1, max(c) - min(c) + 1)
+    return extents
+
+
+def _contains(region: RasterRegion, extent: Tuple[int, int, int, int]) -> bool:
+    r, c, rows, cols = extent
+    return (
+        region.block_row <= r and region.block_col <= c
+        and r + rows <= region.block_row + region.block_rows
+        and c + cols <= region.block_col + region.block_cols
+    )
+
+
+def _file_key(state: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", state).strip("_").lower() or "region"
+    return f"{slug}-{hashlib.blake2b(state.encode('utf-8'), digest_size=4).hexdigest()}"
+
+
+def raster_path(state: str, version: int) -> str:
+    return os.path.join(settings.RASTER_DIR, f"{_file_key(state)}-v{version}.f32")
+
+
+def _shape(region: RasterRegion) -> Tuple[int, int, int]:
+    return len(LAYERS), region.block_rows * region.block_cells, region.block_cols * region.block_cells
+
+
+_open_rasters: Dict[Tuple[str, int], np.memmap] = {}
+# Tiles render on the threadpool, so several requests may open or drop maps at once
+_open_lock = threading.Lock()
+
+
+def open_raster(region: RasterRegion) -> np.memmap:
+    """Read-only map of a region's current file; kept open per (state, version)."""
+    key = (region.state, region.version)
+    with _open_lock:
+        data = _open_rasters.get(key)
+        if data is None:
+            data = np.memmap(raster_path(region.state, region.version), dtype=np.float32, mode="r", shape=_shape(region))
+            # Older versions of this state are never read again
+            for stale in [k for k in _open_rasters if k[0] == region.state]:
+                del _open_rasters[stale]
+            _open_rasters[key] = data
+    return data
+
+
+def _write(db: Session, state: str, region: Optional[RasterRegion], extent, blocks: List[Block], computed: Dict[Block, np.ndarray]):
+    """Write the state's next version: the previous file with `blocks` recomputed, or a fresh one when the extent changed."""
+    d, b, _, _ = _grid()
+    version = region.version + 1 if region is not None else 1
+    incremental = region is not None and (region.block_row, region.block_col, region.block_rows, region.block_cols) == extent
+    if region is None:
+        region = RasterRegion(state=state)
+        db.add(region)
+    region.cell_degrees, region.block_cells = d, b
+    region.block_row, region.block_col, region.block_rows, region.block_cols = extent
+
+    os.makedirs(settings.RASTER_DIR, exist_ok=True)
+    out = np.memmap(raster_path(state, version), dtype=np.float32, mode="w+", shape=_shape(region))
+    out[:] = open_raster(region)[:] if incremental else np.nan
+    for block in blocks:
+        r, c = (block[0] - region.block_row) * b, (block[1] - region.block_col) * b
+        out[:, r:r + b, c:c + b] = computed[block]
+    out.flush()
+    del out
+    region.version = version
+    region.built_at = datetime.utcnow()
+
+
+def update(db: Session) -> Tuple[int, int]:
+    """
+    Re-interpolate the dirty blocks in every state raster that covers them.
+    A state whose samples now reach beyond its raster (or that has none) is
+    built whole; a state with no samples left is dropped. Returns
+    (regions written, blocks computed). Does not commit.
+    """
+    # First, so the row lock serializes concurrent runs until commit
+    cache.bump(db, cache.RASTERS)
+    d, b, _, _ = _grid()
+    dirty = {(r, c): g for r, c, g in db.execute(select(RasterDirtyBlock.block_row, RasterDirtyBlock.block_col, RasterDirtyBlock.generation)).all()}
+    regions = {region.state: region for region in db.scalars(select(RasterRegion)).all()}
+
+    plan = []
+    for state, extent in sorted(_extents(db).items()):
+        region = regions.pop(state, None)
+        if region is not None and region.cell_degrees == d and region.block_cells == b and _contains(region, extent):
+            extent = (region.block_row, region.block_col, region.block_rows, region.block_cols)
+            blocks = [k for k in sorted(dirty) if _contains(region, (k[0], k[1], 1, 1))]
+            if not blocks:
+                continue
+        else:
+            if extent[2] * extent[3] * b * b > MAX_REGION_CELLS:
+                print(f"❌ Raster for {state} skipped: its samples span {extent[2]}x{extent[3]} blocks")
+                continue
+            blocks = [(extent[0] + r, extent[1] + c) for r in range(extent[2]) for c in range(extent[3])]
+        plan.append((state, region, extent, blocks))
+    # States without assessed samples any more
+    for region in regions.values():
+        db.delete(region)
+
+    # Overlapping states share blocks; each is interpolated once
+    computed = compute_blocks(db, [block for _, _, _, blocks in plan for block in blocks])
+    for state, region, extent, blocks in plan:
+        _write(db, state, region, extent, blocks, computed)
+
+    if dirty:
+        table = RasterDirtyBlock.__table__
+        # Blocks dirtied again while this ran keep their row for the next run
+        db.execute(
+            table.delete().where(tuple_(table.c.block_row, table.c.block_col, table.c.generation).in_([(r, c, g) for (r, c), g in dirty.items()]))
+        )
+    return len(plan), len(computed)
+
+
+def prune_files(db: Session):
+    """Delete files other than each region's current and previous version (which readers may still have open)."""
+    if not os.path.isdir(settings.RASTER_DIR):
+        return
+    keep = set()
+    for state, version in db.execute(select(RasterRegion.state, RasterRegion.version)).all():
+        keep.update({os.path.basename(raster_path(state, version)), os.path.basename(raster_path(state, version - 1))})
+    for name in os.listdir(settings.RASTER_DIR):
+        if name.endswith(".f32") and name not in keep:
+            os.remove(os.path.join(settings.RASTER_DIR, name))
+
+
+def sample_tile(db: Session, layer: str, z: int, x: int, y: int) -> np.ndarray:
+    """(TILE_SIZE x TILE_SIZE) layer values at the tile's pixel centres, NaN where no raster has data."""
+    d, b, _, _ = _grid()
+    n = 1 << z
+    frac = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lng = (x + frac) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + frac) / n))))
+    rows = ((lat + 90.0) // d).astype(np.int64)
+    cols = ((lng + 180.0) // d).astype(np.int64)
+
+    values = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+    regions = db.scalars(select(RasterRegion).where(RasterRegion.cell_degrees == d, RasterRegion.block_cells == b)).all()
+    for region in regions:
+        local_rows, local_cols = rows - region.block_row * b, cols - region.block_col * b
+        in_rows = (local_rows >= 0) & (local_rows < region.block_rows * b)
+        in_cols = (local_cols >= 0) & (local_cols < region.block_cols * b)
+        if not in_rows.any() or not in_cols.any():
+            continue
+        try:
+            data = open_raster(region)[LAYER_INDEX[layer]]
+        except FileNotFoundError:
+            continue
+        window = np.ix_(in_rows, in_cols)
+        found = data[np.ix_(local_rows[in_rows], local_cols[in_cols])]
+        # Rasters of neighbouring states overlap on the same global grid, with equal values
+        values[window] = np.where(np.isnan(values[window]), found, values[window])
+    return values
+
+
+def colourize(values: np.ndarray, reference: float) -> np.ndarray:
+    """RGBA pixels on the green-to-red ramp of values / reference; transparent where NaN."""
+    ratio = np.nan_to_num(values / reference, nan=0.0)
+    rgba = np.zeros(values.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(ratio, _RAMP_STOPS, _RAMP_COLOURS[:, channel])
+    rgba[..., 3] = np.where(np.isnan(values), 0, _ALPHA)
+    return rgba
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Minimal 8-bit RGBA PNG (no filtering), to avoid an imaging dependency."""
+    height, width, _ = rgba.shape
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1).tobytes()
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def render_tile(db: Session, layer: str, z: int, x: int, y: int) -> bytes:
+    """Heatmap PNG of one Web Mercator tile, coloured against HPI 100 or the metal's default-standard MAC."""
+    if layer == "hpi":
+        reference = 100.0
+    else:
+        _, arrays = standards_registry.load_standards(db)
+        reference = float(arrays.mac[0, METAL_INDEX[layer]]) or 1.0
+    return encode_png(colourize(sample_tile(db, layer, z, x, y), reference))
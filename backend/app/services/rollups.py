@@ -0,0 +1,428 @@
+"""
+Administrative time-series rollups.
+
+region_stats keeps the number of assessed samples and their HPI sum per
+(state, district, month); region_metal_stats keeps the reading count, sum,
+min, max and MAC exceedances per (state, district, month, metal). Years are
+summed from months at query time, so a district's yearly trend reads at most
+twelve rows per year and metal.
+
+The first assessment in a district adds a pending rollup_regions row and
+queues a build_rollups job for it (as does startup, for data that predates
+the tables); the job builds the district from its assessed samples. From
+then on assess_samples folds each assessment in as the difference from the
+previous one. Until then the district's chunks skip their deltas: a build
+locks the district's row, so it waits for chunks in flight and reads them.
+Deleting a dataset drops the districts it touched and queues a rebuild,
+since a minimum or maximum can't be subtracted.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, bindparam, case, func, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.constants import METAL_INDEX
+from app.db.bulk import dialect_insert
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample, Measurement
+from app.db.models.summary import RegionMetalStats, RegionStats, RollupRegion
+from app.services import jobs
+from app.services import standards as standards_registry
+from app.services.calculator import StandardArrays
+
+# Ingestion stores a missing state/district as Unknown; samples created through the API leave them NULL
+UNKNOWN = "Unknown"
+GRANULARITIES = ("year", "month")
+LEVELS = ("district", "state", "country")
+
+CELL_KEYS = ["state", "district", "month"]
+CELL_COUNTERS = ["samples", "hpi_sum"]
+METAL_COUNTERS = ["readings", "concentration_sum", "exceedances"]
+
+Region = Tuple[str, str]
+
+
+def _region(column):
+    return func.coalesce(column, UNKNOWN)
+
+
+def _region_clause(state: str, district: str):
+    def match(column, value):
+        return or_(column == value, column.is_(None)) if value == UNKNOWN else column == value
+    return and_(match(Sample.state, state), match(Sample.district, district))
+
+
+# Columns of _sample_frame, as selected by _sample_select
+SAMPLE_COLUMNS = ["sample_id", "state", "district", "timestamp", "preference", "hpi", "version", "assessed"]
+
+
+def _sample_select():
+    return select(
+        Sample.id, _region(Sample.state), _region(Sample.district), Sample.timestamp, Sample.standard_preference,
+        RiskAssessment.hpi, RiskAssessment.standards_version, RiskAssessment.sample_id.isnot(None),
+    )
+
+
+def _sample_frame(rows) -> pd.DataFrame:
+    """Rows of _sample_select() with a yyyymm `month`."""
+    frame = pd.DataFrame(rows, columns=SAMPLE_COLUMNS)
+    timestamps = pd.to_datetime(frame["timestamp"])
+    frame["month"] = (timestamps.dt.year * 100 + timestamps.dt.month).astype(int)
+    return frame
+
+
+def _standards(db: Session, version) -> StandardArrays:
+    # Assessments made before the registry was seeded have no version and used the constants
+    return standards_registry.load_standards(db, int(version))[1] if version else StandardArrays.from_constants()
+
+
+def _exceedances(db: Session, samples: pd.DataFrame, rows: np.ndarray, readings: pd.DataFrame) -> np.ndarray:
+    """Whether each reading is above the MAC of its sample's standard, in the version the sample was assessed with."""
+    labels = readings["metal"].unique()
+    cols = readings["metal"].map({m: METAL_INDEX.get(standards_registry.metal_key(m)) for m in labels})
+    listed = cols.notna().to_numpy()
+    cols = cols.fillna(0).to_numpy(dtype=int)
+    concentration = readings["concentration"].to_numpy(dtype=float)
+    versions = samples["version"].fillna(0).to_numpy(dtype=int)[rows]
+    preferences = samples["preference"].to_numpy()[rows]
+
+    exceeds = np.zeros(len(readings), dtype=bool)
+    for version in np.unique(versions):
+        pick = (versions == version) & listed
+        if pick.any():
+            arrays = _standards(db, version)
+            exceeds[pick] = concentration[pick] > arrays.mac[arrays.standard_indices(preferences[pick]), cols[pick]]
+    return exceeds
+
+
+def contributions(db: Session, samples: pd.DataFrame, readings: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Per-cell and per-cell-metal rollup rows for assessed samples (see _sample_frame) and their readings."""
+    cells = (
+        samples.assign(samples=1, hpi_sum=samples["hpi"].astype(float).fillna(0.0))
+        .groupby(CELL_KEYS, as_index=False)[CELL_COUNTERS].sum()
+    )
+
+    rows = pd.Index(samples["sample_id"]).get_indexer(readings["sample_id"])
+    readings = readings[rows >= 0]
+    rows = rows[rows >= 0]
+    metals = readings.assign(
+        exceedances=_exceedances(db, samples, rows, readings).astype(int),
+        **{key: samples[key].to_numpy()[rows] for key in CELL_KEYS},
+    )
+    metals = metals.groupby(CELL_KEYS + ["metal"], as_index=False).agg(
+        readings=("concentration", "count"),
+        concentration_sum=("concentration", "sum"),
+        concentration_min=("concentration", "min"),
+        concentration_max=("concentration", "max"),
+        exceedances=("exceedances", "sum"),
+    )
+    return cells, metals
+
+
+def _difference(new: Tuple[pd.DataFrame, pd.DataFrame], old: Tuple[pd.DataFrame, pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """`new` minus `old` for the counters; min and max come from `new` alone (folding them again is harmless)."""
+    (new_cells, new_metals), (old_cells, old_metals) = new, old
+    cells = pd.concat([new_cells, old_cells.assign(**{c: -old_cells[c] for c in CELL_COUNTERS})])
+    cells = cells.groupby(CELL_KEYS, as_index=False)[CELL_COUNTERS].sum()
+    old_metals = old_metals.assign(
+        concentration_min=np.nan, concentration_max=np.nan, **{c: -old_metals[c] for c in METAL_COUNTERS}
+    )
+    metals = pd.concat([new_metals, old_metals]).groupby(CELL_KEYS + ["metal"], as_index=False).agg(
+        readings=("readings", "sum"),
+        concentration_sum=("concentration_sum", "sum"),
+        concentration_min=("concentration_min", "min"),
+        concentration_max=("concentration_max", "max"),
+        exceedances=("exceedances", "sum"),
+    )
+    return cells, metals
+
+
+def _fold(db: Session, cells: pd.DataFrame, metals: pd.DataFrame):
+    """Add counters to (and widen the min/max of) existing rollup rows, creating missing cells."""
+    keys = CELL_KEYS
+    if not cells.empty:
+        table = RegionStats.__table__
+        records = cells.to_dict("records")
+        db.execute(
+            dialect_insert(db, table).on_conflict_do_nothing(index_elements=keys),
+            [{**{k: r[k] for k in keys}, "samples": 0, "hpi_sum": 0.0} for r in records],
+        )
+        db.execute(
+            table.update()
+            .where(*[table.c[k] == bindparam(f"b_{k}") for k in keys])
+            .values({c: table.c[c] + bindparam(f"b_{c}") for c in CELL_COUNTERS}),
+            [{f"b_{k}": v for k, v in r.items()} for r in records],
+        )
+
+    if not metals.empty:
+        table = RegionMetalStats.__table__
+        keys = CELL_KEYS + ["metal"]
+        # NaN (no new readings) becomes NULL, which leaves the stored bound alone
+        records = metals.astype(object).where(metals.notna(), None).to_dict("records")
+        db.execute(
+            dialect_insert(db, table).on_conflict_do_nothing(index_elements=keys),
+            [{**{k: r[k] for k in keys}, "readings": 0, "concentration_sum": 0.0, "exceedances": 0} for r in records],
+        )
+        low, high = bindparam("b_concentration_min"), bindparam("b_concentration_max")
+        db.execute(
+            table.update()
+            .where(*[table.c[k] == bindparam(f"b_{k}") for k in keys])
+            .values(
+                **{c: table.c[c] + bindparam(f"b_{c}") for c in METAL_COUNTERS},
+                concentration_min=case(
+                    (or_(table.c.concentration_min.is_(None), table.c.concentration_min > low), low),
+                    else_=table.c.concentration_min,
+                ),
+                concentration_max=case(
+                    (or_(table.c.concentration_max.is_(None), table.c.concentration_max < high), high),
+                    else_=table.c.concentration_max,
+                ),
+            ),
+            [{f"b_{k}": v for k, v in r.items()} for r in records],
+        )
+
+
+def _readings(db: Session, sample_ids: List[int]) -> pd.DataFrame:
+    return pd.DataFrame(
+        db.execute(
+            select(Measurement.sample_id, Measurement.metal, Measurement.concentration)
+            .where(Measurement.sample_id.in_(sample_ids))
+        ).all(),
+        columns=["sample_id", "metal", "concentration"],
+    )
+
+
+def _mark_pending(db: Session, regions: Iterable[Region]) -> List[Region]:
+    """Add rollup_regions rows, not built yet, for districts that have none. Returns the ones added."""
+    rows = [{"state": state, "district": district, "built_at": None} for state, district in sorted(regions)]
+    if not rows:
+        return []
+    table = RollupRegion.__table__
+    return [
+        tuple(r) for r in db.execute(
+            dialect_insert(db, table)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["state", "district"])
+            .returning(table.c.state, table.c.district)
+        ).all()
+    ]
+
+
+def build(db: Session, state: str, district: str) -> bool:
+    """
+    Build one district's rollups from its assessed samples, in keyset chunks.
+    Returns False if it is already built. Does not commit.
+    """
+    _mark_pending(db, [(state, district)])
+    # Waits for chunks folding into the district, and holds back new ones until commit
+    built_at = db.scalar(
+        select(RollupRegion.built_at)
+        .where(RollupRegion.state == state, RollupRegion.district == district)
+        .with_for_update()
+    )
+    if built_at is not None:
+        return False
+    _delete_cells(db, [(state, district)])
+
+    last_id = 0
+    while True:
+        rows = db.execute(
+            _sample_select()
+            .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+            .where(_region_clause(state, district), Sample.id > last_id)
+            .order_by(Sample.id)
+            .limit(settings.RISK_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        samples = _sample_frame(rows)
+        _fold(db, *contributions(db, samples, _readings(db, samples["sample_id"].tolist())))
+        last_id = rows[-1][0]
+    table = RollupRegion.__table__
+    db.execute(
+        table.update()
+        .where(table.c.state == state, table.c.district == district)
+        .values(built_at=datetime.utcnow())
+    )
+    return True
+
+
+def built_regions(db: Session, regions: Iterable[Region]) -> Set[Region]:
+    """The built districts among `regions`, key-share locked until commit so no build of them can start meanwhile."""
+    regions = sorted(set(regions))
+    if not regions:
+        return set()
+    return set(
+        db.execute(
+            select(RollupRegion.state, RollupRegion.district)
+            .where(tuple_(RollupRegion.state, RollupRegion.district).in_(regions), RollupRegion.built_at.isnot(None))
+            .order_by(RollupRegion.state, RollupRegion.district)
+            .with_for_update(read=True, key_share=True)
+        ).all()
+    )
+
+
+def record_assessments(db: Session, sample_ids: List[int], results: Dict[str, np.ndarray], readings: Sequence[tuple]):
+    """
+    Fold a chunk of (re-)assessments into the rollups. `readings` are the
+    chunk's (sample_id, metal, concentration) rows. Districts seen for the first
+    time are queued for a build_rollups job instead, which reads this chunk
+    once it commits. Call before the new rows are written. Does not commit.
+    """
+    samples = _sample_frame(
+        db.execute(
+            _sample_select()
+            .outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+            .where(Sample.id.in_(sample_ids))
+        ).all()
+    )
+    if samples.empty:
+        return
+    regions = set(zip(samples["state"], samples["district"]))
+    added = _mark_pending(db, regions)
+    if added:
+        jobs.enqueue(db, "build_rollups", {"regions": [list(region) for region in added]})
+    built = built_regions(db, regions)
+    if len(built) < len(regions):
+        samples = samples[pd.MultiIndex.from_arrays([samples["state"], samples["district"]]).isin(list(built))]
+        if samples.empty:
+            return
+
+    positions = pd.Index(sample_ids).get_indexer(samples["sample_id"])
+    new = samples.assign(
+        hpi=np.nan_to_num(np.asarray(results["hpi"], dtype=float)[positions]),
+        version=results["standards_version"],
+    )
+    # Samples assessed before: their previous contribution is replaced
+    old = samples[samples["assessed"].astype(bool)]
+    frame = pd.DataFrame(list(readings), columns=["sample_id", "metal", "concentration"])
+    _fold(db, *_difference(contributions(db, new, frame), contributions(db, old, frame)))
+
+
+def _delete_cells(db: Session, regions: List[Region]):
+    for model in (RegionStats, RegionMetalStats):
+        db.execute(model.__table__.delete().where(tuple_(model.state, model.district).in_(regions)))
+
+
+def drop_regions(db: Session, sample_filter) -> List[Region]:
+    """
+    Drop the rollups of every district with a sample matching `sample_filter`
+    (e.g. the samples of a dataset about to be deleted). Returns the districts,
+    to be rebuilt by a build_rollups job. Does not commit.
+    """
+    regions = [
+        tuple(r) for r in db.execute(
+            select(_region(Sample.state), _region(Sample.district)).where(sample_filter).distinct()
+        ).all()
+    ]
+    if regions:
+        db.execute(
+            RollupRegion.__table__.delete().where(tuple_(RollupRegion.state, RollupRegion.district).in_(regions))
+        )
+        _delete_cells(db, regions)
+    return regions
+
+
+def unbuilt_regions(db: Session, limit: Optional[int] = None) -> List[Region]:
+    """Districts with assessed samples but no rollups, or with a build still pending."""
+    state, district = _region(Sample.state), _region(Sample.district)
+    query = (
+        select(state, district)
+        .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .outerjoin(RollupRegion, and_(RollupRegion.state == state, RollupRegion.district == district))
+        .where(RollupRegion.built_at.is_(None))
+        .distinct()
+    )
+    return [tuple(r) for r in db.execute(query.limit(limit) if limit else query).all()]
+
+
+def query(
+    db: Session,
+    state: Optional[str] = None,
+    district: Optional[str] = None,
+    metal: Optional[str] = None,
+    granularity: str = "year",
+    level: str = "district",
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> List[dict]:
+    """
+    Rollup series, one entry per region (at `level`) and period. `start` and
+    `end` are inclusive yyyymm months. `metal` accepts a symbol or a name.
+    """
+    def grouped(model):
+        period = model.month // 100 if granularity == "year" else model.month
+        groups = {"district": [model.state, model.district], "state": [model.state], "country": []}[level]
+        filters = []
+        if state:
+            filters.append(model.state == state)
+        if district:
+            filters.append(model.district == district)
+        if start:
+            filters.append(model.month >= start)
+        if end:
+            filters.append(model.month <= end)
+        return groups, period.label("period"), filters
+
+    groups, period, filters = grouped(RegionStats)
+    cells = db.execute(
+        select(*groups, period, func.sum(RegionStats.samples), func.sum(RegionStats.hpi_sum))
+        .where(*filters)
+        .group_by(*groups, period)
+        .order_by(*groups, period)
+    ).all()
+
+    groups, period, filters = grouped(RegionMetalStats)
+    if metal:
+        filters.append(RegionMetalStats.metal.in_({metal, *standards_registry.metal_labels(standards_registry.metal_key(metal))}))
+    metals = db.execute(
+        select(
+            *groups, period, RegionMetalStats.metal,
+            func.sum(RegionMetalStats.readings),
+            func.sum(RegionMetalStats.concentration_sum),
+            func.min(RegionMetalStats.concentration_min),
+            func.max(RegionMetalStats.concentration_max),
+            func.sum(RegionMetalStats.exceedances),
+        )
+        .where(*filters, RegionMetalStats.readings > 0)
+        .group_by(*groups, period, RegionMetalStats.metal)
+        .order_by(*groups, period, RegionMetalStats.metal)
+    ).all()
+
+    width = len(groups)
+    names = ("state", "district")[:width]
+
+    def label(value) -> str:
+        return f"{value // 100:04d}-{value % 100:02d}" if granularity == "month" else str(value)
+
+    series = {}
+    for row in cells:
+        key, value, samples, hpi_sum = tuple(row[:width]), row[width], row[width + 1], row[width + 2]
+        series[key + (value,)] = {
+            **dict(zip(names, key)),
+            "period": label(value),
+            "samples": samples,
+            "mean_hpi": round(hpi_sum / samples, 2) if samples else None,
+            "metals": {},
+        }
+    for row in metals:
+        key, value, name = tuple(row[:width]), row[width], row[width + 1]
+        readings, total, low, high, exceedances = row[width + 2:]
+        entry = series.get(key + (value,))
+        if entry is None:
+            continue
+        entry["metals"][name] = {
+            "readings": readings,
+            "mean": total / readings,
+            "min": low,
+            "max": high,
+            "exceedances": exceedances,
+            "exceedance_rate": round(exceedances / readings, 4),
+        }
+    if metal:
+        return [entry for entry in series.values() if entry["metals"]]
+    return list(series.values())
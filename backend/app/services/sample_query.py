@@ -0,0 +1,205 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.db.models.dataset import Dataset
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample, Measurement
+from app.services import geo
+from app.services.calculator import EnvironmentalCalculator
+
+# Scalar fields of a sample row, in response order
+SAMPLE_COLUMNS = {
+    "id": Sample.id,
+    "lat": Sample.lat,
+    "lng": Sample.lng,
+    "location_name": Sample.location_name,
+    "state": Sample.state,
+    "district": Sample.district,
+    "timestamp": Sample.timestamp,
+    "source_type": Sample.source_type,
+}
+SAMPLE_FIELDS = tuple(SAMPLE_COLUMNS) + ("measurements", "risk")
+
+# Samples without an assessment yet are reported as Safe
+_risk_category = func.coalesce(RiskAssessment.risk_category, "Safe")
+
+
+@dataclass
+class SampleFilters:
+    uploader_id: Optional[int] = None
+    dataset_id: Optional[int] = None
+    state: Optional[str] = None
+    district: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    risk_category: Optional[str] = None
+    bbox: Optional[geo.BBox] = None
+    near: Optional[geo.Circle] = None
+
+
+def bbox_clause(box: geo.BBox):
+    """
+    Geohash prefix ranges (index range scans) narrowed to the exact box.
+    The ranges alone over-cover by up to one cell on each side.
+    """
+    ranges = [
+        and_(Sample.geohash >= lo, Sample.geohash < hi) if hi is not None else Sample.geohash >= lo
+        for lo, hi in geo.cover(box)
+    ]
+    lng = [Sample.lng.between(part.min_lng, part.max_lng) for part in box.split()]
+    return and_(or_(*ranges), Sample.lat.between(box.min_lat, box.max_lat), or_(*lng))
+
+
+def _near_clause(circle: geo.Circle):
+    """Bounding box of the circle, then an equirectangular distance check (accurate to well under 1% at city scale)."""
+    # Shorter way round, so circles across the antimeridian work
+    dlng = func.abs(Sample.lng - circle.lng)
+    dlng = case((dlng > 180, 360 - dlng), else_=dlng) * circle.lng_scale
+    dlat = Sample.lat - circle.lat
+    limit = circle.radius_km / geo.KM_PER_DEGREE
+    return and_(bbox_clause(circle.bbox()), dlat * dlat + dlng * dlng <= limit * limit)
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """'lat,lng,risk' -> ('id', 'lat', 'lng', 'risk'); all fields when empty. Raises ValueError on unknown names."""
+    if not fields:
+        return SAMPLE_FIELDS
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(SAMPLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(SAMPLE_FIELDS)}")
+    # id is always returned; it is the pagination cursor
+    return tuple(f for f in SAMPLE_FIELDS if f in requested or f == "id")
+
+
+def sample_select(fields: Sequence[str], filters: SampleFilters):
+    """
+    One SELECT for the scalar fields (and the risk columns when requested),
+    ordered by Sample.id for keyset pagination.
+    """
+    columns = [SAMPLE_COLUMNS[f].label(f) for f in fields if f in SAMPLE_COLUMNS]
+    if "risk" in fields:
+        columns += [RiskAssessment.hpi.label("hpi"), RiskAssessment.mi.label("mi"), _risk_category.label("risk_category")]
+
+    query = select(*columns)
+    if "risk" in fields:
+        query = query.select_from(Sample).outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+    query = apply_filters(query, filters, risk_joined="risk" in fields)
+
+    boxes = [b for b in (filters.bbox, filters.near.bbox() if filters.near else None) if b]
+    if boxes and min(b.area for b in boxes) <= geo.INDEX_SCAN_MAX_AREA:
+        # `id + 0` keeps the planner from walking the primary key in order (and
+        # filtering the whole table) instead of scanning the geohash ranges and
+        # sorting the few rows they match
+        return query.order_by(Sample.id + 0)
+    return query.order_by(Sample.id)
+
+
+def apply_filters(query, filters: SampleFilters, risk_joined: bool = False):
+    """Add the WHERE clauses (and joins) for `filters` to a query over Sample."""
+    if filters.risk_category and not risk_joined:
+        query = query.select_from(Sample).outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+    if filters.uploader_id:
+        query = query.join(Dataset, Dataset.id == Sample.dataset_id).where(Dataset.uploader_id == filters.uploader_id)
+    if filters.dataset_id:
+        query = query.where(Sample.dataset_id == filters.dataset_id)
+    if filters.state:
+        query = query.where(Sample.state == filters.state)
+    if filters.district:
+        query = query.where(Sample.district == filters.district)
+    if filters.start:
+        query = query.where(Sample.timestamp >= filters.start)
+    if filters.end:
+        query = query.where(Sample.timestamp <= filters.end)
+    if filters.risk_category:
+        query = query.where(_risk_category == filters.risk_category)
+    if filters.bbox:
+        query = query.where(bbox_clause(filters.bbox))
+    if filters.near:
+        query = query.where(_near_clause(filters.near))
+    return query
+
+
+def rows_to_items(rows, fields: Sequence[str]) -> List[dict]:
+    """
+    Rows of sample_select() to response dicts. Unpacks positionally: the scalar
+    fields come first, in `fields` order, followed by the three risk columns.
+    """
+    names = [f for f in fields if f in SAMPLE_COLUMNS]
+    scalar = len(names)
+    with_risk = "risk" in fields
+    with_source = "source_type" in names
+
+    items = []
+    for row in rows:
+        item = dict(zip(names, row))
+        if with_source and item["source_type"] is not None:
+            item["source_type"] = item["source_type"].value
+        if with_risk:
+            hpi, mi, category = row[scalar:]
+            mi_class = EnvironmentalCalculator.classify_mi(mi) if mi is not None else None
+            item["risk"] = {"hpi": hpi, "mi": mi, "mi_class": mi_class, "risk_category": category}
+        items.append(item)
+    return items
+
+
+def measurements_for(db: Session, sample_ids: List[int]) -> Dict[int, List[dict]]:
+    """Measurements of many samples in one query, grouped by sample id."""
+    grouped = defaultdict(list)
+    if not sample_ids:
+        return grouped
+    rows = db.connection().execute(
+        select(Measurement.sample_id, Measurement.metal, Measurement.concentration)
+        .where(Measurement.sample_id.in_(sample_ids))
+        .order_by(Measurement.sample_id, Measurement.id)
+    ).all()
+    for sample_id, metal, concentration in rows:
+        grouped[sample_id].append({"metal": metal, "concentration": concentration})
+    return grouped
+
+
+def fetch_page(
+    db: Session,
+    fields: Sequence[str],
+    filters: SampleFilters,
+    cursor: Optional[int] = None,
+    limit: int = 500,
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    One keyset page: samples with id > cursor, plus their measurements in a
+    single batched query. Returns (items, next_cursor); next_cursor is None on
+    the last page. Cost depends on the page size, not the table size.
+    """
+    query = sample_select(fields, filters)
+    if cursor is not None:
+        query = query.where(Sample.id > cursor)
+    # One extra row tells us whether another page exists
+    rows = db.connection().execute(query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    items = _with_measurements(db, rows_to_items(rows[:limit], fields), fields)
+    return items, (items[-1]["id"] if has_more else None)
+
+
+def iter_batches(db: Session, fields: Sequence[str], filters: SampleFilters, batch_rows: int) -> Iterator[List[dict]]:
+    """
+    The whole filtered result set, batch by batch, from a server-side cursor
+    (yield_per), so memory is bounded by `batch_rows` rather than the table.
+    Each batch gets its measurements in one query. Plain column rows, so the
+    Core connection is used and ORM row processing is skipped.
+    """
+    result = db.connection().execute(sample_select(fields, filters).execution_options(yield_per=batch_rows))
+    for rows in result.partitions():
+        yield _with_measurements(db, rows_to_items(rows, fields), fields)
+
+
+def _with_measurements(db: Session, items: List[dict], fields: Sequence[str]) -> List[dict]:
+    if "measurements" in fields:
+        grouped = measurements_for(db, [item["id"] for item in items])
+        for item in items:
+            item["measurements"] = grouped.get(item["id"], [])
+    return items
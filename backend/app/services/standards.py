@@ -0,0 +1,198 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.constants import DEFAULT_STANDARD, EXPOSURE_DEFAULTS, METAL_ORDER, METAL_SYMBOLS, RISK_PARAMS, STANDARD_LIMITS
+from app.db.models.exposure import ExposureProfile
+from app.db.models.metal import HeavyMetal
+from app.db.models.standard import MetalStandardRecord, StandardsVersion
+from app.services import cache, jobs
+from app.services.calculator import StandardArrays
+
+# Columns of MetalStandardRecord that an update may change
+LIMIT_FIELDS = ("si", "ii", "mac", "bn", "rfd", "csf")
+
+# Standard that HeavyMetal.standard_limit mirrors
+PRIMARY_STANDARD = DEFAULT_STANDARD
+
+_SYMBOLS_BY_NAME = {name: symbol for symbol, name in METAL_SYMBOLS.items()}
+
+# version -> arrays; versions are immutable, so entries never go stale
+_arrays_cache: Dict[int, StandardArrays] = {}
+
+
+class StandardsConflict(Exception):
+    """Another standards version was published since the one an update was based on."""
+
+
+def metal_key(label: str) -> str:
+    """'As' / 'Arsenic' / 'arsenic' -> 'arsenic' (the key used by app.core.constants)."""
+    return METAL_SYMBOLS.get(label, label.lower())
+
+
+def metal_labels(metal: str) -> List[str]:
+    """Every Measurement.metal spelling that metal_key() maps to `metal`."""
+    labels = [metal, metal.capitalize(), metal.upper()]
+    if metal in _SYMBOLS_BY_NAME:
+        labels.append(_SYMBOLS_BY_NAME[metal])
+    return labels
+
+
+def _constant_record(standard: str, metal: str) -> MetalStandardRecord:
+    limits = STANDARD_LIMITS[standard][metal]
+    return MetalStandardRecord(
+        standard=standard,
+        metal=metal,
+        si=limits["Si"],
+        ii=limits["Ii"],
+        mac=limits["MAC"],
+        bn=limits["Bn"],
+        rfd=RISK_PARAMS[metal]["RfD"],
+        csf=RISK_PARAMS[metal]["CSF"],
+    )
+
+
+def seed_standards(db: Session) -> int:
+    """
+    Create version 1 from the literals in app.core.constants if the table is empty.
+    If the current version lacks a standard that the constants define (e.g. WHO
+    was added later), publish a version that includes it and queue a recompute
+    of the samples that prefer it. Returns the current version. Does not commit.
+    """
+    current = current_version(db)
+    records = get_records(db, current) if current is not None else []
+    have = {(r.standard, r.metal) for r in records}
+    added = [s for s in STANDARD_LIMITS if not any((s, m) in have for m in METAL_ORDER)]
+    if not added:
+        return current
+
+    version = StandardsVersion(note=f"{', '.join(added)} limits from app.core.constants", based_on=current)
+    version.limits = [
+        MetalStandardRecord(standard=r.standard, metal=r.metal, **{f: getattr(r, f) for f in LIMIT_FIELDS})
+        for r in records
+    ] + [_constant_record(standard, metal) for standard in added for metal in METAL_ORDER]
+    db.add(version)
+    db.flush()
+
+    if current is not None:
+        for standard in added:
+            jobs.enqueue(db, "recompute_standards", {"version": version.id, "standard": standard})
+    return version.id
+
+
+def current_version(db: Session) -> Optional[int]:
+    return db.scalar(select(func.max(StandardsVersion.id)))
+
+
+def get_records(db: Session, version: int) -> List[MetalStandardRecord]:
+    return db.scalars(
+        select(MetalStandardRecord)
+        .where(MetalStandardRecord.version_id == version)
+        .order_by(MetalStandardRecord.standard, MetalStandardRecord.metal)
+    ).all()
+
+
+def load_standards(db: Session, version: Optional[int] = None) -> Tuple[Optional[int], StandardArrays]:
+    """
+    (version, arrays) for the requested or current standards version.
+    Falls back to the constants (version None) before the table is seeded.
+    """
+    if version is None:
+        version = current_version(db)
+        if version is None:
+            return None, StandardArrays.from_constants()
+
+    if version not in _arrays_cache:
+        # Pairs missing from the version keep their constant values
+        _arrays_cache[version] = StandardArrays.from_records(
+            {"standard": r.standard, "metal": r.metal, **{f: getattr(r, f) for f in LIMIT_FIELDS}}
+            for r in get_records(db, version)
+        )
+    return version, _arrays_cache[version]
+
+
+def update_metal_standard(
+    db: Session,
+    standard: str,
+    metal: str,
+    changes: Dict[str, Optional[float]],
+    user_id: Optional[int] = None,
+    note: Optional[str] = None,
+    expected_version: Optional[int] = None,
+) -> StandardsVersion:
+    """
+    Publish a new standards version that copies the current one with `changes`
+    applied to a single (standard, metal) record. Earlier versions are never
+    modified, so stored assessments always point at the limits they used.
+    Raises LookupError if the record does not exist, and StandardsConflict if
+    `expected_version` is given and no longer current. Does not commit.
+
+    Concurrent updates must not both copy the same version, or one change is
+    lost. PostgreSQL publishers queue on a lock of the current version's row
+    and re-read what is current once they hold it; elsewhere the unique
+    `based_on` makes the second publisher's flush fail with IntegrityError.
+    """
+    current = seed_standards(db)
+    while True:
+        db.execute(select(StandardsVersion.id).where(StandardsVersion.id == current).with_for_update())
+        latest = current_version(db)
+        if latest == current:
+            break
+        current = latest
+    if expected_version is not None and expected_version != current:
+        raise StandardsConflict(f"Standards v{current} is current, not v{expected_version}")
+    records = get_records(db, current)
+    if not any(r.standard == standard and r.metal == metal for r in records):
+        raise LookupError(f"No {standard} standard for {metal}")
+
+    version = StandardsVersion(note=note, created_by=user_id, based_on=current)
+    for r in records:
+        values = {f: getattr(r, f) for f in LIMIT_FIELDS}
+        if r.standard == standard and r.metal == metal:
+            values.update(changes)
+        version.limits.append(MetalStandardRecord(standard=r.standard, metal=r.metal, **values))
+    db.add(version)
+
+    # Keep the education catalogue's copy of the limit in sync
+    if standard == PRIMARY_STANDARD and "si" in changes and metal in _SYMBOLS_BY_NAME:
+        db.query(HeavyMetal).filter(HeavyMetal.symbol == _SYMBOLS_BY_NAME[metal]).update(
+            {HeavyMetal.standard_limit: changes["si"]}, synchronize_session=False
+        )
+        cache.bump(db, cache.EDUCATION)
+
+    db.flush()
+    return version
+
+
+def seed_exposure_profiles(db: Session):
+    """Create the built-in profiles from EXPOSURE_DEFAULTS if missing. Does not commit."""
+    existing = set(db.scalars(select(ExposureProfile.name)).all())
+    for name, params in EXPOSURE_DEFAULTS.items():
+        if name not in existing:
+            db.add(_profile(name, params))
+    db.flush()
+
+
+def load_profiles(db: Session) -> List[ExposureProfile]:
+    return db.scalars(select(ExposureProfile).order_by(ExposureProfile.id)).all()
+
+
+def register_exposure_profile(db: Session, name: str, params: Dict[str, float], user_id: Optional[int] = None) -> ExposureProfile:
+    """
+    Add a custom exposure profile; params use the EXPOSURE_DEFAULTS keys (BW, IR, EF, ED, AT).
+    Profiles are immutable, so a changed scenario is registered under a new name.
+    Raises ValueError if the name is taken. Does not commit.
+    """
+    if db.scalar(select(ExposureProfile.id).where(ExposureProfile.name == name)) is not None:
+        raise ValueError(f"Exposure profile '{name}' already exists")
+    profile = _profile(name, params, user_id)
+    db.add(profile)
+    db.flush()
+    return profile
+
+
+def _profile(name: str, params, user_id: Optional[int] = None) -> ExposureProfile:
+    return ExposureProfile(
+        name=name, bw=params["BW"], ir=params["IR"], ef=params["EF"], ed=params["ED"], at=params["AT"], created_by=user_id
+    )
@@ -1,75 +1,518 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, func, literal, or_, select
 from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.constants import DEFAULT_STANDARD, EXPOSURE_DEFAULTS, METAL_INDEX, METAL_ORDER, METAL_SYMBOLS, STANDARD_LIMITS
+from app.db.bulk import dialect_insert
 from app.db.models.sample import Sample, Measurement
 from app.db.models.risk import RiskAssessment
-from app.services.calculator import EnvironmentalCalculator
+from app.db.models.exposure import ExposureProfile, ExposureRisk
+from app.db.models.job import Job
+from app.db.models.raster import RasterDirtyBlock, RasterRegion
+from app.services.calculator import EnvironmentalCalculator, StandardArrays
+from app.services import cache, dashboard, events, geo, hotspots, ingestion, jobs, rasters, rollups, tiles
+from app.services import standards as standards_registry
 from app.db.database import SessionLocal
 
+ASSESSMENT_COLUMNS = ["hpi", "hei", "mi", "i_geo_max", "hazard_index", "cancer_risk", "risk_category", "is_safe", "standards_version"]
+
+
+def risk_categories(hpi: np.ndarray) -> np.ndarray:
+    """Citizen-facing category per sample, based on the HPI threshold of 100 [cite: 126, 169]."""
+    return np.select([hpi > 100, hpi > 50], ["Hazardous", "Moderately Polluted"], default="Safe")
+
+
+def assess_matrix(
+    concentrations: np.ndarray,
+    has_unlisted: Optional[np.ndarray] = None,
+    standards: Optional[StandardArrays] = None,
+    standard_index: Optional[np.ndarray] = None,
+    profiles: Optional[Dict[str, dict]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Every stored index for a (samples x METAL_ORDER) mg/L matrix.
+    `has_unlisted` flags samples that also carry metals without standards; the
+    scalar calculator scores those as I-geo 0, which is kept here for parity.
+    `standard_index` selects each sample's row in the standards registry, and
+    `profiles` adds per-profile health risk (see calculate_batch).
+    """
+    # The headline health risk is reported for children (the most vulnerable group)
+    results = EnvironmentalCalculator.calculate_batch(
+        concentrations, standards=standards, group="child", standard_index=standard_index, profiles=profiles
+    )
+    if has_unlisted is not None:
+        np.maximum(results["i_geo_max"], 0.0, out=results["i_geo_max"], where=has_unlisted)
+    results["risk_category"] = risk_categories(results["hpi"])
+    results["is_safe"] = results["hpi"] <= 100
+    return results
+
+
+def _sample_id_chunks(db: Session, dataset_id: Optional[int], sample_ids: Optional[List[int]]) -> Iterator[List[int]]:
+    size = settings.RISK_BATCH_SIZE
+    if sample_ids is not None:
+        for start in range(0, len(sample_ids), size):
+            yield sample_ids[start:start + size]
+        return
+
+    # Keyset walk over the dataset so huge uploads never load every id at once
+    last_id = 0
+    while True:
+        chunk = db.scalars(
+            select(Sample.id)
+            .where(Sample.dataset_id == dataset_id, Sample.id > last_id)
+            .order_by(Sample.id)
+            .limit(size)
+        ).all()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]
+
+
+def _write_assessments(db: Session, rows: List[dict]):
+    """
+    Bulk upsert keyed on risk_assessments.sample_id. A stored assessment made
+    under a newer standards version is kept: a job still running on the old
+    limits must not overwrite what a recompute wrote.
+    """
+    table = RiskAssessment.__table__
+    stmt = dialect_insert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["sample_id"],
+        set_={col: stmt.excluded[col] for col in ASSESSMENT_COLUMNS},
+        where=table.c.standards_version.is_(None) | (stmt.excluded.standards_version >= table.c.standards_version),
+    )
+    db.execute(stmt, rows)
+
+
+def _write_exposure_risks(db: Session, sample_ids: List[int], profiles: List[ExposureProfile], results: Dict[str, np.ndarray]):
+    """Bulk upsert of the (samples x profiles) health risk arrays, one row per pair."""
+    frame = pd.DataFrame({
+        "sample_id": np.repeat(sample_ids, len(profiles)),
+        "profile_id": np.tile([p.id for p in profiles], len(sample_ids)),
+        "hazard_index": results["profile_hazard_index"].ravel(),
+        "cancer_risk": results["profile_cancer_risk"].ravel(),
+    })
+    table = ExposureRisk.__table__
+    stmt = dialect_insert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["sample_id", "profile_id"],
+        set_={col: stmt.excluded[col] for col in ("hazard_index", "cancer_risk")},
+    )
+    db.execute(stmt, frame.to_dict("records"))
+
+
+def assess_samples(db: Session, sample_ids: List[int], standards: Optional[Tuple[Optional[int], StandardArrays]] = None) -> int:
+    """
+    Load the chunk's measurements in one query, assess every sample and upsert the results.
+    `standards` is a (version, arrays) pair from standards.load_standards; the current
+    version is used when omitted. Does not commit.
+    """
+    if not sample_ids:
+        return 0
+    version, arrays = standards or standards_registry.load_standards(db)
+    if version is not None:
+        # Already assessed under newer limits (by a recompute that overtook this job): left as they are,
+        # and kept out of the summaries and events too
+        newer = set(db.scalars(
+            select(RiskAssessment.sample_id)
+            .where(RiskAssessment.sample_id.in_(sample_ids), RiskAssessment.standards_version > version)
+        ).all())
+        if newer:
+            sample_ids = [i for i in sample_ids if i not in newer]
+            if not sample_ids:
+                return 0
+
+    readings = db.execute(
+        select(Measurement.sample_id, Measurement.metal, Measurement.concentration)
+        .where(Measurement.sample_id.in_(sample_ids))
+    ).all()
+
+    # Measurements are stored in mg/L (converted at ingest)
+    conc = np.full((len(sample_ids), len(METAL_ORDER)), np.nan)
+    has_unlisted = np.zeros(len(sample_ids), dtype=bool)
+    # Each sample is scored against its own standard (BIS or WHO)
+    located = db.execute(
+        select(Sample.id, Sample.standard_preference, Sample.lat, Sample.lng, Sample.state).where(Sample.id.in_(sample_ids))
+    ).all()
+    preferences = {row[0]: row[1] for row in located}
+    standard_index = arrays.standard_indices([preferences.get(i) for i in sample_ids])
+
+    if readings:
+        ids, metals, values = zip(*readings)
+        rows = pd.Index(sample_ids).get_indexer(ids)
+        names = pd.Series(metals).map(lambda m: METAL_SYMBOLS.get(m, m.lower()))
+        cols = names.map(METAL_INDEX).to_numpy(dtype=float)
+        listed = ~np.isnan(cols)
+        conc[rows[listed], cols[listed].astype(int)] = np.asarray(values, dtype=float)[listed]
+        has_unlisted[rows[~listed]] = True
+
+    # Replacing earlier assessments (a standards recompute) invalidates in-memory indexes
+    rewrites = db.scalar(select(RiskAssessment.id).where(RiskAssessment.sample_id.in_(sample_ids)).limit(1)) is not None
+
+    # Every exposure profile (built-in and researcher-registered) in the same pass
+    profiles = standards_registry.load_profiles(db)
+    results = assess_matrix(
+        conc, has_unlisted, standards=arrays, standard_index=standard_index,
+        profiles={p.name: p.params() for p in profiles},
+    )
+    results["standards_version"] = version
+    uploaders = dashboard.record_assessments(db, sample_ids, results)
+    rollups.record_assessments(db, sample_ids, results, readings)
+    events.record_assessments(db, sample_ids, results, readings)
+    frame = pd.DataFrame({"sample_id": sample_ids, **{col: results[col] for col in ASSESSMENT_COLUMNS}})
+    _write_assessments(db, frame.to_dict("records"))
+    if profiles:
+        _write_exposure_risks(db, sample_ids, profiles, results)
+    # Cached map tiles containing these samples now show stale clusters
+    tiles.invalidate_points(db, [row[2] for row in located], [row[3] for row in located])
+    # As are the interpolated rasters around them
+    rasters.mark_dirty(db, [row[2] for row in located], [row[3] for row in located])
+    # And the hotspot analysis of their states
+    hotspots.mark_stale(db, [row[4] for row in located])
+    # Last, so the hot generation rows stay locked for as little of the transaction as possible
+    cache.bump(
+        db, cache.SAMPLES, *(cache.researcher_scope(u) for u in uploaders), *([cache.REWRITES] if rewrites else [])
+    )
+    return len(sample_ids)
+
+
+def calculate_risk_batch_task(dataset_id: Optional[int] = None, sample_ids: Optional[List[int]] = None):
+    """
+    Background task that assesses a whole dataset (or an explicit list of samples)
+    in chunks of RISK_BATCH_SIZE: one measurement query, one bulk upsert and one
+    commit per chunk. Errors are re-raised so the job worker can retry; chunks
+    already committed are simply upserted again.
+    """
+    if dataset_id is None and sample_ids is None:
+        raise ValueError("calculate_risk_batch_task needs a dataset_id or sample_ids")
+
+    db = SessionLocal()
+    try:
+        total = 0
+        standards = standards_registry.load_standards(db)
+        for chunk in _sample_id_chunks(db, dataset_id, sample_ids):
+            # Ids of deleted samples are dropped rather than failing the FK
+            existing = db.scalars(select(Sample.id).where(Sample.id.in_(chunk))).all() if sample_ids is not None else chunk
+            total += assess_samples(db, existing, standards)
+            db.commit()
+        if dataset_id is not None:
+            events.dataset_assessed(db, dataset_id, total)
+            db.commit()
+        print(f"✅ Risk Assessment completed for {total} samples (dataset={dataset_id})")
+    except Exception as e:
+        print(f"❌ Error in background task: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
 
 def calculate_risk_indices_task(sample_id: int):
     """
-    Background task to fetch raw data, compute indices, and persist results.
+    Background task to fetch raw data, compute indices, and persist results
+    for a single sample.
+    """
+    calculate_risk_batch_task(sample_ids=[sample_id])
+
+
+def _preference_filter(standard: str):
+    """SQL twin of StandardArrays.standard_indices: unknown or missing preferences count as the default standard."""
+    preference = func.upper(func.coalesce(Sample.standard_preference, DEFAULT_STANDARD))
+    if standard == DEFAULT_STANDARD:
+        return preference.notin_([s for s in STANDARD_LIMITS if s != DEFAULT_STANDARD])
+    return preference == standard
+
+
+def _samples_to_recompute(db: Session, version: int, metal: Optional[str], standard: Optional[str], after_id: int) -> List[int]:
+    """
+    Next keyset page of samples assessed before `version` (or never), optionally
+    limited to samples that contain `metal` and/or prefer `standard`.
+    """
+    if metal:
+        sample_id = Measurement.sample_id
+        query = select(sample_id).distinct().where(Measurement.metal.in_(standards_registry.metal_labels(metal)))
+        if standard:
+            query = query.join(Sample, Sample.id == sample_id)
+    else:
+        sample_id = Sample.id
+        query = select(sample_id)
+    if standard:
+        query = query.where(_preference_filter(standard))
+
+    return db.scalars(
+        query
+        .outerjoin(RiskAssessment, RiskAssessment.sample_id == sample_id)
+        .where(
+            sample_id > after_id,
+            or_(RiskAssessment.standards_version.is_(None), RiskAssessment.standards_version < version),
+        )
+        .order_by(sample_id)
+        .limit(settings.RISK_BATCH_SIZE)
+    ).all()
+
+
+def recompute_standards_task(version: int, metal: Optional[str] = None, standard: Optional[str] = None):
+    """
+    Background task queued when standards change: re-assesses only the samples
+    the change can affect (those that contain `metal` and prefer `standard`)
+    against the current standards version. Everything else keeps its results.
+    Already recomputed samples are skipped, so retries resume cheaply.
     """
     db = SessionLocal()
     try:
-        sample = db.query(Sample).filter(Sample.id == sample_id).first()
-        if not sample:
+        standards = standards_registry.load_standards(db)
+        total = 0
+        last_id = 0
+        while True:
+            chunk = _samples_to_recompute(db, version, metal, standard, last_id)
+            if not chunk:
+                break
+            total += assess_samples(db, chunk, standards)
+            db.commit()
+            last_id = chunk[-1]
+        print(f"✅ Recomputed {total} samples (metal={metal}, standard={standard}, standards v{standards[0]})")
+    except Exception as e:
+        print(f"❌ Error in background task: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def backfill_exposure_profile_task(profile_id: int):
+    """
+    Background task queued when a profile is registered: fills its health risk
+    for every assessed sample with one INSERT ... SELECT. CDI is linear in the
+    exposure parameters, so the stored child values only need rescaling and no
+    measurement is reloaded. Samples assessed after registration already have it.
+    """
+    db = SessionLocal()
+    try:
+        profile = db.get(ExposureProfile, profile_id)
+        if profile is None:
             return
+        scale = EnvironmentalCalculator.exposure_intake(profile.params()) / EnvironmentalCalculator.exposure_intake(EXPOSURE_DEFAULTS["child"])
 
-        name_mapping = {
-            "As": "arsenic", "Pb": "lead", "Cd": "cadmium", 
-            "Hg": "mercury", "Cr": "chromium", "Ni": "nickel",
-            "Zn": "zinc", "Cu": "copper", "Fe": "iron", "Mn": "manganese"
-        }
-
-        # CRITICAL FIX: Ensure all data is in mg/L before calculation
-        # If your Measurement model doesn't have a 'unit' field, 
-        # ensure your API converted them BEFORE saving to the DB.
-        raw_data = {
-            name_mapping.get(m.metal, m.metal.lower()): m.concentration 
-            for m in sample.measurements
-        }
-
-        # DEBUG: Check if Copper is 0.98 or 980
-        print(f"DEBUG: Data sent to calculator: {raw_data}")
-
-        calc = EnvironmentalCalculator()
-        hpi_score = calc.calculate_hpi(raw_data)
-        hei_score = calc.calculate_hei(raw_data)
-        
-        # Calculate max I-geo among all metals provided
-        i_geo_values = [calc.calculate_i_geo(m, c) for m, c in raw_data.items()]
-        max_i_geo = max(i_geo_values) if i_geo_values else 0.0
-        
-        # Health Risk Assessment for children (the most vulnerable group)
-        health_results = calc.calculate_health_risk(raw_data, group="child")
-
-        # 4. Determine Risk Category for Citizens
-        # [cite_start]Based on HPI threshold of 100 [cite: 126, 169]
-        category = "Safe"
-        if hpi_score > 100:
-            category = "Hazardous"
-        elif hpi_score > 50:
-            category = "Moderately Polluted"
-
-        # 5. Persist the results in the RiskAssessment table
-        assessment = RiskAssessment(
-            sample_id=sample.id,
-            hpi=hpi_score,
-            hei=hei_score,
-            i_geo_max=max_i_geo,
-            hazard_index=health_results["hazard_index"],
-            cancer_risk=health_results["cancer_risk"],
-            risk_category=category,
-            is_safe=(hpi_score <= 100)
+        table = ExposureRisk.__table__
+        source = select(
+            RiskAssessment.sample_id,
+            literal(profile.id),
+            RiskAssessment.hazard_index * scale,
+            RiskAssessment.cancer_risk * scale,
+        ).where(RiskAssessment.hazard_index.isnot(None))
+        stmt = (
+            dialect_insert(db, table)
+            .from_select(["sample_id", "profile_id", "hazard_index", "cancer_risk"], source)
+            .on_conflict_do_nothing(index_elements=["sample_id", "profile_id"])
         )
-        
-        db.add(assessment)
+        count = db.execute(stmt).rowcount
         db.commit()
-        print(f"✅ Risk Assessment completed for Sample ID: {sample_id}")
+        print(f"✅ Exposure profile '{profile.name}' backfilled for {count} samples")
+    except Exception as e:
+        print(f"❌ Error in background task: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def backfill_geohash_task():
+    """
+    Background task queued at startup when samples predate the geohash column:
+    fills it in id-ordered chunks, one commit per chunk, so it can resume.
+    """
+    db = SessionLocal()
+    try:
+        table = Sample.__table__
+        total = 0
+        while True:
+            rows = db.execute(
+                select(Sample.id, Sample.lat, Sample.lng)
+                .where(Sample.geohash.is_(None))
+                .order_by(Sample.id)
+                .limit(settings.RISK_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            ids, lat, lng = (np.array(column) for column in zip(*rows))
+            hashes = geo.encode_many(lat.astype(float), lng.astype(float))
+            db.execute(
+                table.update().where(table.c.id == bindparam("b_id")).values(geohash=bindparam("b_geohash")),
+                [{"b_id": int(i), "b_geohash": h} for i, h in zip(ids, hashes)],
+            )
+            # bbox / near results change as samples gain a geohash
+            cache.bump(db, cache.SAMPLES)
+            db.commit()
+            total += len(rows)
+        print(f"✅ Geohash backfilled for {total} samples")
+    except Exception as e:
+        print(f"❌ Error in background task: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def queue_geohash_backfill(db: Session):
+    """Queue backfill_geohash if any sample lacks a geohash and no such job is pending. Does not commit."""
+    if db.scalar(select(Sample.id).where(Sample.geohash.is_(None)).limit(1)) is None:
+        return
+    pending = select(Job.id).where(Job.kind == "backfill_geohash", Job.status.in_(["queued", "running"])).limit(1)
+    if db.scalar(pending) is None:
+        jobs.enqueue(db, "backfill_geohash")
+
+
+def backfill_natural_key_task():
+    """
+    Background task queued at startup when samples predate the natural_key
+    column: fills it in id-ordered chunks, one commit per chunk, so it can
+    resume. A sample whose key another sample already has is a duplicate
+    stored before uploads were deduplicated; it keeps a NULL key.
+    """
+    db = SessionLocal()
+    try:
+        table = Sample.__table__
+        total = last_id = 0
+        while True:
+            rows = db.execute(
+                select(Sample.id, Sample.lat, Sample.lng, Sample.timestamp, Sample.location_name)
+                .where(Sample.natural_key.is_(None), Sample.id > last_id)
+                .order_by(Sample.id)
+                .limit(settings.RISK_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            samples = pd.DataFrame(rows, columns=["id", "lat", "lng", "timestamp", "location_name"])
+            samples["natural_key"] = ingestion.natural_keys(samples)
+            samples = samples.drop_duplicates("natural_key")
+            taken = set(db.scalars(select(Sample.natural_key).where(Sample.natural_key.in_(samples["natural_key"].tolist()))))
+            samples = samples[~samples["natural_key"].isin(taken)]
+            if not samples.empty:
+                db.execute(
+                    table.update().where(table.c.id == bindparam("b_id")).values(natural_key=bindparam("b_natural_key")),
+                    [{"b_id": int(i), "b_natural_key": k} for i, k in zip(samples["id"], samples["natural_key"])],
+                )
+            db.commit()
+            total += len(samples)
+        print(f"✅ Natural keys backfilled for {total} samples")
+    except Exception as e:
+        print(f"❌ Error in background task: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def queue_natural_key_backfill(db: Session):
+    """Queue backfill_natural_key if any sample lacks a natural key and no such job is pending. Does not commit."""
+    if db.scalar(select(Sample.id).where(Sample.natural_key.is_(None)).limit(1)) is None:
+        return
+    pending = select(Job.id).where(Job.kind == "backfill_natural_key", Job.status.in_(["queued", "running"])).limit(1)
+    if db.scalar(pending) is None:
+        jobs.enqueue(db, "backfill_natural_key")
+
+
+def build_rollups_task(regions: Optional[List[List[str]]] = None):
+    """
+    Background task that builds the time-series rollups of the given
+    [state, district] pairs (after a dataset deletion dropped them), or of
+    every district that has none yet. One commit per district, so it resumes.
+    """
+    db = SessionLocal()
+    try:
+        pending = [tuple(r) for r in regions] if regions is not None else rollups.unbuilt_regions(db)
+        built = 0
+        for state, district in pending:
+            built += rollups.build(db, state, district)
+            cache.bump(db, cache.SAMPLES)
+            db.commit()
+        print(f"✅ Rollups built for {built} districts")
+    except Exception as e:
+        print(f"❌ Error in background task: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def queue_rollup_backfill(db: Session):
+    """Queue build_rollups if any assessed sample's district has no rollups and no such job is pending. Does not commit."""
+    if not rollups.unbuilt_regions(db, limit=1):
+        return
+    pending = select(Job.id).where(Job.kind == "build_rollups", Job.status.in_(["queued", "running"])).limit(1)
+    if db.scalar(pending) is None:
+        jobs.enqueue(db, "build_rollups")
+
+
+def update_rasters_task():
+    """
+    Background task queued whenever samples are assessed or deleted: re-interpolates
+    the raster blocks around them (see app.services.rasters) in one transaction,
+    then deletes raster files no reader needs any more.
+    """
+    db = SessionLocal()
+    try:
+        regions, blocks = rasters.update(db)
+        db.commit()
+        rasters.prune_files(db)
+        print(f"✅ Rasters updated: {blocks} blocks across {regions} regions")
+    except Exception as e:
+        print(f"❌ Error in background task: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
+
+def queue_raster_backfill(db: Session):
+    """Queue update_rasters if blocks are dirty or assessments predate the rasters. Does not commit."""
+    dirty = db.scalar(select(RasterDirtyBlock.block_row).limit(1)) is not None
+    unbuilt = db.scalar(select(RasterRegion.state).limit(1)) is None and db.scalar(select(RiskAssessment.id).limit(1)) is not None
+    if dirty or unbuilt:
+        rasters.queue_update(db)
+
+
+def update_hotspots_task():
+    """
+    Background task queued whenever samples are assessed or deleted: re-runs the
+    Gi* analysis of every stale state (see app.services.hotspots), one commit per state.
+    """
+    db = SessionLocal()
+    try:
+        total = 0
+        for state, version, generation in hotspots.stale_regions(db):
+            total += hotspots.compute(db, state, version, generation)
+            db.commit()
+        print(f"✅ Hotspots updated over {total} samples")
     except Exception as e:
         print(f"❌ Error in background task: {e}")
         db.rollback()
+        raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def queue_hotspot_backfill(db: Session):
+    """Mark states assessed before the hotspot analysis existed, and queue update_hotspots if any are stale. Does not commit."""
+    hotspots.mark_stale(db, hotspots.unanalysed_states(db))
+    if hotspots.stale_regions(db):
+        jobs.enqueue_once(db, "update_hotspots")
+
+
+# Job kinds the worker (app/worker.py) knows how to run; payload keys are passed as kwargs
+TASKS = {
+    "calculate_risk_indices": calculate_risk_indices_task,
+    "calculate_risk_batch": calculate_risk_batch_task,
+    "recompute_standards": recompute_standards_task,
+    "backfill_exposure_profile": backfill_exposure_profile_task,
+    "backfill_geohash": backfill_geohash_task,
+    "backfill_natural_key": backfill_natural_key_task,
+    "build_rollups": build_rollups_task,
+    "update_rasters": update_rasters_task,
+    "update_hotspots": update_hotspots_task,
+}
@@ -0,0 +1,189 @@
+"""
+Clustered slippy-map tiles (z/x/y, Web Mercator, as used by Leaflet).
+
+Each tile is aggregated in SQL by geohash cell: one row per cell with the
+count, centroid, mean HPI and worst risk category of its samples. Unfiltered tiles up to
+TILE_CACHE_MAX_ZOOM are cached in `map_tiles`; when samples are assessed or
+deleted, only the tiles containing them are cleared, and their generation is
+bumped so a tile computed from the old samples is not stored afterwards.
+"""
+import json
+import math
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.bulk import dialect_insert
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample
+from app.db.models.tile import MapTile
+from app.services import geo, sample_query
+
+# Web Mercator stops short of the poles
+MAX_LATITUDE = 85.0511287798
+
+# Risk categories from least to most severe; a cluster reports its worst
+RISK_SEVERITY = ("Safe", "Moderately Polluted", "Hazardous")
+_severity = case(
+    {name: rank for rank, name in enumerate(RISK_SEVERITY)},
+    value=func.coalesce(RiskAssessment.risk_category, RISK_SEVERITY[0]),
+    else_=0,
+)
+
+# Upper bound on clusters per tile side: tiles are grouped by the finest geohash
+# precision whose cells are at least 1/TILE_GRID of the tile's width
+TILE_GRID = 16
+
+# Tiles cleared per statement during invalidation
+_INVALIDATE_CHUNK = 500
+
+
+def tile_bbox(z: int, x: int, y: int) -> geo.BBox:
+    n = 1 << z
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return geo.BBox(x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
+
+
+def tile_indices(lat: np.ndarray, lng: np.ndarray, z: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized (x, y) of the zoom-z tiles containing each point."""
+    n = 1 << z
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(lng) + 180.0) / 360.0 * n)
+    y = np.floor((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def cluster_precision(z: int) -> int:
+    """Geohash length used to cluster a zoom-z tile (between 2 and TILE_GRID cells across)."""
+    cell = 360.0 / (1 << z) / TILE_GRID
+    best = 1
+    for precision in range(1, geo.GEOHASH_PRECISION + 1):
+        lng_bits, _ = geo._bits(precision)
+        if 360.0 / (1 << lng_bits) < cell:
+            break
+        best = precision
+    return best
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= settings.TILE_MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def compute_tile(db: Session, z: int, x: int, y: int, filters: Optional[sample_query.SampleFilters] = None) -> List[dict]:
+    """
+    Clusters of one tile. Points are matched against the tile's exact bounds,
+    so a sample belongs to exactly one tile per zoom level even where a
+    geohash cell straddles two tiles.
+    """
+    filters = filters or sample_query.SampleFilters()
+    box = tile_bbox(z, x, y)
+    cell = func.substr(Sample.geohash, 1, cluster_precision(z))
+    query = (
+        select(
+            func.count(),
+            func.avg(Sample.lat),
+            func.avg(Sample.lng),
+            func.avg(RiskAssessment.hpi),
+            func.max(_severity),
+            func.min(Sample.id),
+        )
+        .select_from(Sample)
+        .outerjoin(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        .where(sample_query.bbox_clause(box))
+        .group_by(cell)
+    )
+    # Points on a shared edge go to the tile east / south of it, as in tile_indices
+    if x + 1 < (1 << z):
+        query = query.where(Sample.lng < box.max_lng)
+    if y + 1 < (1 << z):
+        query = query.where(Sample.lat > box.min_lat)
+    rows = db.execute(sample_query.apply_filters(query, filters, risk_joined=True)).all()
+    return [
+        {
+            # ~1m of precision is plenty for a marker and keeps the payload small
+            "lat": round(lat, 5),
+            "lng": round(lng, 5),
+            "count": count,
+            "mean_hpi": round(mean_hpi, 2) if mean_hpi is not None else None,
+            "risk_category": RISK_SEVERITY[severity],
+            # A single sample can be looked up directly
+            "sample_id": first_id if count == 1 else None,
+        }
+        for count, lat, lng, mean_hpi, severity, first_id in rows
+    ]
+
+
+def get_tile(db: Session, z: int, x: int, y: int, filters: Optional[sample_query.SampleFilters] = None) -> str:
+    """
+    The tile as a JSON document. Unfiltered tiles up to TILE_CACHE_MAX_ZOOM are
+    served from (and stored in) map_tiles; deeper or filtered tiles cover few
+    samples and are computed directly from the geohash index. Commits when it
+    stores a tile.
+    """
+    cacheable = z <= settings.TILE_CACHE_MAX_ZOOM and (filters is None or filters == sample_query.SampleFilters())
+    if cacheable:
+        row = db.execute(
+            select(MapTile.payload, MapTile.generation).where(MapTile.z == z, MapTile.x == x, MapTile.y == y)
+        ).first()
+        if row is not None and row.payload is not None:
+            return row.payload
+
+    payload = json.dumps({"z": z, "x": x, "y": y, "clusters": compute_tile(db, z, x, y, filters)}, separators=(",", ":"))
+    if cacheable:
+        table = MapTile.__table__
+        if row is None:
+            # An invalidation meanwhile inserts the row first, and this one is dropped
+            db.execute(
+                dialect_insert(db, table)
+                .values(z=z, x=x, y=y, payload=payload, generation=0)
+                .on_conflict_do_nothing(index_elements=["z", "x", "y"])
+            )
+        else:
+            # Only stored if no invalidation bumped the generation while computing
+            db.execute(
+                table.update()
+                .where(table.c.z == z, table.c.x == x, table.c.y == y, table.c.generation == row.generation)
+                .values(payload=payload, computed_at=datetime.utcnow())
+            )
+        db.commit()
+    return payload
+
+
+def touched_tiles(lat: Sequence[float], lng: Sequence[float]) -> Set[Tuple[int, int, int]]:
+    """Every cached zoom level's tile containing any of the points."""
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    keys = set()
+    if not len(lat):
+        return keys
+    for z in range(settings.TILE_CACHE_MAX_ZOOM + 1):
+        x, y = tile_indices(lat, lng, z)
+        # One key per distinct tile; x and y both fit in 32 bits
+        for packed in np.unique((x << 32) | y).tolist():
+            keys.add((z, packed >> 32, packed & 0xFFFFFFFF))
+    return keys
+
+
+def invalidate(db: Session, keys: Iterable[Tuple[int, int, int]]) -> int:
+    """Clear the cached tiles in `keys` and bump their generation, adding rows for tiles not cached yet. Does not commit."""
+    # Sorted, so concurrent writers lock rows in the same order
+    keys = sorted(keys)
+    table = MapTile.__table__
+    for start in range(0, len(keys), _INVALIDATE_CHUNK):
+        db.execute(
+            dialect_insert(db, table).on_conflict_do_update(
+                index_elements=["z", "x", "y"], set_={"payload": None, "generation": table.c.generation + 1}
+            ),
+            [{"z": z, "x": x, "y": y, "payload": None, "generation": 0} for z, x, y in keys[start:start + _INVALIDATE_CHUNK]],
+        )
+    return len(keys)
+
+
+def invalidate_points(db: Session, lat: Sequence[float], lng: Sequence[float]) -> int:
+    """Clear the cached tiles containing any of the points. Does not commit."""
+    return invalidate(db, touched_tiles(lat, lng))
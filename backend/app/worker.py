@@ -0,0 +1,100 @@
+"""
+Background job worker.
+
+    python -m app.worker --concurrency 4
+
+Runs independently of the API processes; scale it by starting more
+processes or raising --concurrency.
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import traceback
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services import jobs
+from app.services.tasks import TASKS
+
+
+def run_one(worker_id: str) -> bool:
+    """Claim and execute a single job. Returns False when the queue is empty."""
+    db = SessionLocal()
+    try:
+        job = jobs.claim_next(db, worker_id)
+        if job is None:
+            return False
+
+        task = TASKS.get(job.kind)
+        try:
+            if task is None:
+                raise LookupError(f"Unknown job kind: {job.kind}")
+            task(**job.payload)
+        except Exception:
+            print(f"❌ Job {job.id} ({job.kind}) failed on attempt {job.attempts}")
+            jobs.mark_failed(db, job, traceback.format_exc())
+        else:
+            jobs.mark_completed(db, job)
+        return True
+    finally:
+        db.close()
+
+
+def drain(worker_id: str = "inline") -> int:
+    """Run jobs in the current thread until none are runnable. Handy for scripts and tests."""
+    processed = 0
+    while run_one(worker_id):
+        processed += 1
+    return processed
+
+
+def _loop(worker_id: str, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            busy = run_one(worker_id)
+        except Exception as e:
+            # Lost DB connection etc.; back off and keep the thread alive
+            print(f"❌ Worker {worker_id} error: {e}")
+            busy = False
+        if not busy:
+            stop.wait(settings.JOB_POLL_SECONDS)
+
+
+def main(concurrency: int):
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    stop = threading.Event()
+    worker_ids = [f"{prefix}:{i}" for i in range(concurrency)]
+    threads = [threading.Thread(target=_loop, args=(worker_id, stop), daemon=True) for worker_id in worker_ids]
+    for t in threads:
+        t.start()
+    print(f"Worker {prefix} started with {concurrency} threads")
+
+    next_check = time.monotonic()
+    try:
+        while True:
+            db = SessionLocal()
+            try:
+                # Long jobs keep their locks while this process is alive
+                jobs.heartbeat(db, worker_ids)
+                if time.monotonic() >= next_check:
+                    requeued, failed = jobs.requeue_stale(db)
+                    if requeued or failed:
+                        print(f"Re-queued {requeued} stale jobs, failed {failed} out of attempts")
+                    next_check = time.monotonic() + settings.JOB_LOCK_TIMEOUT_SECONDS / 2
+            except Exception as e:
+                print(f"❌ Worker {prefix} error: {e}")
+            finally:
+                db.close()
+            time.sleep(settings.JOB_HEARTBEAT_SECONDS)
+    except KeyboardInterrupt:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MetalSense background job worker")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    main(parser.parse_args().concurrency)
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from app.db.database import SessionLocal
 from app.db.models.metal import HeavyMetal
+from app.services import cache
 
 def seed_metals():
     db: Session = SessionLocal()
@@ -16,6 +17,7 @@ def seed_metals():
             existing = db.query(HeavyMetal).filter(HeavyMetal.name == m.name).first()
             if not existing:
                 db.add(m)
+        cache.bump(db, cache.EDUCATION)
         db.commit()
         print("Successfully seeded Heavy Metals!")
     except Exception as e:
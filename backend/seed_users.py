@@ -29,9 +29,21 @@ def seed_users():
                 is_active=True
             )
             db.add(res_user)
+
+        admin_user = db.query(User).filter(User.email == "admin@metalsense.com").first()
+        if not admin_user:
+            admin_user = User(
+                email="admin@metalsense.com",
+                hashed_password=common_pwd,
+                full_name="Standards Administrator",
+                role=UserRole.researcher,
+                is_active=True,
+                is_admin=True
+            )
+            db.add(admin_user)
             
         db.commit()
-        print("Demo accounts citizen@metalsense.com and researcher@metalsense.com created successfully!")
+        print("Demo accounts citizen@metalsense.com, researcher@metalsense.com and admin@metalsense.com created successfully!")
     except Exception as e:
         db.rollback()
         print(f"Error seeding users: {e}")
@@ -14,10 +14,14 @@ def setup_module(module):
     init_db()
     
 # Helpers
-def create_test_user(email: str, role: UserRole):
+def create_test_user(email: str, role: UserRole, is_admin: bool = False):
     db = SessionLocal()
     existing_user = db.query(User).filter(User.email == email).first()
     if existing_user:
+        if is_admin and not existing_user.is_admin:
+            existing_user.is_admin = True
+            db.commit()
+            db.refresh(existing_user)
         db.close()
         return existing_user
     
@@ -26,7 +30,8 @@ def create_test_user(email: str, role: UserRole):
         hashed_password=security.get_password_hash("testpassword"),
         full_name=f"Test {role.value.capitalize()}",
         role=role,
-        is_active=True
+        is_active=True,
+        is_admin=is_admin
     )
     db.add(user)
     db.commit()
@@ -39,6 +44,10 @@ def get_auth_header(email: str):
     token = response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
 
+def get_admin_header():
+    create_test_user("admin@example.com", UserRole.researcher, is_admin=True)
+    return get_auth_header("admin@example.com")
+
 def test_register_citizen():
     response = client.post(
         "/api/v1/users/register",
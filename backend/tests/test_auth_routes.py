@@ -4,16 +4,25 @@ from app.db.database import SessionLocal, init_db
 from app.api import deps
 from app.db.models.user import User, UserRole
 from app.core import security
+from app.core.config import settings
+from app.services import pools
+from app.services.principals import Principal, PrincipalCache, principal_cache, revoke_tokens, token_claims
 import pytest
-from tests.test_auth_rbac import create_test_user, get_auth_header
+import time
+import uuid
+from tests.test_auth_rbac import create_test_user, get_admin_header, get_auth_header
 
 client = TestClient(app)
 
 def setup_module(module):
     init_db()
 
+def unique_email(prefix: str) -> str:
+    """A user of its own, for tests that change the password or revoke tokens and so can't reuse one across runs."""
+    return f"{prefix}-{uuid.uuid4().hex[:8]}@example.com"
+
 def test_change_password():
-    email = "changepass@example.com"
+    email = unique_email("changepass")
     create_test_user(email, UserRole.citizen)
     headers = get_auth_header(email)
     
@@ -57,7 +66,7 @@ def test_logout():
     assert response.json()["msg"] == "Successfully logged out"
 
 def test_password_recovery_flow():
-    email = "recovery@example.com"
+    email = unique_email("recovery")
     create_test_user(email, UserRole.citizen)
     
     # 1. Request recovery
@@ -87,6 +96,125 @@ def test_password_recovery_flow():
     login_resp = client.post("/api/v1/auth/login", json={"email": email, "password": "resetpassword123"})
     assert login_resp.status_code == 200
 
+def test_principal_cache_skips_token_decoding(monkeypatch):
+    email = "cached@example.com"
+    create_test_user(email, UserRole.citizen)
+    headers = get_auth_header(email)
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+
+    # A cached principal needs neither the JWT decode nor the user query
+    def fail(*args, **kwargs):
+        raise AssertionError("token decoded")
+    monkeypatch.setattr(deps.jwt, "decode", fail)
+    hits = principal_cache.hits
+    assert client.get("/api/v1/users/me", headers=headers).json()["email"] == email
+    assert principal_cache.hits == hits + 1
+
+def test_password_change_revokes_older_tokens():
+    email = unique_email("revoked")
+    create_test_user(email, UserRole.citizen)
+    headers = get_auth_header(email)
+    other_session = get_auth_header(email)
+    assert client.get("/api/v1/users/me", headers=other_session).status_code == 200
+
+    payload = {"current_password": "testpassword", "new_password": "rotated123"}
+    assert client.post("/api/v1/users/change-password", json=payload, headers=headers).status_code == 200
+    assert client.get("/api/v1/users/me", headers=other_session).status_code == 401
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 401
+
+    login = client.post("/api/v1/auth/login", json={"email": email, "password": "rotated123"})
+    fresh = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert client.get("/api/v1/users/me", headers=fresh).status_code == 200
+
+def test_reset_token_is_single_use():
+    email = unique_email("single-use")
+    create_test_user(email, UserRole.citizen)
+    headers = get_auth_header(email)
+    db = SessionLocal()
+    try:
+        reset_token = security.create_access_token(data=token_claims(db.query(User).filter(User.email == email).first()))
+    finally:
+        db.close()
+
+    payload = {"token": reset_token, "new_password": "resetonce123"}
+    assert client.post("/api/v1/auth/reset-password", json=payload).status_code == 200
+    assert client.post("/api/v1/auth/reset-password", json={**payload, "new_password": "again123"}).status_code == 400
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 401
+
+def test_revocation_elsewhere_applies_once_entries_expire():
+    email = unique_email("elsewhere")
+    create_test_user(email, UserRole.citizen)
+    headers = get_auth_header(email)
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+
+    # Another API process revoked the user's tokens: this one learns of it on its next lookup
+    db = SessionLocal()
+    try:
+        revoke_tokens(db.query(User).filter(User.email == email).first())
+        db.commit()
+    finally:
+        db.close()
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+    principal_cache.clear()
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 401
+
+def test_principal_cache_bounds():
+    cache = PrincipalCache(max_entries=3, ttl_seconds=60)
+    alice = Principal(1, "a@example.com", None, UserRole.citizen, True, 0)
+    bob = Principal(2, "b@example.com", None, UserRole.citizen, True, 0)
+    cache.put("t1", alice)
+    cache.put("t2", alice, token_expires=time.time() - 1)
+    cache.put("t3", bob)
+    cache.put("t4", bob)
+    # t1 is evicted as the least recently used, t2 is past its token's expiry
+    assert cache.get("t1") is None and cache.get("t2") is None
+    assert cache.get("t3") == bob
+    cache.forget(bob.id)
+    assert cache.get("t3") is None and cache.get("t4") is None
+
+def test_login_upgrades_weaker_hashes():
+    email = "rehash@example.com"
+    create_test_user(email, UserRole.citizen)
+    weak = security.pwd_context.handler("pbkdf2_sha256").using(rounds=1000).hash("testpassword")
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        user.hashed_password = weak
+        db.commit()
+
+        assert client.post("/api/v1/auth/login", json={"email": email, "password": "wrong"}).status_code == 401
+        db.refresh(user)
+        assert user.hashed_password == weak
+
+        assert client.post("/api/v1/auth/login", json={"email": email, "password": "testpassword"}).status_code == 200
+        db.refresh(user)
+        assert user.hashed_password.startswith(f"$pbkdf2-sha256${settings.PASSWORD_HASH_ROUNDS}$")
+        assert not security.pwd_context.needs_update(user.hashed_password)
+    finally:
+        db.close()
+    assert client.post("/api/v1/auth/login", json={"email": email, "password": "testpassword"}).status_code == 200
+
+def test_hashing_pool_backpressure_and_metrics(monkeypatch):
+    email = "hashpool@example.com"
+    create_test_user(email, UserRole.citizen)
+    # Pool load is for operators only
+    assert client.get("/api/v1/metrics/").status_code == 422
+    assert client.get("/api/v1/metrics/", headers=get_auth_header(email)).status_code == 403
+    admin = get_admin_header()
+    completed = client.get("/api/v1/metrics/", headers=admin).json()["pools"]["password-hash"]["completed"]
+    assert client.post("/api/v1/auth/login", json={"email": email, "password": "testpassword"}).status_code == 200
+    hashing = client.get("/api/v1/metrics/", headers=admin).json()["pools"]["password-hash"]
+    assert hashing["completed"] == completed + 1 and hashing["run_ms"]["p50"] > 0
+
+    # Every hashing thread busy and no queue left: refused without hashing
+    monkeypatch.setattr(pools, "passwords", pools.BoundedPool("password-hash", 1, 0))
+    monkeypatch.setattr(pools.passwords, "running", 1)
+    response = client.post("/api/v1/auth/login", json={"email": email, "password": "testpassword"})
+    assert response.status_code == 503 and response.headers["Retry-After"]
+    payload = {"email": "hashpool-new@example.com", "password": "secret123", "full_name": "Queued", "role": "citizen"}
+    assert client.post("/api/v1/users/register", json=payload).status_code == 503
+    assert client.get("/api/v1/metrics/", headers=admin).json()["pools"]["password-hash"]["rejected"] == 2
+
 if __name__ == "__main__":
     try:
         setup_module(None)
@@ -0,0 +1,63 @@
+import threading
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import init_db
+from app.db.models.user import UserRole
+from app.services.cache import Entry, ResponseCache
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_auth_header
+
+client = TestClient(app)
+
+def setup_module(module):
+    init_db()
+
+def test_lru_evicts_by_count_and_size():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    for key in ("a", "b", "c"):
+        cache.get_or_compute(key, lambda: Entry(body=b"1234", etag="x"))
+    assert list(cache._entries) == ["b", "c"]
+
+    cache.get_or_compute("b", lambda: Entry(body=b"", etag="y"))  # hit: b becomes most recent
+    cache.get_or_compute("d", lambda: Entry(body=b"12345678", etag="z"))
+    assert list(cache._entries) == ["d"]
+
+def test_concurrent_misses_compute_once():
+    cache = ResponseCache(max_entries=10, max_bytes=1000)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return Entry(body=b"{}", etag="e")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert len(results) == 8 and all(r.etag == "e" for r in results)
+
+def test_etag_revalidation_and_invalidation_on_write():
+    email = "cache@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    first = client.get("/api/v1/researcher/samples", params={"fields": "lat,risk"})
+    etag = first.headers["etag"]
+    again = client.get("/api/v1/researcher/samples", params={"fields": "lat,risk"}, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+
+    payload = {"latitude": 12.5, "longitude": 77.5, "source_type": "Groundwater", "measurements": [{"metal": "As", "concentration": 0.02}]}
+    assert client.post("/api/v1/researcher/samples", json=payload, headers=headers).status_code == 202
+    drain()
+
+    changed = client.get("/api/v1/researcher/samples", params={"fields": "lat,risk"}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert len(changed.json()["items"]) == len(first.json()["items"]) + 1
+
+    stats = client.get("/api/v1/researcher/dashboard-stats", headers=headers)
+    assert stats.headers["cache-control"] == "private, no-cache"
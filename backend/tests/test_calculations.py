@@ -4,7 +4,11 @@ import os
 # Add parent dir to path to allow importing app
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from app.services.calculator import EnvironmentalCalculator
+import numpy as np
+import pytest
+
+from app.core.constants import METAL_ORDER, METAL_INDEX, WHO_STANDARDS, EXPOSURE_DEFAULTS
+from app.services.calculator import EnvironmentalCalculator, StandardArrays
 
 def test_hpi_example():
     print("--- Testing HPI Calculation (Aligarh Hotspot) ---")
@@ -89,6 +93,83 @@ def test_risk_assessment():
     else:
         print("❌ Cancer Risk is zero or failed")
 
+def test_mi_classes():
+    calc = EnvironmentalCalculator()
+    # 0.02 mg/L arsenic against a MAC of 0.01
+    assert calc.calculate_mi({"arsenic": 0.02}) == pytest.approx(2.0)
+    assert calc.classify_mi(calc.calculate_mi({"arsenic": 0.02})) == "Moderately Affected"
+    assert [calc.classify_mi(mi) for mi in (0.0, 0.3, 0.99, 1.5, 5.9, 6.0, 250.0)] == [
+        "Very Pure", "Pure", "Pure", "Slightly Affected", "Strongly Affected", "Seriously Affected", "Seriously Affected",
+    ]
+
+def test_batch_matches_scalar():
+    rng = np.random.default_rng(42)
+    matrix = rng.lognormal(-4, 2, size=(500, len(METAL_ORDER)))
+    matrix[rng.random(matrix.shape) < 0.6] = np.nan
+    matrix[rng.random(matrix.shape) < 0.05] = 0.0
+    matrix[0] = np.nan  # sample without any readings
+    matrix[1] = np.nan
+    matrix[1, METAL_INDEX["iron"]] = 0.3  # exactly at the limit: HPI must be 100, not 100.000...1
+
+    calc = EnvironmentalCalculator()
+    batch = calc.calculate_batch(matrix, group="adult")
+
+    for i, row in enumerate(matrix):
+        data = {METAL_ORDER[j]: v for j, v in enumerate(row) if not np.isnan(v)}
+        i_geo = [calc.calculate_i_geo(m, c) for m, c in data.items()]
+        health = calc.calculate_health_risk(data, group="adult")
+        assert np.isclose(batch["hpi"][i], calc.calculate_hpi(data), rtol=1e-12)
+        assert np.isclose(batch["hei"][i], calc.calculate_hei(data), rtol=1e-12)
+        assert np.isclose(batch["mi"][i], calc.calculate_mi(data), rtol=1e-12)
+        assert np.isclose(batch["i_geo_max"][i], max(i_geo) if i_geo else 0.0, rtol=1e-12)
+        assert np.isclose(batch["hazard_index"][i], health["hazard_index"], rtol=1e-12)
+        assert np.isclose(batch["cancer_risk"][i], health["cancer_risk"], rtol=1e-12)
+
+    assert batch["hpi"][1] == 100.0
+
+def test_batch_uses_each_samples_standard():
+    rng = np.random.default_rng(7)
+    matrix = rng.lognormal(-4, 2, size=(300, len(METAL_ORDER)))
+    matrix[rng.random(matrix.shape) < 0.5] = np.nan
+
+    registry = StandardArrays.from_constants()
+    preferences = rng.choice(["BIS", "WHO", None, "who"], size=len(matrix)).tolist()
+    index = registry.standard_indices(preferences)
+    assert registry.standards[:2] == ("BIS", "WHO")
+    assert [registry.standards[k] for k in index[:20]] == [(p or "BIS").upper() for p in preferences[:20]]
+
+    mixed = EnvironmentalCalculator.calculate_batch(matrix, registry, standard_index=index)
+    side_by_side = EnvironmentalCalculator.calculate_batch_all(matrix, registry)
+    for key, values in mixed.items():
+        assert np.allclose(values, side_by_side[key][index, np.arange(len(matrix))], rtol=1e-12)
+
+    # Manganese alone: HPI is 100 exactly at the standard's own limit
+    single = np.full((1, len(METAL_ORDER)), np.nan)
+    single[0, METAL_INDEX["manganese"]] = WHO_STANDARDS["manganese"]["Si"]
+    who = EnvironmentalCalculator.calculate_batch(single, registry, standard_index=registry.standard_indices(["WHO"]))
+    assert who["hpi"][0] == 100.0
+
+def test_batch_health_risk_for_every_profile():
+    rng = np.random.default_rng(3)
+    matrix = rng.lognormal(-4, 2, size=(200, len(METAL_ORDER)))
+    matrix[rng.random(matrix.shape) < 0.5] = np.nan
+
+    profiles = dict(EXPOSURE_DEFAULTS)
+    profiles["pregnant"] = {"BW": 60.0, "IR": 3.0, "EF": 365, "ED": 1, "AT": 365}
+    calc = EnvironmentalCalculator()
+    batch = calc.calculate_batch(matrix, profiles=profiles)
+    assert batch["profile_hazard_index"].shape == (len(matrix), len(profiles))
+
+    for i, row in enumerate(matrix[:50]):
+        data = {METAL_ORDER[j]: v for j, v in enumerate(row) if not np.isnan(v)}
+        for k, (name, params) in enumerate(profiles.items()):
+            if name in EXPOSURE_DEFAULTS:
+                expected = calc.calculate_health_risk(data, group=name)
+                assert np.isclose(batch["profile_hazard_index"][i, k], expected["hazard_index"], rtol=1e-12)
+                assert np.isclose(batch["profile_cancer_risk"][i, k], expected["cancer_risk"], rtol=1e-12)
+    # The headline values are the child profile's column
+    assert np.array_equal(batch["hazard_index"], batch["profile_hazard_index"][:, list(profiles).index("child")])
+
 if __name__ == "__main__":
     test_hpi_example()
     test_risk_assessment()
@@ -0,0 +1,86 @@
+import random
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.db.database import SessionLocal, init_db
+from app.db.models.summary import ResearcherStats
+from app.db.models.user import User, UserRole
+from app.services import dashboard
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_auth_header
+
+client = TestClient(app)
+
+def setup_module(module):
+    init_db()
+
+def upload(headers, rows):
+    lines = ["Location,State,District,Latitude,Longitude,Year,As (ppb),Pb (ppb)"]
+    for _ in range(rows):
+        lines.append(
+            f"Site {random.random():.6f},Uttar Pradesh,Aligarh,{random.uniform(20, 30):.6f},{random.uniform(70, 85):.6f},2024,"
+            f"{random.uniform(0, 80):.2f},{random.uniform(0, 40):.2f}"
+        )
+    files = {"file": ("dashboard.csv", "\n".join(lines), "text/csv")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 202
+    return response.json()["dataset_id"]
+
+def both_modes(headers, monkeypatch):
+    monkeypatch.setattr(settings, "DASHBOARD_SUMMARY", False)
+    live = client.get("/api/v1/researcher/dashboard-stats", headers=headers).json()
+    monkeypatch.setattr(settings, "DASHBOARD_SUMMARY", True)
+    summary = client.get("/api/v1/researcher/dashboard-stats", headers=headers).json()
+    # Running sums may differ from a fresh SUM in the last bits, which can flip a rounded average
+    for key in ("avg_hpi", "avg_mi"):
+        if key in summary:
+            summary[key] = pytest.approx(summary[key], abs=0.011)
+    for item in summary["metal_averages"]:
+        item["value"] = pytest.approx(item["value"], rel=1e-9)
+    return live, summary
+
+def test_summary_tracks_uploads_assessments_and_deletes(monkeypatch):
+    email = "dashboard@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    first = upload(headers, 30)
+    # Builds the summary row before anything is assessed
+    live, summary = both_modes(headers, monkeypatch)
+    assert live == summary and live["total_samples"] >= 30
+
+    upload(headers, 20)
+    drain()
+    live, summary = both_modes(headers, monkeypatch)
+    assert live == summary
+    assert sum(live["risk_distribution"].values()) == live["total_samples"]
+
+    assert client.delete(f"/api/v1/researcher/uploads/{first}", headers=headers).status_code == 200
+    live, summary = both_modes(headers, monkeypatch)
+    assert live == summary
+
+def test_build_keeps_a_row_built_while_waiting_for_the_lock(monkeypatch):
+    email = "dashboard-race@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    upload(headers, 5)
+    drain()
+
+    db = SessionLocal()
+    try:
+        user_id = db.query(User.id).filter(User.email == email).scalar()
+        db.query(ResearcherStats).filter(ResearcherStats.uploader_id == user_id).delete()
+        db.commit()
+        # Another request builds the row (and writers add to it) before this build gets the lock
+        built = dashboard._build(db, user_id)
+        db.commit()
+        built.samples += 100
+        db.commit()
+        monkeypatch.setattr(dashboard, "aggregate", lambda *args, **kwargs: pytest.fail("rebuilt an existing row"))
+        assert dashboard._build(db, user_id).samples == built.samples
+    finally:
+        db.rollback()
+        db.query(ResearcherStats).filter(ResearcherStats.uploader_id == user_id).delete()
+        db.commit()
+        db.close()
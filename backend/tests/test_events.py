@@ -0,0 +1,182 @@
+import asyncio
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select
+from app.core.config import settings
+from app.main import app
+from app.api.v1.events import event_stream
+from app.db.database import SessionLocal, init_db
+from app.db.models.event import Event
+from app.db.models.user import User, UserRole
+from app.services import events
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_admin_header, get_auth_header
+
+client = TestClient(app)
+
+def setup_module(module):
+    init_db()
+
+def user_id(email):
+    db = SessionLocal()
+    try:
+        return db.query(User).filter(User.email == email).first().id
+    finally:
+        db.close()
+
+def broker(monkeypatch):
+    """A broker polled by hand instead of by its thread."""
+    instance = events.Broker()
+    monkeypatch.setattr(instance, "start", lambda interval: None)
+    return instance
+
+def received(subscription):
+    found = []
+    while not subscription.queue.empty():
+        found.append(subscription.queue.get_nowait())
+    return found
+
+def upload(headers, rows, hot):
+    lines = ["Location,State,District,Latitude,Longitude,Date,As (ppb),Pb (ppb)"]
+    # Fresh coordinates per call; rows already imported by an earlier run would be skipped as duplicates
+    offset = uuid.uuid4().int % 10**6 / 10**7
+    for k in range(rows):
+        arsenic = 250.0 if k < hot else 0.5
+        lines.append(f"Event site {k},Eventland,North,{-33 + offset + k * 0.001:.7f},{151 + k * 0.001:.4f},2023-06-01,{arsenic},1.0")
+    files = {"file": ("events.csv", "\n".join(lines), "text/csv")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 202
+    return response.json()["dataset_id"]
+
+def test_events_reach_their_recipients(monkeypatch):
+    suffix = uuid.uuid4().hex[:8]
+    owner, other = f"events-owner-{suffix}@example.com", f"events-other-{suffix}@example.com"
+    create_test_user(owner, UserRole.researcher)
+    create_test_user(other, UserRole.researcher)
+    headers = get_auth_header(owner)
+    hub = broker(monkeypatch)
+
+    async def run():
+        subscribers = [hub.subscribe(user_id(owner)), hub.subscribe(user_id(other)), hub.subscribe(None, [events.SAMPLES_HAZARDOUS])]
+        db = SessionLocal()
+        try:
+            hub.poll(db)  # Marks where this session starts
+            start = events.latest_id(db)
+            dataset = upload(headers, 30, hot=3)
+            drain()
+            assert hub.poll(db) > 0
+        finally:
+            db.close()
+        await asyncio.sleep(0)  # Lets the queued deliveries run
+        # Only what this test caused, whatever else the database has seen
+        return dataset, [[e for e in received(s) if e["id"] > start] for s in subscribers]
+
+    dataset, (mine, theirs, public) = asyncio.run(run())
+    kinds = [e["kind"] for e in mine]
+    assert kinds[0] == events.DATASET_PROGRESS and kinds[-1] == events.RISK_COMPLETED
+    progress = [e["payload"] for e in mine if e["kind"] == events.DATASET_PROGRESS]
+    assert progress[-1]["status"] == "completed" and progress[-1]["samples"] == 30
+    assessed = [e["payload"] for e in mine if e["kind"] == events.RISK_ASSESSED]
+    assert sum(p["samples"] for p in assessed) == 30 and sum(p["hazardous"] for p in assessed) == 3
+    assert mine[-1]["payload"] == {"dataset_id": dataset, "samples": 30}
+
+    hazardous = [e for e in mine if e["kind"] == events.SAMPLES_HAZARDOUS]
+    assert [e["id"] for e in public] == [e["id"] for e in hazardous] == [e["id"] for e in theirs]
+    flagged = hazardous[0]["payload"]["samples"]
+    assert hazardous[0]["payload"]["count"] == 3
+    assert {s["location_name"] for s in flagged} == {"Event site 0", "Event site 1", "Event site 2"}
+    assert all(s["risk"]["hpi"] > 100 and {m["metal"] for m in s["measurements"]} for s in flagged)
+
+    # Re-assessing samples that are already Hazardous announces nothing new
+    assert client.put("/api/v1/standards/BIS/Pb", json={"mac": 0.011, "note": "events test"}, headers=get_admin_header()).status_code == 202
+    db = SessionLocal()
+    try:
+        after = events.latest_id(db)
+        drain()
+        assert not [e for e in events.since(db, after) if e["kind"] == events.SAMPLES_HAZARDOUS]
+    finally:
+        db.close()
+
+def test_poll_fills_gaps_left_by_late_commits(monkeypatch):
+    hub = broker(monkeypatch)
+
+    async def run():
+        subscription = hub.subscribe(None)
+        db = SessionLocal()
+        try:
+            hub.poll(db)
+            for k in range(3):
+                events.publish(db, events.SAMPLES_HAZARDOUS, {"count": k})
+            db.commit()
+            ids = sorted(db.scalars(select(Event.id).order_by(Event.id.desc()).limit(3)).all())
+            # The middle id commits after the poll has passed it
+            db.execute(delete(Event).where(Event.id == ids[1]))
+            db.commit()
+            hub.poll(db)
+            await asyncio.sleep(0)
+            first = [e["id"] for e in received(subscription)]
+            db.add(Event(id=ids[1], kind=events.SAMPLES_HAZARDOUS, payload={"count": 1}))
+            db.commit()
+            hub.poll(db)
+            await asyncio.sleep(0)
+            return ids, first, [e["id"] for e in received(subscription)]
+        finally:
+            db.close()
+
+    ids, first, late = asyncio.run(run())
+    assert first == [ids[0], ids[2]]
+    assert late == [ids[1]]
+
+def test_stream_replays_after_last_event_id(monkeypatch):
+    monkeypatch.setattr(settings, "EVENT_HEARTBEAT_SECONDS", 0.01)
+    hub = broker(monkeypatch)
+    monkeypatch.setattr(events, "broker", hub)
+
+    class Gone:
+        async def is_disconnected(self):
+            return True
+
+    someone = "events-someone@example.com"
+    create_test_user(someone, UserRole.citizen)
+
+    async def run():
+        db = SessionLocal()
+        try:
+            after = events.latest_id(db)
+            events.publish(db, events.SAMPLES_HAZARDOUS, {"count": 7})
+            events.publish(db, events.RISK_COMPLETED, {"dataset_id": 1, "samples": 1}, user_id=user_id(someone))
+            db.commit()
+        finally:
+            db.close()
+        subscription = hub.subscribe(None)
+        return [chunk async for chunk in event_stream(Gone(), subscription, after)]
+
+    chunks = asyncio.run(run())
+    assert chunks[0].startswith(b"retry:")
+    # Another user's event is not replayed; the stream ends when the client is gone
+    assert len(chunks) == 2 and b"event: samples.hazardous\ndata: {\"count\":7}\n\n" in chunks[1]
+    assert not hub._subscribers
+
+def test_stream_ends_at_its_time_limit_with_a_resume_point(monkeypatch):
+    monkeypatch.setattr(settings, "EVENT_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "EVENT_STREAM_MAX_SECONDS", 0.05)
+    hub = broker(monkeypatch)
+    monkeypatch.setattr(events, "broker", hub)
+
+    class Listening:
+        async def is_disconnected(self):
+            return False
+
+    async def run():
+        subscription = hub.subscribe(None, [events.RISK_COMPLETED])
+        return [chunk async for chunk in event_stream(Listening(), subscription, 12345)]
+
+    chunks = asyncio.run(run())
+    assert chunks[0].endswith(b"id: 12345\n\n") and b": keep-alive\n\n" in chunks
+    assert chunks[-1] == b"id: 12345\n\n"
+
+def test_stream_rejects_bad_requests():
+    assert client.get("/api/v1/events/stream", params={"kinds": "weather"}).status_code == 400
+    assert client.get("/api/v1/events/stream", params={"token": "not-a-token"}).status_code == 401
+    assert client.get("/api/v1/events/stream", headers={"Last-Event-ID": "abc"}).status_code == 400
@@ -0,0 +1,24 @@
+from app.services import geo
+
+
+def test_geohash_known_values():
+    assert geo.encode(42.6, -5.6, 5) == "ezs42"
+    assert geo.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert list(geo.encode_many([42.6, 57.64911], [-5.6, 10.40744], 5)) == ["ezs42", "u4pru"]
+
+
+def test_cover_contains_every_point_in_the_box():
+    box = geo.BBox(72.8, 18.9, 73.0, 19.1)
+    ranges = geo.cover(box)
+    assert len(ranges) <= geo.MAX_COVER_CELLS
+    for lat in (18.9, 19.0, 19.1):
+        for lng in (72.8, 72.9, 73.0):
+            code = geo.encode(lat, lng)
+            assert any(lo <= code and (hi is None or code < hi) for lo, hi in ranges)
+
+
+def test_cover_across_the_antimeridian():
+    ranges = geo.cover(geo.BBox(179.5, 0.0, -179.5, 1.0))
+    for lng in (179.9, -179.9):
+        code = geo.encode(0.5, lng)
+        assert any(lo <= code < hi for lo, hi in ranges)
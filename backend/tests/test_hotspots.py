@@ -0,0 +1,123 @@
+import random
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app.core.config import settings
+from app.main import app
+from app.db.database import SessionLocal, init_db
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample
+from app.db.models.user import UserRole
+from app.services import geo, hotspots
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_admin_header, get_auth_header
+
+client = TestClient(app)
+STATE = "Hotspotland"
+
+def setup_module(module):
+    init_db()
+
+def dense_gi_star(lat, lng, x, radius_km):
+    """Textbook Gi* with a dense binary weight matrix."""
+    n = len(x)
+    w = (geo.haversine_km(lat[:, None], lng[:, None], lat[None, :], lng[None, :]) <= radius_km).astype(float)
+    mean, s = x.mean(), np.sqrt((x ** 2).mean() - x.mean() ** 2)
+    wsum = w.sum(axis=1)
+    return (w @ x - mean * wsum) / (s * np.sqrt((n * (w ** 2).sum(axis=1) - wsum ** 2) / (n - 1))), wsum - 1
+
+def test_gi_star_and_components_match_dense_versions():
+    rng = np.random.default_rng(5)
+    lat, lng = rng.uniform(10, 11, 400), rng.uniform(70, 71, 400)
+    x = rng.gamma(2.0, 30.0, 400)
+    i, j, _ = geo.pairs_within(lat, lng, 8.0)
+    z, neighbours = hotspots.gi_star(x, i, j)
+    expected, expected_neighbours = dense_gi_star(lat, lng, x, 8.0)
+    assert np.allclose(z, expected)
+    assert (neighbours == expected_neighbours).all()
+
+    members = z > 1.0
+    labels = hotspots.components(members, i, j)
+    assert (labels[~members] == 0).all()
+    joined = members[i] & members[j]
+    assert (labels[i[joined]] == labels[j[joined]]).all()
+    sizes = [int((labels == c).sum()) for c in range(1, labels.max() + 1)]
+    assert sizes == sorted(sizes, reverse=True)
+
+def upload(headers, state, rows, hot):
+    lines = ["Location,State,District,Latitude,Longitude,Date,As (ppb),Pb (ppb)"]
+    for k in range(rows):
+        # A contaminated patch in the south-west corner of an otherwise clean area
+        if k < hot:
+            lat, lng, arsenic = random.uniform(-20.0, -19.9), random.uniform(30.0, 30.1), random.uniform(100, 300)
+        else:
+            lat, lng, arsenic = random.uniform(-20.0, -19.4), random.uniform(30.0, 30.6), random.uniform(0, 2)
+        lines.append(f"Spot {random.random():.6f},{state},South,{lat:.6f},{lng:.6f},2023-05-01,{arsenic:.3f},1.0")
+    files = {"file": ("hotspots.csv", "\n".join(lines), "text/csv")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 202
+    return response.json()["dataset_id"]
+
+def analysis(**params):
+    response = client.get(f"/api/v1/hotspots/{STATE}", params={"min_confidence": 90, "limit": 5000, **params})
+    assert response.status_code == 200
+    return response.json()
+
+def test_hotspots_follow_uploads_and_standards():
+    email = "hotspots@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    dataset = upload(headers, STATE, 150, hot=20)
+    drain()
+    result = analysis()
+    assert result["samples"] == 150 and not result["stale"]
+    assert result["cluster_count"] == len(result["clusters"]) >= 1
+    hot = [s for s in result["spots"] if s["type"] == "hot"]
+    # Hot spots sit in the patch or within a neighbourhood of it
+    assert hot and all(s["lat"] <= -19.8 and s["lng"] <= 30.2 for s in hot if s["confidence"] >= 95)
+    assert -20.0 <= result["clusters"][0]["lat"] <= -19.85
+    assert result["clusters"][0]["samples"] >= 5
+
+    # Stored z-scores match a dense computation over the state's samples
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Sample.id, Sample.lat, Sample.lng, RiskAssessment.hpi)
+            .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+            .where(Sample.state == STATE)
+        ).all()
+    finally:
+        db.close()
+    ids, lat, lng, hpi = (np.array(c) for c in zip(*rows))
+    z, neighbours = dense_gi_star(lat.astype(float), lng.astype(float), hpi.astype(float), settings.HOTSPOT_DISTANCE_KM)
+    expected = {int(k): v for k, v, m in zip(ids, z, neighbours) if abs(v) >= 1.645 and m >= hotspots.MIN_NEIGHBOURS}
+    assert {s["sample_id"]: pytest.approx(expected[s["sample_id"]]) for s in result["spots"]} == expected
+
+    # Another state's upload leaves this state's run alone
+    upload(headers, "Elsewhere", 10, hot=0)
+    drain()
+    assert analysis()["computed_at"] == result["computed_at"]
+    listed = client.get("/api/v1/hotspots/").json()["regions"]
+    assert {STATE, "Elsewhere"} <= {r["state"] for r in listed}
+
+    # A standards change re-assesses the samples, giving a run under the new version
+    response = client.put("/api/v1/standards/BIS/As", json={"mac": 0.02, "note": "hotspot test"}, headers=get_admin_header())
+    assert response.status_code == 202
+    drain()
+    latest = analysis()
+    assert latest["standards_version"] == client.get("/api/v1/standards/").json()["version"]
+    assert latest["standards_version"] != result["standards_version"]
+    # Runs from before any published standards are version 0
+    assert analysis(standards_version=result["standards_version"] or 0)["computed_at"] == result["computed_at"]
+
+    assert client.delete(f"/api/v1/researcher/uploads/{dataset}", headers=headers).status_code == 200
+    drain()
+    assert analysis()["samples"] == 0
+
+def test_hotspots_reject_bad_parameters():
+    assert client.get(f"/api/v1/hotspots/{STATE}", params={"min_confidence": 80}).status_code == 400
+    assert client.get(f"/api/v1/hotspots/{STATE}", params={"kind": "warm"}).status_code == 400
+    assert client.get("/api/v1/hotspots/Nowhere").status_code == 404
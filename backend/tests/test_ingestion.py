@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from app.services.ingestion import ColumnMap, iter_upload_chunks, normalize_frame, natural_key, natural_keys
+
+
+def make_frame():
+    return pd.DataFrame({
+        "State": ["Kerala", "Kerala", None],
+        "District": ["Idukki", "Idukki", "Wayanad"],
+        "Location": ["Munnar", "Munnar", "Kalpetta"],
+        "Longitude": [77.06, 77.06, "bad"],
+        "Latitude": [10.08, 10.08, 11.6],
+        "Year": [2023, 2023, 2022],
+        "Fe (ppm)": [0.53, "-", 0.2],
+        "As (ppb)": [12.0, None, 5.0],
+    })
+
+
+def test_detect_columns():
+    columns = ColumnMap.detect(make_frame().columns)
+    assert columns.lat == "Latitude"
+    assert columns.lng == "Longitude"
+    assert columns.time == "Year"
+    assert columns.metals == ["Fe (ppm)", "As (ppb)"]
+
+
+def test_normalize_frame_melts_and_converts_units():
+    df = make_frame()
+    samples, measurements = normalize_frame(df, ColumnMap.detect(df.columns))
+
+    # Row with an unparseable longitude is dropped
+    assert len(samples) == 2
+    assert samples["timestamp"].iloc[0] == pd.Timestamp(2023, 1, 1)
+    assert samples["state"].tolist() == ["Kerala", "Kerala"]
+
+    readings = sorted(zip(measurements["row"], measurements["metal"], measurements["concentration"]))
+    assert readings == [(0, "As", 0.012), (0, "Fe", 0.53)]
+
+
+def test_natural_key_matches_vectorized_keys():
+    df = make_frame()
+    samples, _ = normalize_frame(df, ColumnMap.detect(df.columns))
+    keys = natural_keys(samples)
+
+    assert keys.iloc[0] == keys.iloc[1]
+    assert keys.iloc[0] == natural_key(10.08, 77.06, datetime(2023, 1, 1), "Munnar")
+    assert natural_key(10.08, 77.06, datetime(2023, 1, 1), None) != keys.iloc[0]
+
+
+@pytest.mark.parametrize("format", ["csv", "parquet", "arrow", "xlsx"])
+def test_every_upload_format_normalizes_like_csv(tmp_path, format):
+    df = make_frame()
+    # Typed columns, as a columnar export would carry them
+    df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
+    df["Fe (ppm)"] = pd.to_numeric(df["Fe (ppm)"], errors="coerce")
+    path = str(tmp_path / f"upload.{format}")
+    if format == "csv":
+        df.to_csv(path, index=False)
+    elif format == "parquet":
+        pytest.importorskip("pyarrow")
+        df.to_parquet(path, index=False)
+    elif format == "arrow":
+        pytest.importorskip("pyarrow")
+        df.to_feather(path)
+    else:
+        pytest.importorskip("openpyxl")
+        df.to_excel(path, index=False)
+
+    chunks = list(iter_upload_chunks(path, format, chunk_rows=2))
+    assert [len(c) for c in chunks] == [2, 1]
+    frame = pd.concat(chunks, ignore_index=True)
+    samples, measurements = normalize_frame(frame, ColumnMap.detect(frame.columns))
+
+    assert samples["location_name"].tolist() == ["Munnar", "Munnar"]
+    assert samples["timestamp"].iloc[0] == pd.Timestamp(2023, 1, 1)
+    readings = sorted(zip(measurements["row"], measurements["metal"], measurements["concentration"]))
+    assert readings == [(0, "As", 0.012), (0, "Fe", 0.53)]
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.db.database import SessionLocal, init_db
+from app.db.models.job import Job
+from app.services import jobs
+
+def setup_module(module):
+    init_db()
+
+def running_job(db, worker_id, attempts, seconds_ago):
+    job = Job(
+        kind="test_job", payload={}, status="running", attempts=attempts, max_attempts=3,
+        locked_by=worker_id, locked_at=datetime.utcnow() - timedelta(seconds=seconds_ago),
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+def test_stale_jobs_are_requeued_until_out_of_attempts():
+    db = SessionLocal()
+    try:
+        old = settings.JOB_LOCK_TIMEOUT_SECONDS + 60
+        retry = running_job(db, "dead:1:0", attempts=1, seconds_ago=old)
+        crashing = running_job(db, "dead:1:1", attempts=3, seconds_ago=old)
+        fresh = running_job(db, "alive:2:0", attempts=1, seconds_ago=5)
+
+        requeued, failed = jobs.requeue_stale(db)
+        assert requeued >= 1 and failed >= 1
+        for job in (retry, crashing, fresh):
+            db.refresh(job)
+        assert (retry.status, retry.locked_by) == ("queued", None)
+        # Killed its worker on every attempt: given up on instead of looping forever
+        assert crashing.status == "failed" and crashing.finished_at is not None and crashing.last_error
+        assert fresh.status == "running"
+    finally:
+        db.query(Job).filter(Job.kind == "test_job").delete()
+        db.commit()
+        db.close()
+
+def test_heartbeat_keeps_long_jobs_locked():
+    db = SessionLocal()
+    try:
+        old = settings.JOB_LOCK_TIMEOUT_SECONDS + 60
+        long_running = running_job(db, "busy:3:0", attempts=1, seconds_ago=old)
+        other = running_job(db, "busy:4:0", attempts=1, seconds_ago=old)
+
+        assert jobs.heartbeat(db, ["busy:3:0", "busy:3:1"]) == 1
+        jobs.requeue_stale(db)
+        db.refresh(long_running)
+        db.refresh(other)
+        assert long_running.status == "running" and long_running.locked_by == "busy:3:0"
+        assert other.status == "queued"
+    finally:
+        db.query(Job).filter(Job.kind == "test_job").delete()
+        db.commit()
+        db.close()
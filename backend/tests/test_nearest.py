@@ -0,0 +1,139 @@
+import random
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app.main import app
+from app.db.database import SessionLocal, init_db
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample
+from app.db.models.user import UserRole
+from app.services import geo, nearest
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_admin_header, get_auth_header
+
+client = TestClient(app)
+
+def setup_module(module):
+    init_db()
+
+def test_grid_matches_brute_force():
+    rng = np.random.default_rng(7)
+    n = 5000
+    columns = {name: np.empty(n, dtype=object) for name in nearest.COLUMNS}
+    columns.update(
+        assessment_id=np.arange(n), sample_id=np.arange(n), hpi=rng.uniform(0, 200, n),
+        lat=rng.uniform(-90, 90, n), lng=rng.uniform(-180, 180, n),
+    )
+    grid = nearest.GridIndex.build(columns, cell_degrees=2.0)
+    # Includes a pole and both sides of the antimeridian
+    for lat, lng, radius in [(89.5, 10.0, 400.0), (-10.0, 179.9, 600.0), (5.0, -179.5, 300.0), (30.0, 40.0, 2500.0)]:
+        rows, distances = grid.nearest(lat, lng, 10, radius)
+        truth = geo.haversine_km(lat, lng, columns["lat"], columns["lng"])
+        expected = np.sort(truth[truth <= radius])[:10]
+        assert np.allclose(distances, expected)
+        assert set(grid.columns["sample_id"][rows]) == set(np.flatnonzero(np.isin(truth, expected)))
+
+def upload(headers, rows):
+    # Straddles the antimeridian, away from every other test's samples
+    lines = ["Location,State,District,Latitude,Longitude,Date,As (ppb),Pb (ppb)"]
+    for i in range(rows):
+        lng = random.uniform(179.8, 180.0) if i % 2 else random.uniform(-180.0, -179.8)
+        lines.append(f"Near {i},Nearland,East,{random.uniform(-40.2, -40.0):.6f},{lng:.6f},2023-05-01,{random.uniform(0, 30):.3f},{random.uniform(0, 30):.3f}")
+    files = {"file": ("nearest.csv", "\n".join(lines), "text/csv")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 202
+    return response.json()["dataset_id"]
+
+def lookup(lat, lng, k, radius_km):
+    response = client.get("/api/v1/nearest/", params={"lat": lat, "lng": lng, "k": k, "radius_km": radius_km})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+def brute_force(lat, lng, k, radius_km):
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Sample.id, Sample.lat, Sample.lng, RiskAssessment.risk_category)
+            .join(RiskAssessment, RiskAssessment.sample_id == Sample.id)
+        ).all()
+    finally:
+        db.close()
+    ids, lats, lngs, categories = zip(*rows)
+    distances = geo.haversine_km(lat, lng, np.array(lats), np.array(lngs))
+    order = [i for i in np.argsort(distances, kind="stable") if distances[i] <= radius_km][:k]
+    return [(ids[i], categories[i]) for i in order]
+
+def test_nearest_follows_uploads_reassessments_and_deletes():
+    email = "nearest@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    point = (-40.1, 180.0, 10, 30.0)
+
+    first = upload(headers, 30)
+    drain()
+    nearest.index.refresh()
+    results = lookup(*point)
+    assert len(results) == 10
+    assert [(r["sample_id"], r["risk_category"]) for r in results] == brute_force(*point)
+    assert [r["distance_km"] for r in results] == sorted(r["distance_km"] for r in results)
+
+    # New assessments are appended without a rebuild
+    second = upload(headers, 30)
+    drain()
+    assert nearest.index.refresh() == "appended"
+    assert [(r["sample_id"], r["risk_category"]) for r in lookup(*point)] == brute_force(*point)
+
+    # Re-assessment under a tighter limit, then deletes, rebuild the index
+    response = client.put("/api/v1/standards/BIS/Pb", json={"mac": 0.001, "note": "nearest test"}, headers=get_admin_header())
+    assert response.status_code == 202
+    drain()
+    assert nearest.index.refresh() == "rebuilt"
+    assert [(r["sample_id"], r["risk_category"]) for r in lookup(*point)] == brute_force(*point)
+
+    for dataset_id in (first, second):
+        assert client.delete(f"/api/v1/researcher/uploads/{dataset_id}", headers=headers).status_code == 200
+    assert nearest.index.refresh() == "rebuilt"
+    assert lookup(*point) == []
+
+def test_nearest_rejects_bad_parameters():
+    assert client.get("/api/v1/nearest/", params={"lat": 91, "lng": 0}).status_code == 400
+    assert client.get("/api/v1/nearest/", params={"lat": 0, "lng": 0, "k": 0}).status_code == 400
+    assert client.get("/api/v1/nearest/", params={"lat": 0, "lng": 0, "radius_km": 0}).status_code == 400
+
+def test_assessments_committed_below_the_watermark_are_picked_up():
+    assert nearest.id_holes(3, 9, np.array([1, 4, 5, 8])) == [(3, 3), (6, 7), (9, 9)]
+
+    email = "nearest-late@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    datasets = [upload(headers, 10)]
+    drain()
+    nearest.index.refresh()
+
+    datasets.append(upload(headers, 10))
+    drain()
+    table = RiskAssessment.__table__
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(table).join(Sample, Sample.id == table.c.sample_id)
+            .where(Sample.dataset_id == datasets[1]).order_by(table.c.id)
+        ).mappings().all()
+        # The first chunk's transaction is still open while a later one commits
+        late = [dict(row) for row in rows[:2]]
+        db.execute(table.delete().where(table.c.id.in_([row["id"] for row in late])))
+        db.commit()
+        assert nearest.index.refresh() == "appended"
+        indexed = set(nearest.index.grid().columns["sample_id"].tolist())
+        assert {row["sample_id"] for row in rows[2:]} <= indexed
+        assert not {row["sample_id"] for row in late} & indexed
+
+        db.execute(table.insert(), late)
+        db.commit()
+        assert nearest.index.refresh() == "appended"
+        assert {row["sample_id"] for row in rows} <= set(nearest.index.grid().columns["sample_id"].tolist())
+    finally:
+        db.close()
+    for dataset_id in datasets:
+        assert client.delete(f"/api/v1/researcher/uploads/{dataset_id}", headers=headers).status_code == 200
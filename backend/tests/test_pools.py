@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from app.services.pools import BoundedPool, PoolBusy
+
+def test_pool_bounds_running_and_waiting_calls():
+    pool = BoundedPool("test", workers=1, queue=1)
+    gate = threading.Event()
+
+    async def run():
+        first = asyncio.create_task(pool.run(gate.wait, 10))
+        second = asyncio.create_task(pool.run(lambda a, b: a + b, 2, b=3))
+        await asyncio.sleep(0.05)
+        stats = pool.stats()
+        assert (stats["running"], stats["waiting"], stats["rejected"], stats["completed"]) == (1, 1, 0, 0)
+        assert pool.busy
+        with pytest.raises(PoolBusy):
+            await pool.run(print)
+        gate.set()
+        return await first, await second
+
+    assert asyncio.run(run()) == (True, 5)
+    stats = pool.stats()
+    assert (stats["running"], stats["waiting"], stats["rejected"], stats["completed"]) == (0, 0, 1, 2)
+    # The second call waited for the first, which held the only thread
+    assert stats["wait_ms"]["p99"] >= 40 and stats["run_ms"]["p99"] >= 40
+    pool.shutdown()
+
+def test_sync_callers_share_the_bounds():
+    pool = BoundedPool("test", workers=1, queue=0)
+    gate = threading.Event()
+    holder = threading.Thread(target=pool.call, args=(gate.wait, 10))
+    holder.start()
+    while not pool.running:
+        time.sleep(0.01)
+    with pytest.raises(PoolBusy):
+        pool.call(print)
+    gate.set()
+    holder.join()
+    assert pool.call(sum, [1, 2]) == 3
+    pool.shutdown()
+
+def test_pool_passes_exceptions_through():
+    pool = BoundedPool("test", workers=2, queue=0)
+
+    def fail():
+        raise ValueError("bad row")
+
+    with pytest.raises(ValueError):
+        asyncio.run(pool.run(fail))
+    assert not pool.busy
+    pool.shutdown()
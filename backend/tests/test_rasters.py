@@ -0,0 +1,113 @@
+import random
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app.core.config import settings
+from app.main import app
+from app.db.database import SessionLocal, init_db
+from app.db.models.raster import RasterRegion
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample
+from app.db.models.user import UserRole
+from app.services import geo, rasters
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_auth_header
+
+client = TestClient(app)
+STATE = "Rasterland"
+
+def setup_module(module):
+    init_db()
+
+@pytest.fixture(autouse=True)
+def raster_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RASTER_DIR", str(tmp_path))
+
+def upload(headers, rows, lat, lng):
+    lines = ["Location,State,District,Latitude,Longitude,Date,As (ppb),Pb (ppb)"]
+    for i in range(rows):
+        lines.append(f"Raster {random.random():.6f},{STATE},West,{lat + random.uniform(-0.3, 0.3):.6f},{lng + random.uniform(-0.3, 0.3):.6f},2023-05-01,{random.uniform(0, 30):.3f},{random.uniform(0, 30):.3f}")
+    files = {"file": ("rasters.csv", "\n".join(lines), "text/csv")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 202
+    return response.json()["dataset_id"]
+
+def region():
+    db = SessionLocal()
+    try:
+        found = db.get(RasterRegion, STATE)
+        return found, np.array(rasters.open_raster(found)) if found else None
+    finally:
+        db.close()
+
+def brute_force(cell_lat, cell_lng):
+    """IDW of HPI at one cell centre over every assessed sample in the database."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(Sample.lat, Sample.lng, RiskAssessment.hpi).join(RiskAssessment, RiskAssessment.sample_id == Sample.id)).all()
+    finally:
+        db.close()
+    lat, lng, hpi = (np.array(c, dtype=float) for c in zip(*rows))
+    distance = geo.haversine_km(cell_lat, cell_lng, lat, lng)
+    near = distance <= settings.IDW_RADIUS_KM
+    if not near.any():
+        return np.nan
+    weight = np.maximum(distance[near], rasters.MIN_DISTANCE_KM) ** -settings.IDW_POWER
+    return float((weight * hpi[near]).sum() / weight.sum())
+
+def check_cells(found, data, count=40):
+    d, b = found.cell_degrees, found.block_cells
+    rng = np.random.default_rng(3)
+    # Mostly interpolated cells, plus some beyond every sample's radius
+    finite = np.argwhere(np.isfinite(data[0]))
+    cells = [tuple(c) for c in finite[rng.choice(len(finite), min(count, len(finite)), replace=False)]]
+    cells += list(zip(rng.integers(0, data.shape[1], count // 4), rng.integers(0, data.shape[2], count // 4)))
+    for row, col in cells:
+        cell_lat = -90 + (found.block_row * b + row + 0.5) * d
+        cell_lng = -180 + (found.block_col * b + col + 0.5) * d
+        expected = brute_force(cell_lat, cell_lng)
+        assert data[0, row, col] == pytest.approx(expected, rel=1e-4, nan_ok=True)
+
+def test_rasters_follow_uploads_and_deletes():
+    email = "rasters@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    first = upload(headers, 60, -30.0, 20.0)
+    drain()
+    found, data = region()
+    assert found.version >= 1
+    assert np.isfinite(data[0]).any() and np.isnan(data[0]).any()
+    check_cells(found, data)
+
+    # A second dataset inside the same extent only rewrites the blocks around it
+    version = found.version
+    second = upload(headers, 20, -30.2, 20.2)
+    drain()
+    after, updated = region()
+    assert after.version == version + 1
+    changed = np.argwhere(np.any(~np.isclose(data, updated, equal_nan=True), axis=0))
+    assert len(changed)
+    for row, col in changed:
+        cell_lat = -90 + (after.block_row * after.block_cells + row + 0.5) * after.cell_degrees
+        cell_lng = -180 + (after.block_col * after.block_cells + col + 0.5) * after.cell_degrees
+        assert geo.haversine_km(cell_lat, cell_lng, np.array([-30.2]), np.array([20.2]))[0] < 0.3 * 111 * 1.5 + settings.IDW_RADIUS_KM
+    check_cells(after, updated)
+
+    # Heatmap tiles are PNGs; a tile over the samples has opaque pixels
+    response = client.get("/api/v1/tiles/heatmap/hpi/6/35/37.png")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content.startswith(b"\x89PNG\r\n\x1a\n")
+    assert not np.isnan(rasters.sample_tile(SessionLocal(), "hpi", 6, 35, 37)).all()
+    assert client.get("/api/v1/tiles/heatmap/As/6/35/37.png").status_code == 200
+    assert client.get("/api/v1/tiles/heatmap/unobtainium/6/35/37.png").status_code == 404
+
+    client.delete(f"/api/v1/researcher/uploads/{second}", headers=headers)
+    drain()
+    check_cells(*region())
+    client.delete(f"/api/v1/researcher/uploads/{first}", headers=headers)
+    drain()
+    assert region()[0] is None
@@ -2,16 +2,16 @@ import time
 from app.db.database import SessionLocal, init_db
 from app.schemas.water_quality import CreateSample, MetalConcentration
 from app.api.v1.researchers import create_sample
-from fastapi import BackgroundTasks
 from app.db.models.risk import RiskAssessment
 from app.db.models.user import User, UserRole
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user
 import asyncio
 
 async def test_full_pipeline():
     # 1. Initialize DB and Session
     init_db()
     db = SessionLocal()
-    bg_tasks = BackgroundTasks()
 
     # 2. Mock Researcher Data (Aligarh Hotspot)
     test_data = CreateSample(
@@ -29,12 +29,11 @@ async def test_full_pipeline():
     try:
         # 3. Call the route logic
         # Note: In a real test, you'd use TestClient, but this tests the logic directly
-        mock_user = User(id=1, email="test@example.com", role=UserRole.researcher, is_active=True)
-        response = await create_sample(payload=test_data, background_tasks=bg_tasks, db=db, current_user=mock_user)
+        researcher = create_test_user("researcher@example.com", UserRole.researcher)
+        response = create_sample(payload=test_data, db=db, current_user=researcher)
         
-        # 4. Manually run the background tasks (since we aren't in a real FastAPI loop)
-        for task in bg_tasks.tasks:
-            task.func(*task.args, **task.kwargs)
+        # 4. Run the queued jobs inline (normally picked up by `python -m app.worker`)
+        drain()
 
         # 5. Verify the Results
         time.sleep(1) # Give it a second to commit
@@ -0,0 +1,118 @@
+import random
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.db.database import SessionLocal, init_db
+from app.db.models.job import Job
+from app.db.models.sample import Sample
+from app.db.models.user import UserRole
+from app.services import rollups
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_admin_header, get_auth_header
+
+client = TestClient(app)
+# A fresh state per run, so the counts below see only this run's samples
+STATE = f"Rollup Pradesh {uuid.uuid4().hex[:8]}"
+
+def setup_module(module):
+    init_db()
+
+def upload(headers, rows, district):
+    lines = ["Location,State,District,Latitude,Longitude,Date,As (ppb),Pb (ppb)"]
+    readings = []
+    for _ in range(rows):
+        arsenic, lead = random.uniform(0, 30), random.uniform(0, 30)
+        date = f"{random.choice([2022, 2023])}-{random.randint(1, 12):02d}-15"
+        lines.append(f"Site {random.random():.6f},{STATE},{district},{random.uniform(20, 30):.6f},{random.uniform(70, 85):.6f},{date},{arsenic:.3f},{lead:.3f}")
+        readings.append((date[:4], arsenic / 1000, lead / 1000))
+    files = {"file": ("rollups.csv", "\n".join(lines), "text/csv")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 202
+    return response.json()["dataset_id"], readings
+
+def series(**params):
+    response = client.get("/api/v1/rollups/", params={"state": STATE, **params})
+    assert response.status_code == 200
+    return response.json()["series"]
+
+def rebuilt(**params):
+    """The same query after rebuilding the state's rollups from scratch."""
+    db = SessionLocal()
+    try:
+        for region in rollups.drop_regions(db, Sample.state == STATE):
+            rollups.build(db, *region)
+        db.commit()
+    finally:
+        db.close()
+    expected = series(**params)
+    for entry in expected:
+        entry["mean_hpi"] = pytest.approx(entry["mean_hpi"], abs=0.011)
+        for stats in entry["metals"].values():
+            stats["mean"] = pytest.approx(stats["mean"], rel=1e-9)
+    return expected
+
+def test_rollups_track_assessments_standards_and_deletes():
+    email = "rollups@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    first, readings = upload(headers, 40, "North")
+    drain()
+    yearly = series(district="North")
+    assert sum(entry["samples"] for entry in yearly) == 40
+    for entry in yearly:
+        lead = [pb for year, _, pb in readings if year == entry["period"]]
+        assert entry["metals"]["Pb"]["readings"] == len(lead)
+        assert entry["metals"]["Pb"]["mean"] == pytest.approx(sum(lead) / len(lead), abs=1e-6)
+        assert entry["metals"]["Pb"]["max"] == pytest.approx(max(lead), abs=1e-6)
+    assert yearly == rebuilt(district="North")
+
+    # Months sum to years; a metal filter keeps only that metal
+    monthly = series(district="North", granularity="month", metal="arsenic")
+    assert all(set(entry["metals"]) == {"As"} for entry in monthly)
+    assert sum(e["metals"]["As"]["readings"] for e in monthly) == sum(e["metals"]["As"]["readings"] for e in yearly)
+
+    # Tightening a limit re-assesses the samples and shifts exceedances
+    response = client.put("/api/v1/standards/BIS/As", json={"mac": 0.005, "note": "rollup test"}, headers=get_admin_header())
+    assert response.status_code == 202
+    drain()
+    after = series(district="North")
+    assert sum(e["metals"]["As"]["exceedances"] for e in after) >= sum(e["metals"]["As"]["exceedances"] for e in yearly)
+    assert after == rebuilt(district="North")
+
+    upload(headers, 10, "South")
+    drain()
+    assert client.delete(f"/api/v1/researcher/uploads/{first}", headers=headers).status_code == 200
+    drain()
+    states = series(level="state")
+    assert sum(entry["samples"] for entry in states) == 10
+    assert states == rebuilt(level="state")
+
+    assert client.get("/api/v1/rollups/", params={"granularity": "week"}).status_code == 400
+    assert client.get("/api/v1/rollups/", params={"start": "2023-13"}).status_code == 400
+
+def test_new_district_is_built_by_a_job(monkeypatch):
+    email = "rollups@example.com"
+    create_test_user(email, UserRole.researcher)
+    # Several risk chunks, all before the build runs
+    monkeypatch.setattr(settings, "RISK_BATCH_SIZE", 7)
+    builds = []
+    build = rollups.build
+    monkeypatch.setattr(rollups, "build", lambda db, *region: builds.append(region) or build(db, *region))
+
+    upload(get_auth_header(email), 20, "East")
+    db = SessionLocal()
+    try:
+        queued = db.query(Job).filter(Job.kind == "build_rollups", Job.status == "queued").all()
+        assert not queued
+        drain()
+        queued = [job.payload for job in db.query(Job).filter(Job.kind == "build_rollups").all()]
+        assert {"regions": [[STATE, "East"]]} in queued
+    finally:
+        db.close()
+    # Built once, by the job, and never inline in the risk job's transaction
+    assert builds == [(STATE, "East")]
+    assert sum(entry["samples"] for entry in series(district="East")) == 20
+    assert series(district="East") == rebuilt(district="East")
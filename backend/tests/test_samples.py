@@ -0,0 +1,278 @@
+import asyncio
+import io
+import json
+import random
+import threading
+import uuid
+from datetime import datetime
+import httpx
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.v1 import researchers
+from app.services import columnar, ingestion, pools, tasks
+from app.services.calculator import EnvironmentalCalculator
+from app.services.ingestion import ingest_frame, natural_key
+from app.core.config import settings
+from app.core.constants import METAL_ORDER, METAL_SYMBOLS
+from app.db.database import SessionLocal, init_db
+from app.db.models.dataset import Dataset
+from app.db.models.job import Job
+from app.db.models.risk import RiskAssessment
+from app.db.models.sample import Sample, SourceType
+from app.db.models.user import UserRole
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_auth_header
+
+client = TestClient(app)
+
+def setup_module(module):
+    init_db()
+
+def create_samples(count):
+    email = "samples@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    for _ in range(count):
+        payload = {
+            "latitude": random.uniform(-80, 80),
+            "longitude": random.uniform(-170, 170),
+            "source_type": "Groundwater",
+            "measurements": [{"metal": "As", "concentration": 0.02}, {"metal": "Fe", "concentration": 0.1}]
+        }
+        response = client.post("/api/v1/researcher/samples", json=payload, headers=headers)
+        assert response.status_code == 202
+    drain()
+
+def test_keyset_pages_cover_every_sample_once():
+    create_samples(7)
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3, "fields": "lat,lng,measurements,risk"}
+        if cursor is not None:
+            params["cursor"] = cursor
+        page = client.get("/api/v1/researcher/samples", params=params).json()
+        seen += [item["id"] for item in page["items"]]
+        for item in page["items"]:
+            assert set(item) == {"id", "lat", "lng", "measurements", "risk"}
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == sorted(set(seen))
+    assert len(seen) >= 7
+
+def test_filters_and_projection():
+    page = client.get("/api/v1/researcher/samples", params={"risk_category": "Hazardous", "fields": "risk"}).json()
+    assert page["items"]
+    assert all(item["risk"]["risk_category"] == "Hazardous" for item in page["items"])
+    # MI is read on its own scale
+    assert all(item["risk"]["mi_class"] == EnvironmentalCalculator.classify_mi(item["risk"]["mi"]) for item in page["items"])
+
+    page = client.get("/api/v1/researcher/samples", params={"state": "No Such State"}).json()
+    assert page == {"items": [], "next_cursor": None}
+
+    assert client.get("/api/v1/researcher/samples", params={"fields": "lat,password"}).status_code == 400
+
+def test_streaming_export_matches_pages():
+    page = client.get("/api/v1/researcher/samples", params={"limit": 5000, "fields": "lat,lng,risk"}).json()
+
+    response = client.get("/api/v1/researcher/samples/export", params={"format": "ndjson", "fields": "lat,lng,risk"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows[:len(page["items"])] == page["items"]
+
+    # gzip is decoded transparently by the client
+    response = client.get("/api/v1/researcher/samples/export", params={"format": "json", "gzip": "true", "fields": "lat,lng,risk"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == rows
+
+    assert client.get("/api/v1/researcher/samples/export", params={"format": "xml"}).status_code == 400
+
+def test_wide_table_export_matches_pages():
+    email = "samples@example.com"
+    create_test_user(email, UserRole.researcher)
+    # Readings labelled by name, and one metal without standards
+    csv = "Latitude,Longitude,Year,Arsenic (ppm),Se (ppm)\n12.5,77.5,2024,0.03,0.01\n"
+    files = {"file": ("named.csv", csv, "text/csv")}
+    assert client.post("/api/v1/researcher/upload-csv", files=files, headers=get_auth_header(email)).status_code == 202
+    drain()
+    page = client.get("/api/v1/researcher/samples", params={"limit": 5000, "fields": "measurements,risk"}).json()
+    expected = {item["id"]: item for item in page["items"]}
+
+    response = client.get("/api/v1/researcher/samples/table", params={"format": "csv"})
+    assert response.status_code == 200
+    frame = pd.read_csv(io.BytesIO(response.content))
+    assert list(frame["id"]) == sorted(expected)
+    for row in frame.itertuples(index=False):
+        item = expected[row.id]
+        for m in item["measurements"]:
+            # Symbols and names land in the same METAL_ORDER column; metals without standards have none
+            name = METAL_SYMBOLS.get(m["metal"], m["metal"].lower())
+            if name in METAL_ORDER:
+                assert getattr(row, name) == pytest.approx(m["concentration"])
+        assert row.hpi == pytest.approx(item["risk"]["hpi"])
+
+    if columnar.pa is not None:
+        import pyarrow.parquet as pq
+        parquet = pq.read_table(io.BytesIO(client.get("/api/v1/researcher/samples/table", params={"format": "parquet"}).content)).to_pandas()
+        arrow = columnar.pa.ipc.open_stream(client.get("/api/v1/researcher/samples/table", params={"format": "arrow"}).content).read_pandas()
+        for table in (parquet, arrow):
+            assert list(table["id"]) == list(frame["id"])
+            assert list(table.columns) == list(frame.columns)
+            assert table["arsenic"].to_numpy() == pytest.approx(frame["arsenic"].to_numpy(), nan_ok=True)
+
+    response = client.get("/api/v1/researcher/samples/table", params={"format": "csv", "state": "No Such State"})
+    assert response.text.startswith("id,dataset_id,lat,lng,")
+    assert response.text.rstrip().endswith(",".join(METAL_ORDER))
+    assert len(response.text.splitlines()) == 1
+
+    assert client.get("/api/v1/researcher/samples/table", params={"format": "xml"}).status_code == 400
+
+def test_columnar_upload():
+    pytest.importorskip("pyarrow")
+    email = "samples@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    # A fresh location per run; a rerun would otherwise find both rows already imported
+    offset = uuid.uuid4().int % 10**6 / 10**7
+    frame = pd.DataFrame({
+        "Latitude": [12.5 + offset, 12.6 + offset],
+        "Longitude": [76.1, 76.2],
+        "Date": pd.to_datetime(["2024-03-01", "2024-03-02"]),
+        "Location": ["Parquet A", "Parquet B"],
+        "Pb (ppb)": [15.0, 2.0],
+    })
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer, index=False)
+
+    files = {"file": ("lab.parquet", buffer.getvalue(), "application/octet-stream")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 202
+    assert response.json()["message"].startswith("PARQUET processed. 2 new samples")
+
+    files = {"file": ("lab.parquet", b"not parquet", "application/octet-stream")}
+    assert client.post("/api/v1/researcher/upload-csv", files=files, headers=headers).status_code == 400
+    files = {"file": ("lab.txt", b"x", "text/plain")}
+    assert client.post("/api/v1/researcher/upload-csv", files=files, headers=headers).status_code == 400
+
+def test_upload_leaves_the_event_loop_free(monkeypatch):
+    email = "samples@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    started, gate = threading.Event(), threading.Event()
+
+    def slow_ingest(*args, **kwargs):
+        started.set()
+        # Held until a request served meanwhile releases it; a blocked loop would leave it waiting
+        assert gate.wait(10)
+        return ingest_frame(*args, **kwargs)
+    monkeypatch.setattr(researchers, "ingest_frame", slow_ingest)
+    spooled_on = []
+    copy = ingestion._copy_to_temp
+    monkeypatch.setattr(ingestion, "_copy_to_temp", lambda *args: spooled_on.append(threading.current_thread()) or copy(*args))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            files = {"file": ("slow.csv", "Latitude,Longitude,Location,Pb (ppb)\n-41.5,172.8,Slow,3.0\n", "text/csv")}
+            upload = asyncio.create_task(http.post("/api/v1/researcher/upload-csv", files=files, headers=headers))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            light = await http.get("/api/v1/standards/")
+            gate.set()
+            return light, await upload
+
+    light, upload = asyncio.run(run())
+    assert light.status_code == 200
+    assert upload.status_code == 202 and upload.json()["status"] == "Success"
+    # The file is written to disk off the event loop's thread too
+    assert spooled_on and threading.main_thread() not in spooled_on
+
+def test_upload_refused_while_the_pool_is_full(monkeypatch):
+    email = "samples@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    monkeypatch.setattr(pools, "uploads", pools.BoundedPool("upload", 1, 0))
+    monkeypatch.setattr(pools.uploads, "running", 1)
+    files = {"file": ("busy.csv", "Latitude,Longitude,Pb (ppb)\n-41.6,172.9,3.0\n", "text/csv")}
+    response = client.post("/api/v1/researcher/upload-csv", files=files, headers=headers)
+    assert response.status_code == 503 and response.headers["Retry-After"]
+
+def test_upload_failing_midway_still_assesses_committed_chunks(monkeypatch):
+    email = "samples@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_ROWS", 2)
+    calls = []
+
+    def failing_ingest(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        return ingest_frame(*args, **kwargs)
+    monkeypatch.setattr(researchers, "ingest_frame", failing_ingest)
+
+    rows = "\n".join(f"{-42.1 - k * 0.01:.2f},173.5,Midway {k},4.0" for k in range(4))
+    files = {"file": ("midway.csv", "Latitude,Longitude,Location,Pb (ppb)\n" + rows + "\n", "text/csv")}
+    assert client.post("/api/v1/researcher/upload-csv", files=files, headers=headers).status_code == 500
+
+    db = SessionLocal()
+    try:
+        dataset = db.query(Dataset).filter(Dataset.filename == "midway.csv").order_by(Dataset.id.desc()).first()
+        assert dataset.upload_status == "failed"
+        job = db.query(Job).filter(Job.kind == "calculate_risk_batch", Job.payload["dataset_id"].as_integer() == dataset.id).one()
+        assert job.status == "queued"
+        drain()
+        samples = db.query(Sample).filter(Sample.dataset_id == dataset.id).all()
+        assert len(samples) == 2
+        assert db.query(RiskAssessment).filter(RiskAssessment.sample_id.in_([s.id for s in samples])).count() == 2
+    finally:
+        db.close()
+
+def test_bbox_and_near_match_a_full_scan():
+    create_samples(20)
+    everything = client.get("/api/v1/researcher/samples", params={"limit": 5000, "fields": "lat,lng"}).json()["items"]
+
+    box = (-100.0, -40.0, 60.0, 50.0)
+    page = client.get("/api/v1/researcher/samples", params={"bbox": ",".join(map(str, box)), "limit": 5000, "fields": "lat,lng"}).json()
+    expected = [s["id"] for s in everything if box[0] <= s["lng"] <= box[2] and box[1] <= s["lat"] <= box[3]]
+    assert [s["id"] for s in page["items"]] == expected
+
+    # A 2000 km circle around an existing sample contains at least that sample
+    center = everything[0]
+    params = {"near": f"{center['lat']},{center['lng']}", "radius_km": 2000, "fields": "lat,lng"}
+    ids = [s["id"] for s in client.get("/api/v1/researcher/samples", params=params).json()["items"]]
+    assert center["id"] in ids
+
+    assert client.get("/api/v1/researcher/samples", params={"bbox": "1,2,3"}).status_code == 400
+    assert client.get("/api/v1/researcher/samples", params={"near": "10,20"}).status_code == 400
+
+def test_natural_key_backfill_matches_ingested_keys():
+    db = SessionLocal()
+    try:
+        when = datetime(2019, 5, 17, 8, 30, 15, 250000)
+        rows = [(12.345678, 76.54321, "Old well"), (12.345678, 76.54321, "Old well"), (-0.5, 0.0, None)]
+        stored = [
+            Sample(lat=lat, lng=lng, location_name=name, timestamp=when, source_type=SourceType.GROUNDWATER)
+            for lat, lng, name in rows
+        ]
+        db.add_all(stored)
+        db.commit()
+        ids = [sample.id for sample in stored]
+
+        tasks.backfill_natural_key_task()
+        db.expire_all()
+        keys = [db.get(Sample, i).natural_key for i in ids]
+        # Same keys an upload of these rows computes, so re-uploading them is deduplicated
+        assert keys[0] == natural_key(12.345678, 76.54321, when, "Old well")
+        assert keys[2] == natural_key(-0.5, 0.0, when, None)
+        # A duplicate stored before deduplication keeps no key
+        assert keys[1] is None
+    finally:
+        db.query(Sample).filter(Sample.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        db.close()
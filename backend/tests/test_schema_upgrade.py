@@ -0,0 +1,105 @@
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, create_engine, inspect, text
+
+from app.db.base import Base
+from app.db.database import upgrade_schema
+
+# The original tables, as a database created before any of the added columns has them
+baseline = MetaData()
+Table(
+    "users", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("full_name", String),
+    Column("role", String, nullable=False),
+    Column("is_active", Boolean),
+)
+Table(
+    "datasets", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("uploader_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("filename", String, nullable=False),
+    Column("upload_status", String),
+    Column("created_at", DateTime),
+)
+Table(
+    "samples", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("dataset_id", Integer, ForeignKey("datasets.id")),
+    Column("lat", Float, nullable=False),
+    Column("lng", Float, nullable=False),
+    Column("location_name", String),
+    Column("state", String),
+    Column("district", String),
+    Column("timestamp", DateTime, nullable=False),
+    Column("source_type", String, nullable=False),
+    Column("standard_preference", String),
+    Column("background_reference", String),
+)
+Table(
+    "measurements", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sample_id", Integer, ForeignKey("samples.id"), nullable=False),
+    Column("metal", String, nullable=False),
+    Column("concentration", Float, nullable=False),
+)
+Table(
+    "risk_assessments", baseline,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sample_id", Integer, ForeignKey("samples.id"), nullable=False),
+    *[Column(name, Float) for name in ("hpi", "hei", "mi", "i_geo_max", "hazard_index", "cancer_risk")],
+    Column("risk_category", String),
+    Column("is_safe", Boolean),
+)
+
+def baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    baseline.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, hashed_password, role, is_active) VALUES (1, 'old@example.com', 'x', 'researcher', 1)"
+        ))
+        conn.execute(text("INSERT INTO datasets (id, uploader_id, filename) VALUES (1, 1, 'old.csv')"))
+        conn.execute(text(
+            "INSERT INTO samples (id, dataset_id, lat, lng, timestamp, source_type) VALUES (1, 1, 20.5, 78.9, :ts, 'GROUNDWATER')"
+        ), {"ts": datetime(2020, 1, 1)})
+        # Assessed twice, which the old per-sample task allowed
+        conn.execute(text("INSERT INTO risk_assessments (id, sample_id, hpi) VALUES (1, 1, 10.0), (2, 1, 20.0)"))
+    return engine
+
+def test_upgrade_adds_missing_columns_to_a_baseline_database(tmp_path):
+    engine = baseline_engine(tmp_path)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    # Idempotent: the next startup finds nothing to do
+    upgrade_schema(engine)
+
+    columns = {c["name"] for c in inspect(engine).get_columns("users")}
+    assert "token_generation" in columns
+    indexes = {i["name"]: i for i in inspect(engine).get_indexes("samples")}
+    assert indexes["ix_samples_natural_key"]["unique"]
+    assert indexes["ix_samples_geohash"]["column_names"] == ["geohash"]
+    assert "standards_version" in {c["name"] for c in inspect(engine).get_columns("risk_assessments")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT token_generation FROM users WHERE id = 1")).scalar() == 0
+        # Existing accounts are not admins
+        assert not conn.execute(text("SELECT is_admin FROM users WHERE id = 1")).scalar()
+        assert conn.execute(text("SELECT rows_processed FROM datasets WHERE id = 1")).scalar() == 0
+        # Batch writes upsert on sample_id, so only the latest assessment is kept
+        assert conn.execute(text("SELECT id, hpi FROM risk_assessments")).all() == [(2, 20.0)]
+
+def test_upgraded_baseline_matches_the_models(tmp_path):
+    engine = baseline_engine(tmp_path)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    inspector = inspect(engine)
+    # Every column and index a model declares on the original tables exists, so none is missing from ADDED_COLUMNS / ADDED_INDEXES
+    for name in baseline.tables:
+        table = Base.metadata.tables[name]
+        assert {c.name for c in table.columns} <= {c["name"] for c in inspector.get_columns(name)}, name
+        indexes = {i["name"]: i for i in inspector.get_indexes(name)}
+        for index in table.indexes:
+            assert index.name in indexes, index.name
+            assert bool(indexes[index.name]["unique"]) == bool(index.unique), index.name
@@ -0,0 +1,167 @@
+import random
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import SessionLocal, init_db
+from app.db.models.risk import RiskAssessment
+from app.db.models.user import UserRole
+from app.services import standards, tasks
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_admin_header, get_auth_header
+
+client = TestClient(app)
+
+def setup_module(module):
+    init_db()
+    db = SessionLocal()
+    standards.seed_standards(db)
+    standards.seed_exposure_profiles(db)
+    db.commit()
+    db.close()
+
+def create_sample(headers, metal, concentration, standard="BIS"):
+    payload = {
+        "standard_preference": standard,
+        "latitude": random.uniform(-80, 80),
+        "longitude": random.uniform(-170, 170),
+        "source_type": "Groundwater",
+        "measurements": [{"metal": metal, "concentration": concentration}]
+    }
+    response = client.post("/api/v1/researcher/samples", json=payload, headers=headers)
+    assert response.status_code == 202
+    return response.json()["sample_id"]
+
+def test_limit_change_recomputes_only_affected_samples():
+    admin = get_admin_header()
+    email = "standards@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    arsenic_id = create_sample(headers, "As", 0.02)
+    lead_id = create_sample(headers, "Pb", 0.02)
+    drain()
+
+    db = SessionLocal()
+    try:
+        before = {a.sample_id: (a.hpi, a.standards_version) for a in db.query(RiskAssessment).filter(RiskAssessment.sample_id.in_([arsenic_id, lead_id]))}
+
+        current = client.get("/api/v1/standards/").json()
+        arsenic = next(l for l in current["limits"] if l["standard"] == "BIS" and l["metal"] == "arsenic")
+        response = client.put("/api/v1/standards/BIS/As", json={"si": arsenic["si"] * 2, "note": "test"}, headers=admin)
+        assert response.status_code == 202
+        version = response.json()["version"]
+        assert version == current["version"] + 1
+        drain()
+
+        db.expire_all()
+        after = {a.sample_id: (a.hpi, a.standards_version) for a in db.query(RiskAssessment).filter(RiskAssessment.sample_id.in_([arsenic_id, lead_id]))}
+        assert after[arsenic_id][1] == version
+        assert abs(after[arsenic_id][0] - before[arsenic_id][0] / 2) < 1e-9
+        # Samples without arsenic are not touched
+        assert after[lead_id] == before[lead_id]
+    finally:
+        db.close()
+
+def test_samples_are_assessed_against_their_preferred_standard():
+    email = "standards@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    limits = client.get("/api/v1/standards/").json()["limits"]
+    who_limit = next(l["si"] for l in limits if l["standard"] == "WHO" and l["metal"] == "manganese")
+    who_id = create_sample(headers, "Mn", who_limit, standard="WHO")
+    bis_id = create_sample(headers, "Mn", who_limit, standard="BIS")
+    drain()
+
+    db = SessionLocal()
+    try:
+        hpi = dict(db.query(RiskAssessment.sample_id, RiskAssessment.hpi).filter(RiskAssessment.sample_id.in_([who_id, bis_id])))
+        assert abs(hpi[who_id] - 100.0) < 1e-9
+        assert hpi[bis_id] != hpi[who_id]
+    finally:
+        db.close()
+
+def test_update_rejects_unknown_metal_and_non_admins():
+    create_test_user("standards_citizen@example.com", UserRole.citizen)
+    create_test_user("standards@example.com", UserRole.researcher)
+
+    response = client.put("/api/v1/standards/BIS/Xx", json={"si": 1.0}, headers=get_admin_header())
+    assert response.status_code == 404
+
+    # Researchers publish data, not the regulatory limits everyone's samples are scored against
+    response = client.put("/api/v1/standards/BIS/As", json={"si": 1.0}, headers=get_auth_header("standards@example.com"))
+    assert response.status_code == 403
+    profile = {"name": "Researcher profile", "BW": 60, "IR": 2, "EF": 365, "ED": 30, "AT": 10950}
+    response = client.post("/api/v1/standards/exposure-profiles", json=profile, headers=get_auth_header("standards@example.com"))
+    assert response.status_code == 403
+
+    response = client.put("/api/v1/standards/BIS/As", json={"si": 1.0}, headers=get_auth_header("standards_citizen@example.com"))
+    assert response.status_code == 403
+
+def test_concurrent_updates_cannot_lose_a_change(monkeypatch):
+    admin = get_admin_header()
+    create_test_user("standards@example.com", UserRole.researcher)
+    headers = get_auth_header("standards@example.com")
+    base = client.get("/api/v1/standards/").json()["version"]
+
+    first = client.put("/api/v1/standards/BIS/Zn", json={"si": 4.5, "expected_version": base}, headers=admin)
+    assert first.status_code == 202
+    # Decided against the version the first update replaced
+    stale = client.put("/api/v1/standards/BIS/Cu", json={"si": 1.6, "expected_version": base}, headers=admin)
+    assert stale.status_code == 409
+
+    # A publisher that read the old version before the first one committed can't publish its copy
+    monkeypatch.setattr(standards, "current_version", lambda db: base)
+    raced = client.put("/api/v1/standards/BIS/Cu", json={"si": 1.6}, headers=admin)
+    assert raced.status_code == 409
+    monkeypatch.undo()
+
+    assert client.put("/api/v1/standards/BIS/Cu", json={"si": 1.6}, headers=admin).status_code == 202
+    limits = {(r["standard"], r["metal"]): r for r in client.get("/api/v1/standards/").json()["limits"]}
+    assert limits[("BIS", "zinc")]["si"] == 4.5 and limits[("BIS", "copper")]["si"] == 1.6
+
+def test_old_version_jobs_never_overwrite_newer_assessments():
+    admin = get_admin_header()
+    create_test_user("standards@example.com", UserRole.researcher)
+    headers = get_auth_header("standards@example.com")
+    sample_id = create_sample(headers, "Ni", 0.05)
+    drain()
+    db = SessionLocal()
+    try:
+        old = standards.load_standards(db)
+        assert client.put("/api/v1/standards/BIS/Ni", json={"si": 0.01}, headers=admin).status_code == 202
+        drain()
+        assessment = db.query(RiskAssessment).filter(RiskAssessment.sample_id == sample_id).one()
+        newer, hpi = assessment.standards_version, assessment.hpi
+        assert newer > old[0]
+
+        # A batch job that loaded the previous limits finishes after the recompute
+        assert tasks.assess_samples(db, [sample_id], old) == 0
+        row = {"sample_id": sample_id, **{col: getattr(assessment, col) for col in tasks.ASSESSMENT_COLUMNS}}
+        tasks._write_assessments(db, [{**row, "standards_version": old[0], "hpi": 1.0}])
+        db.commit()
+        db.refresh(assessment)
+        assert (assessment.standards_version, assessment.hpi) == (newer, hpi)
+    finally:
+        db.close()
+
+def test_custom_exposure_profile_is_backfilled():
+    admin = get_admin_header()
+    email = "standards@example.com"
+    create_test_user(email, UserRole.researcher)
+    headers = get_auth_header(email)
+
+    sample_id = create_sample(headers, "As", 0.02)
+    drain()
+    risks = {r["profile"]: r for r in client.get(f"/api/v1/researcher/samples/{sample_id}/exposure-risks").json()}
+    assert {"adult", "child"} <= set(risks)
+
+    # Same scenario as "adult" with double the ingestion rate: exactly twice the risk
+    name = f"heavy-drinker-{random.randint(0, 10**9)}"
+    profile = {"name": name, "BW": 70.0, "IR": 4.4, "EF": 350, "ED": 70, "AT": 25550}
+    response = client.post("/api/v1/standards/exposure-profiles", json=profile, headers=admin)
+    assert response.status_code == 202
+    assert client.post("/api/v1/standards/exposure-profiles", json=profile, headers=admin).status_code == 400
+    drain()
+
+    risks = {r["profile"]: r for r in client.get(f"/api/v1/researcher/samples/{sample_id}/exposure-risks").json()}
+    assert abs(risks[name]["hazard_index"] - 2 * risks["adult"]["hazard_index"]) < 1e-9 * risks["adult"]["hazard_index"]
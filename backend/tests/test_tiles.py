@@ -0,0 +1,110 @@
+import random
+import numpy as np
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import SessionLocal, init_db
+from app.db.models.tile import MapTile
+from app.db.models.user import UserRole
+from app.services import tiles
+from app.worker import drain
+from tests.test_auth_rbac import create_test_user, get_auth_header
+
+client = TestClient(app)
+
+def setup_module(module):
+    init_db()
+
+def tile_total(z, x, y, **params):
+    response = client.get(f"/api/v1/tiles/{z}/{x}/{y}", params=params)
+    assert response.status_code == 200
+    return sum(cluster["count"] for cluster in response.json()["clusters"])
+
+def add_sample(lat, lng):
+    email = "tiles@example.com"
+    create_test_user(email, UserRole.researcher)
+    payload = {
+        "latitude": lat,
+        "longitude": lng,
+        "source_type": "Groundwater",
+        "measurements": [{"metal": "As", "concentration": 0.5}]
+    }
+    response = client.post("/api/v1/researcher/samples", json=payload, headers=get_auth_header(email))
+    assert response.status_code == 202
+    drain()
+
+def test_tile_indices_match_tile_bounds():
+    rng = np.random.default_rng(0)
+    lat, lng = rng.uniform(-80, 80, 500), rng.uniform(-179, 179, 500)
+    for z in (0, 3, 9):
+        xs, ys = tiles.tile_indices(lat, lng, z)
+        for a, b, x, y in zip(lat, lng, xs, ys):
+            box = tiles.tile_bbox(z, int(x), int(y))
+            assert box.min_lat <= a <= box.max_lat and box.min_lng <= b <= box.max_lng
+
+def test_upload_invalidates_only_touched_tiles():
+    add_sample(19.07, 72.87)
+    # Mumbai and Sydney are in different zoom-1 tiles
+    x, y = tiles.tile_indices(np.array([19.07]), np.array([72.87]), 1)
+    mumbai = (1, int(x[0]), int(y[0]))
+    world = tile_total(0, 0, 0)
+    mumbai_count = tile_total(*mumbai)
+    sydney_before = client.get("/api/v1/tiles/1/1/1").content
+
+    add_sample(19.08, 72.88)
+    assert tile_total(0, 0, 0) == world + 1
+    assert tile_total(*mumbai) == mumbai_count + 1
+    assert client.get("/api/v1/tiles/1/1/1").content == sydney_before
+
+    # The new sample is hazardous, so its cluster is too
+    clusters = client.get(f"/api/v1/tiles/{mumbai[0]}/{mumbai[1]}/{mumbai[2]}", params={"risk_category": "Hazardous"}).json()["clusters"]
+    assert clusters and all(c["risk_category"] == "Hazardous" for c in clusters)
+
+    assert client.get("/api/v1/tiles/1/2/0").status_code == 404
+
+def test_import_invalidates_tiles_before_assessment():
+    email = "tiles@example.com"
+    create_test_user(email, UserRole.researcher)
+    drain()
+    before = tile_total(0, 0, 0)
+    files = {"file": ("tiles.csv", f"Latitude,Longitude,Location,As (ppb)\n{-12 - random.random():.6f},130.8,Darwin,1.0\n", "text/csv")}
+    assert client.post("/api/v1/researcher/upload-csv", files=files, headers=get_auth_header(email)).status_code == 202
+    # Counted as soon as it is imported, not only once its risk job has run
+    assert tile_total(0, 0, 0) == before + 1
+    drain()
+
+def test_tile_invalidated_while_computing_is_not_stored(monkeypatch):
+    add_sample(-33.86, 151.2)
+    x, y = tiles.tile_indices(np.array([-33.86]), np.array([151.2]), 2)
+    sydney = (2, int(x[0]), int(y[0]))
+    tile_total(*sydney)
+    compute_tile = tiles.compute_tile
+
+    def racing_compute(db, *args, **kwargs):
+        clusters = compute_tile(db, *args, **kwargs)
+        # A sample is assessed and its tiles invalidated after this tile was read
+        writer = SessionLocal()
+        try:
+            tiles.invalidate_points(writer, [-33.87], [151.21])
+            writer.commit()
+        finally:
+            writer.close()
+        return clusters
+
+    # Once for a cleared tile, once for a tile that was never cached
+    for never_cached in (False, True):
+        writer = SessionLocal()
+        tiles.invalidate_points(writer, [-33.87], [151.21])
+        if never_cached:
+            writer.query(MapTile).filter(MapTile.z == sydney[0], MapTile.x == sydney[1], MapTile.y == sydney[2]).delete()
+        writer.commit()
+        writer.close()
+        monkeypatch.setattr(tiles, "compute_tile", racing_compute)
+        tile_total(*sydney)
+        monkeypatch.setattr(tiles, "compute_tile", compute_tile)
+
+        db = SessionLocal()
+        try:
+            cached = db.get(MapTile, sydney)
+            assert cached is not None and cached.payload is None
+        finally:
+            db.close()
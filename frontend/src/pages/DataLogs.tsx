@@ -1,6 +1,8 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { Download, Filter, Upload, FileText, MapPin, Loader2, ShieldCheck } from 'lucide-react';
 import axios from 'axios';
+import { fetchAllSamples } from '../services/samples';
+import { subscribeEvents } from '../services/events';
 import './DataLogs.css';
 
 interface ApiSample {
@@ -22,14 +24,17 @@ const DataLogs: React.FC = () => {
     const [riskFilter, setRiskFilter] = useState('');
     const [samples, setSamples] = useState<ApiSample[]>([]);
     const [loading, setLoading] = useState(true);
+    const [uploadStatus, setUploadStatus] = useState('');
+
+    const authHeaders = (): Record<string, string> => {
+        const token = localStorage.getItem('token');
+        return token ? { Authorization: `Bearer ${token}` } : {};
+    };
 
     const fetchSamples = async () => {
         try {
-            const token = localStorage.getItem('token');
-            const response = await axios.get('http://localhost:8000/api/v1/researcher/samples', {
-                headers: token ? { Authorization: `Bearer ${token}` } : {}
-            });
-            setSamples(response.data);
+            const data = await fetchAllSamples<ApiSample>({}, authHeaders());
+            setSamples(data);
             setLoading(false);
         } catch (err) {
             console.error(err);
@@ -37,8 +42,35 @@ const DataLogs: React.FC = () => {
         }
     };
 
+    // Adds or replaces samples by id, keeping the list in id order
+    const mergeSamples = (incoming: ApiSample[]) => {
+        setSamples(prev => {
+            const byId = new Map(prev.map(s => [s.id, s]));
+            incoming.forEach(s => byId.set(s.id, s));
+            return Array.from(byId.values()).sort((a, b) => a.id - b.id);
+        });
+    };
+
     useEffect(() => {
         fetchSamples();
+        // Upload progress and finished risk calculations are pushed by the server;
+        // only the samples of a dataset that just finished are fetched
+        return subscribeEvents({
+            'dataset.progress': (p) => setUploadStatus(
+                p.status === 'processing' ? `${p.filename}: ${p.rows_processed} rows read...`
+                    : p.status === 'failed' ? `${p.filename}: upload failed`
+                    : `${p.filename}: ${p.samples ?? p.rows_processed} samples imported, calculating risk...`
+            ),
+            'risk.assessed': (p) => setUploadStatus(`Dataset #${p.dataset_id}: ${p.samples} more samples assessed`),
+            'risk.completed': async (p) => {
+                try {
+                    mergeSamples(await fetchAllSamples<ApiSample>({ dataset_id: String(p.dataset_id) }, authHeaders()));
+                    setUploadStatus(`Dataset #${p.dataset_id}: risk calculated for ${p.samples} samples`);
+                } catch (err) {
+                    console.error(err);
+                }
+            }
+        });
     }, []);
 
     // Generate unique options for dropdowns
@@ -76,7 +108,7 @@ const DataLogs: React.FC = () => {
         try {
             const token = localStorage.getItem('token');
             if (!token) {
-                 alert("Please login as a researcher to upload CSV files");
+                 alert("Please login as a researcher to upload data files");
                  return;
             }
             await axios.post('http://localhost:8000/api/v1/researcher/upload-csv', formData, {
@@ -85,10 +117,9 @@ const DataLogs: React.FC = () => {
                     'Authorization': `Bearer ${token}`
                 }
             });
-            alert('CSV Uploaded! Processing will complete in the background.');
-            setTimeout(fetchSamples, 3000); 
+            alert('File uploaded! Processing will complete in the background.');
         } catch(err) {
-            alert('Error uploading CSV. Make sure you are logged in as a Researcher.');
+            alert('Error uploading file. Make sure you are logged in as a Researcher.');
         }
     };
 
@@ -111,6 +142,7 @@ const DataLogs: React.FC = () => {
                 <div className="header-title">
                     <h3>Water Quality Logs</h3>
                     <p>Comprehensive record of all spatial heavy metal sampling data</p>
+                    {uploadStatus && <p style={{ color: 'var(--primary)', fontSize: '0.85rem' }}>{uploadStatus}</p>}
                 </div>
                 <div className="header-actions">
                     <div className="search-box glass" style={{ width: '180px' }}>
@@ -151,8 +183,8 @@ const DataLogs: React.FC = () => {
                     </div>
                     <label className="action-btn glass primary" style={{ cursor: 'pointer' }}>
                         <Upload size={18} />
-                        <span>Upload CSV</span>
-                        <input type="file" accept=".csv" style={{ display: 'none' }} onChange={handleFileUpload} />
+                        <span>Upload Data</span>
+                        <input type="file" accept=".csv,.parquet,.feather,.arrow,.ipc,.xlsx" style={{ display: 'none' }} onChange={handleFileUpload} />
                     </label>
                 </div>
             </div>
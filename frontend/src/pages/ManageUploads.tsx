@@ -7,6 +7,7 @@ interface Dataset {
     id: number;
     filename: string;
     upload_status: string;
+    rows_processed: number;
     created_at: string;
 }
 
@@ -89,6 +90,7 @@ const ManageUploads: React.FC = () => {
                                 <td>
                                     <span className={`badge ${ds.upload_status === 'completed' ? 'badge-risk-safe' : 'badge-risk-low'}`}>
                                         {ds.upload_status}
+                                        {ds.upload_status !== 'completed' && ` (${ds.rows_processed ?? 0} rows)`}
                                     </span>
                                 </td>
                                 <td>
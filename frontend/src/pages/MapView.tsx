@@ -1,70 +1,160 @@
-import React, { useState, useEffect, useMemo } from 'react';
-import { MapContainer, TileLayer, Marker, Popup } from 'react-leaflet';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
+import { MapContainer, TileLayer, CircleMarker, Popup, useMapEvents } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
-import axios from 'axios';
-import L from 'leaflet';
+import type { LatLngBounds } from 'leaflet';
+import { fetchRegions, fetchSample, fetchTile, visibleTiles } from '../services/tiles';
+import type { Cluster, Region } from '../services/tiles';
 import { Filter, MapPin, Loader2, ShieldCheck } from 'lucide-react';
 import './MapView.css';
 
+const getRiskColor = (risk: string) => {
+    switch (risk) {
+        case 'Hazardous': return '#ef4444';
+        case 'Moderately Polluted': return '#f59e0b';
+        case 'Safe': return '#10b981';
+        default: return '#6366f1';
+    }
+};
+
+// Details of a single sample are fetched when its popup opens
+const SamplePopup: React.FC<{ sampleId: number }> = ({ sampleId }) => {
+    const [sample, setSample] = useState<any>(null);
+
+    useEffect(() => {
+        fetchSample<any>(sampleId, 'location_name,state,district,measurements,risk')
+            .then(setSample)
+            .catch(err => console.error("Failed to fetch sample", err));
+    }, [sampleId]);
+
+    if (!sample) {
+        return <Loader2 className="animate-spin" size={20} />;
+    }
+
+    const riskLevel = sample.risk?.risk_category || 'Safe';
+    const hpiScore = sample.risk?.hpi || 0;
+    return (
+        <div className="map-popup" style={{ minWidth: '220px' }}>
+            <h4 style={{ margin: '0 0 8px 0', borderBottom: '1px solid #eee', paddingBottom: '4px', fontSize: '1rem' }}>{sample.location_name || 'Sampling Point'}</h4>
+            <div style={{ fontSize: '0.85rem' }}>
+                <p style={{ margin: '4px 0' }}>Region: <strong>{sample.district}, {sample.state}</strong></p>
+                <p style={{ margin: '4px 0' }}>Classification: <strong style={{ color: getRiskColor(riskLevel) }}>{riskLevel}</strong></p>
+                <p style={{ margin: '4px 0' }}>HPI Score: <strong>{hpiScore.toFixed(2)}</strong></p>
+
+                <div style={{ marginTop: '12px', background: 'rgba(255,255,255,0.05)', padding: '8px', borderRadius: '4px' }}>
+                    <div style={{ display: 'grid', gridTemplateColumns: '1fr 1fr', gap: '4px' }}>
+                        {sample.measurements.map((m: any, i: number) => (
+                            <div key={i} style={{ display: 'flex', justifyContent: 'space-between', padding: '2px 0' }}>
+                                <span style={{ fontWeight: '600' }}>{m.metal}:</span>
+                                <span>{m.concentration.toFixed(4)}</span>
+                            </div>
+                        ))}
+                    </div>
+                </div>
+            </div>
+        </div>
+    );
+};
+
+// Loads the server-side clustered tiles covering the viewport; each tile is fetched once per filter set
+const ClusterLayer: React.FC<{ params: Record<string, string>; onTotal: (total: number) => void }> = ({ params, onTotal }) => {
+    const [view, setView] = useState<{ bounds: LatLngBounds; zoom: number } | null>(null);
+    const [tiles, setTiles] = useState<Record<string, Cluster[]>>({});
+    const requested = useRef(new Set<string>());
+    const map = useMapEvents({
+        moveend: () => setView({ bounds: map.getBounds(), zoom: map.getZoom() })
+    });
+
+    const filterKey = JSON.stringify(params);
+    useEffect(() => {
+        requested.current = new Set();
+        setTiles({});
+        setView({ bounds: map.getBounds(), zoom: map.getZoom() });
+    }, [filterKey, map]);
+
+    const keys = useMemo(() => {
+        if (!view) return [];
+        const { bounds, zoom } = view;
+        return visibleTiles(bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast(), Math.round(zoom));
+    }, [view]);
+
+    useEffect(() => {
+        keys.filter(key => !requested.current.has(key)).forEach(key => {
+            requested.current.add(key);
+            fetchTile(key, params)
+                .then(clusters => setTiles(prev => ({ ...prev, [key]: clusters })))
+                .catch(err => {
+                    requested.current.delete(key);
+                    console.error("Failed to fetch map tile", err);
+                });
+        });
+    }, [keys, filterKey]);
+
+    const clusters = keys.flatMap(key => (tiles[key] || []).map((cluster, i) => ({ key: `${key}/${i}`, cluster })));
+    const total = clusters.reduce((sum, { cluster }) => sum + cluster.count, 0);
+    useEffect(() => onTotal(total), [total, onTotal]);
+
+    return (
+        <>
+            {clusters.map(({ key, cluster }) => (
+                <CircleMarker
+                    key={key}
+                    center={[cluster.lat, cluster.lng]}
+                    radius={cluster.count === 1 ? 7 : Math.min(8 + 4 * Math.log10(cluster.count), 24)}
+                    pathOptions={{ color: 'white', weight: 2, fillColor: getRiskColor(cluster.risk_category), fillOpacity: 0.85 }}
+                >
+                    <Popup>
+                        {cluster.sample_id !== null ? (
+                            <SamplePopup sampleId={cluster.sample_id} />
+                        ) : (
+                            <div className="map-popup" style={{ minWidth: '180px', fontSize: '0.85rem' }}>
+                                <h4 style={{ margin: '0 0 8px 0', fontSize: '1rem' }}>{cluster.count} sampling points</h4>
+                                <p style={{ margin: '4px 0' }}>Worst: <strong style={{ color: getRiskColor(cluster.risk_category) }}>{cluster.risk_category}</strong></p>
+                                <p style={{ margin: '4px 0' }}>Mean HPI: <strong>{cluster.mean_hpi !== null ? cluster.mean_hpi.toFixed(2) : 'N/A'}</strong></p>
+                                <p style={{ margin: '4px 0', color: 'var(--text-muted)' }}>Zoom in to see individual points.</p>
+                            </div>
+                        )}
+                    </Popup>
+                </CircleMarker>
+            ))}
+        </>
+    );
+};
+
 const MapView: React.FC = () => {
-    const [samples, setSamples] = useState<any[]>([]);
+    const [regions, setRegions] = useState<Region[]>([]);
     const [loading, setLoading] = useState(true);
+    const [total, setTotal] = useState(0);
     const [stateFilter, setStateFilter] = useState('');
     const [districtFilter, setDistrictFilter] = useState('');
     const [riskFilter, setRiskFilter] = useState('');
 
     useEffect(() => {
-        const fetchSamples = async () => {
-            try {
-                const response = await axios.get('http://localhost:8000/api/v1/researcher/samples');
-                setSamples(response.data);
-            } catch (err) {
-                console.error("Failed to fetch live samples", err);
-            } finally {
-                setLoading(false);
-            }
-        };
-        fetchSamples();
+        fetchRegions()
+            .then(setRegions)
+            .catch(err => console.error("Failed to fetch regions", err))
+            .finally(() => setLoading(false));
     }, []);
 
     // Generate unique options for dropdowns
     const { states, districts } = useMemo(() => {
-        const uniqueStates = Array.from(new Set(samples.map(s => s.state).filter(Boolean))) as string[];
-        const uniqueDistricts = Array.from(new Set(samples.filter(s => stateFilter === '' || s.state === stateFilter).map(s => s.district).filter(Boolean))) as string[];
-        return { 
-            states: uniqueStates.sort(), 
-            districts: uniqueDistricts.sort() 
+        const uniqueStates = Array.from(new Set(regions.map(r => r.state)));
+        const uniqueDistricts = Array.from(new Set(regions.filter(r => stateFilter === '' || r.state === stateFilter).map(r => r.district).filter(Boolean))) as string[];
+        return {
+            states: uniqueStates.sort(),
+            districts: uniqueDistricts.sort()
         };
-    }, [samples, stateFilter]);
+    }, [regions, stateFilter]);
 
-    const filteredSamples = samples.filter(sample => {
-        const matchesState = stateFilter === '' || sample.state === stateFilter;
-        const matchesDistrict = districtFilter === '' || sample.district === districtFilter;
-        const matchesRisk = riskFilter === '' || (sample.risk?.risk_category === riskFilter);
-        return matchesState && matchesDistrict && matchesRisk;
-    });
+    const params = useMemo(() => {
+        const p: Record<string, string> = {};
+        if (stateFilter) p.state = stateFilter;
+        if (districtFilter) p.district = districtFilter;
+        if (riskFilter) p.risk_category = riskFilter;
+        return p;
+    }, [stateFilter, districtFilter, riskFilter]);
 
     const center: [number, number] = [23.5937, 78.9629]; // Center of India
 
-    const getRiskColor = (risk: string) => {
-        switch (risk) {
-            case 'Hazardous': return '#ef4444';
-            case 'Moderately Polluted': return '#f59e0b';
-            case 'Safe': return '#10b981';
-            default: return '#6366f1';
-        }
-    };
-
-    const createCustomIcon = (risk: string) => {
-        const color = getRiskColor(risk);
-        return L.divIcon({
-            className: 'custom-div-icon',
-            html: `<div style="background-color: ${color}; width: 14px; height: 14px; border-radius: 50%; border: 2px solid white; box-shadow: 0 0 4px rgba(0,0,0,0.4);"></div>`,
-            iconSize: [14, 14],
-            iconAnchor: [7, 7]
-        });
-    };
-
     if (loading) {
         return (
             <div className="map-view-container" style={{ display: 'flex', justifyContent: 'center', alignItems: 'center', height: '60vh' }}>
@@ -78,14 +168,14 @@ const MapView: React.FC = () => {
             <div className="map-header glass" style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
                 <div className="header-left">
                     <h3>Spatial Analysis Map</h3>
-                    <p style={{ fontSize: '0.8rem', color: 'var(--text-muted)' }}>Found {filteredSamples.length} locations matching criteria</p>
+                    <p style={{ fontSize: '0.8rem', color: 'var(--text-muted)' }}>Found {total} locations in view matching criteria</p>
                 </div>
-                
+
                 <div className="map-filters" style={{ display: 'flex', gap: '1rem' }}>
                     <div className="search-box glass" style={{ width: '160px', padding: '0 0.5rem' }}>
                         <Filter size={14} style={{ opacity: 0.5 }} />
-                        <select 
-                            value={stateFilter} 
+                        <select
+                            value={stateFilter}
                             onChange={(e) => { setStateFilter(e.target.value); setDistrictFilter(''); }}
                             className="filter-select"
                             style={{ fontSize: '0.75rem' }}
@@ -96,8 +186,8 @@ const MapView: React.FC = () => {
                     </div>
                     <div className="search-box glass" style={{ width: '160px', padding: '0 0.5rem' }}>
                         <MapPin size={14} style={{ opacity: 0.5 }} />
-                        <select 
-                            value={districtFilter} 
+                        <select
+                            value={districtFilter}
                             onChange={(e) => setDistrictFilter(e.target.value)}
                             className="filter-select"
                             style={{ fontSize: '0.75rem' }}
@@ -109,8 +199,8 @@ const MapView: React.FC = () => {
                     </div>
                     <div className="search-box glass" style={{ width: '160px', padding: '0 0.5rem' }}>
                         <ShieldCheck size={14} style={{ opacity: 0.5 }} />
-                        <select 
-                            value={riskFilter} 
+                        <select
+                            value={riskFilter}
                             onChange={(e) => setRiskFilter(e.target.value)}
                             className="filter-select"
                             style={{ fontSize: '0.75rem' }}
@@ -136,45 +226,7 @@ const MapView: React.FC = () => {
                         attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
                         url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
                     />
-                    {filteredSamples.map(sample => {
-                        const lat = sample.lat;
-                        const lng = sample.lng;
-                        if (!lat || !lng) return null;
-                        
-                        const riskLevel = sample.risk?.risk_category || 'Safe';
-                        const hpiScore = sample.risk?.hpi || 0;
-                        const locName = sample.location_name || 'Sampling Point';
-
-                        return (
-                            <Marker 
-                                key={sample.id} 
-                                position={[lat, lng]} 
-                                icon={createCustomIcon(riskLevel)}
-                            >
-                                <Popup>
-                                    <div className="map-popup" style={{ minWidth: '220px' }}>
-                                        <h4 style={{ margin: '0 0 8px 0', borderBottom: '1px solid #eee', paddingBottom: '4px', fontSize: '1rem' }}>{locName}</h4>
-                                        <div style={{ fontSize: '0.85rem' }}>
-                                            <p style={{ margin: '4px 0' }}>Region: <strong>{sample.district}, {sample.state}</strong></p>
-                                            <p style={{ margin: '4px 0' }}>Classification: <strong style={{ color: getRiskColor(riskLevel) }}>{riskLevel}</strong></p>
-                                            <p style={{ margin: '4px 0' }}>HPI Score: <strong>{hpiScore.toFixed(2)}</strong></p>
-                                            
-                                            <div style={{ marginTop: '12px', background: 'rgba(255,255,255,0.05)', padding: '8px', borderRadius: '4px' }}>
-                                                <div style={{ display: 'grid', gridTemplateColumns: '1fr 1fr', gap: '4px' }}>
-                                                    {sample.measurements.map((m: any, i: number) => (
-                                                        <div key={i} style={{ display: 'flex', justifyContent: 'space-between', padding: '2px 0' }}>
-                                                            <span style={{ fontWeight: '600' }}>{m.metal}:</span>
-                                                            <span>{m.concentration.toFixed(4)}</span>
-                                                        </div>
-                                                    ))}
-                                                </div>
-                                            </div>
-                                        </div>
-                                    </div>
-                                </Popup>
-                            </Marker>
-                        );
-                    })}
+                    <ClusterLayer params={params} onTotal={setTotal} />
                 </MapContainer>
             </div>
         </div>
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { AlertCircle, ShieldAlert, CheckCircle, Info, MapPin, Loader2, ExternalLink } from 'lucide-react';
-import axios from 'axios';
+import { fetchAllSamples } from '../services/samples';
+import { subscribeEvents } from '../services/events';
 import './RiskAlerts.css';
 
 interface ApiSample {
@@ -19,8 +20,13 @@ const RiskAlerts: React.FC = () => {
     useEffect(() => {
         const fetchSamples = async () => {
             try {
-                const response = await axios.get('http://localhost:8000/api/v1/researcher/samples');
-                setSamples(response.data);
+                // Only the flagged samples are needed; filter on the server
+                const fields = 'location_name,state,district,measurements,risk';
+                const [hazardous, polluted] = await Promise.all([
+                    fetchAllSamples<ApiSample>({ fields, risk_category: 'Hazardous' }),
+                    fetchAllSamples<ApiSample>({ fields, risk_category: 'Moderately Polluted' })
+                ]);
+                setSamples([...hazardous, ...polluted]);
             } catch (err) {
                 console.error("Failed to fetch alerts", err);
             } finally {
@@ -28,6 +34,13 @@ const RiskAlerts: React.FC = () => {
             }
         };
         fetchSamples();
+        // Samples that turn Hazardous are pushed as they are assessed
+        return subscribeEvents({
+            'samples.hazardous': (p) => setSamples(prev => {
+                const fresh = new Set(p.samples.map(s => s.id));
+                return [...p.samples, ...prev.filter(s => !fresh.has(s.id))];
+            })
+        });
     }, []);
 
     const highRiskSamples = samples.filter(s => s.risk.risk_category === 'Hazardous');
@@ -0,0 +1,62 @@
+const EVENTS_URL = 'http://localhost:8000/api/v1/events/stream';
+
+export type EventKind = 'dataset.progress' | 'risk.assessed' | 'risk.completed' | 'samples.hazardous';
+
+export interface DatasetProgress {
+    dataset_id: number;
+    filename: string;
+    status: 'processing' | 'completed' | 'failed';
+    rows_processed: number;
+    samples?: number;
+}
+
+export interface RiskAssessed {
+    dataset_id: number;
+    samples: number;
+    hazardous: number;
+}
+
+export interface RiskCompleted {
+    dataset_id: number;
+    samples: number;
+}
+
+export interface HazardousSample {
+    id: number;
+    lat: number;
+    lng: number;
+    location_name: string;
+    state: string;
+    district: string;
+    dataset_id: number | null;
+    risk: { hpi: number; risk_category: string };
+    measurements: { metal: string; concentration: number }[];
+}
+
+export interface SamplesHazardous {
+    count: number;
+    samples: HazardousSample[];
+}
+
+interface Payloads {
+    'dataset.progress': DatasetProgress;
+    'risk.assessed': RiskAssessed;
+    'risk.completed': RiskCompleted;
+    'samples.hazardous': SamplesHazardous;
+}
+
+export type EventHandlers = { [K in EventKind]?: (payload: Payloads[K]) => void };
+
+// Opens the server's event stream for the given kinds (the caller's own uploads need a login).
+// EventSource reconnects by itself and the server resumes after the last event seen.
+// Returns a function that closes the stream.
+export function subscribeEvents(handlers: EventHandlers): () => void {
+    const params = new URLSearchParams({ kinds: Object.keys(handlers).join(',') });
+    const token = localStorage.getItem('token');
+    if (token) params.set('token', token);
+    const source = new EventSource(`${EVENTS_URL}?${params}`);
+    for (const [kind, handler] of Object.entries(handlers)) {
+        source.addEventListener(kind, (event) => (handler as (payload: unknown) => void)(JSON.parse((event as MessageEvent).data)));
+    }
+    return () => source.close();
+}
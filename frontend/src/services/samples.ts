@@ -0,0 +1,23 @@
+import axios from 'axios';
+
+const SAMPLES_URL = 'http://localhost:8000/api/v1/researcher/samples';
+
+interface SamplePage<T> {
+    items: T[];
+    next_cursor: number | null;
+}
+
+// Walks the keyset pages of /researcher/samples. `params` may hold fields, state, district, start, end, risk_category.
+export async function fetchAllSamples<T>(params: Record<string, string> = {}, headers: Record<string, string> = {}): Promise<T[]> {
+    const items: T[] = [];
+    let cursor: number | null = null;
+    do {
+        const response: { data: SamplePage<T> } = await axios.get(SAMPLES_URL, {
+            params: { limit: 5000, ...params, ...(cursor !== null ? { cursor } : {}) },
+            headers
+        });
+        items.push(...response.data.items);
+        cursor = response.data.next_cursor;
+    } while (cursor !== null);
+    return items;
+}
@@ -0,0 +1,59 @@
+import axios from 'axios';
+
+const API_URL = 'http://localhost:8000/api/v1';
+
+export interface Cluster {
+    lat: number;
+    lng: number;
+    count: number;
+    mean_hpi: number | null;
+    risk_category: string;
+    sample_id: number | null;
+}
+
+export interface Region {
+    state: string;
+    district: string | null;
+}
+
+// Slippy-map tile coordinates (same scheme as the OSM base layer)
+export function tileX(lng: number, z: number): number {
+    return Math.floor((lng + 180) / 360 * 2 ** z);
+}
+
+export function tileY(lat: number, z: number): number {
+    const rad = Math.max(Math.min(lat, 85.0511), -85.0511) * Math.PI / 180;
+    return Math.floor((1 - Math.log(Math.tan(rad) + 1 / Math.cos(rad)) / Math.PI) / 2 * 2 ** z);
+}
+
+// Keys ("z/x/y") of the tiles covering a viewport
+export function visibleTiles(south: number, west: number, north: number, east: number, z: number): string[] {
+    const max = 2 ** z - 1;
+    const clamp = (v: number) => Math.max(0, Math.min(max, v));
+    const keys: string[] = [];
+    for (let x = clamp(tileX(west, z)); x <= clamp(tileX(east, z)); x++) {
+        for (let y = clamp(tileY(north, z)); y <= clamp(tileY(south, z)); y++) {
+            keys.push(`${z}/${x}/${y}`);
+        }
+    }
+    return keys;
+}
+
+// `params` may hold state, district, risk_category
+export async function fetchTile(key: string, params: Record<string, string> = {}): Promise<Cluster[]> {
+    const response = await axios.get(`${API_URL}/tiles/${key}`, { params });
+    return response.data.clusters;
+}
+
+export async function fetchRegions(): Promise<Region[]> {
+    const response = await axios.get(`${API_URL}/researcher/regions`);
+    return response.data;
+}
+
+// Full record of one sample: the keyset cursor just before its id
+export async function fetchSample<T>(sampleId: number, fields: string): Promise<T | undefined> {
+    const response = await axios.get(`${API_URL}/researcher/samples`, {
+        params: { cursor: sampleId - 1, limit: 1, fields }
+    });
+    return response.data.items.find((item: any) => item.id === sampleId);
+}